@@ -1,8 +1,7 @@
 # adapters/vci_adapter.py
-import json
 import time
 import pandas as pd
-from core.redis_client import get_redis
+from core.redis_client import cache_get, cache_set, get_redis
 from core.logger import logger
 from crawler import get_historical_prices
 
@@ -26,22 +25,10 @@ def get_sparkline_data(ticker: str, memory_cache_get_fn, memory_cache_set_fn) ->
     ticker = ticker.upper()
     cache_key = f"sparkline_v2:{ticker}"
     
-    # 1. Try Memory Cache
+    # 1-2. Try Memory Cache -> Redis (cache_get đi qua codec layer và tự backfill L1)
     sparkline = memory_cache_get_fn(cache_key)
     if sparkline:
         return sparkline
-        
-    # 2. Try Redis Cache
-    if REDIS_AVAILABLE:
-        try:
-            cached = redis_client.get(cache_key)
-            if cached:
-                sparkline = json.loads(cached)
-                # Backfill memory cache
-                memory_cache_set_fn(cache_key, sparkline, 3600)
-                return sparkline
-        except Exception:
-            pass
 
     # 3. Fetch from External API (VCI)
     # Check for global backoff
@@ -65,10 +52,8 @@ def get_sparkline_data(ticker: str, memory_cache_get_fn, memory_cache_set_fn) ->
                     "v": float(h.get("volume", 0))
                 })
             
-            # Update Caches
-            memory_cache_set_fn(cache_key, sparkline, 3600)
-            if REDIS_AVAILABLE:
-                redis_client.setex(cache_key, 3600, json.dumps(sparkline))
+            # Update Caches (RAM + Redis)
+            memory_cache_set_fn(cache_key, sparkline, 3600, tags=[f"ticker:{ticker}"])
             
             return sparkline
     except BaseException:
@@ -146,21 +131,10 @@ def get_intraday_sparkline(
     ticker = ticker.upper()
     cache_key = f"intraday_spark_v5_{ticker}"
     
-    # 1. Try Memory Cache
+    # 1-2. Try Memory Cache -> Redis
     sparkline = memory_cache_get_fn(cache_key)
     if sparkline:
         return sparkline
-        
-    # 2. Try Redis Cache
-    if REDIS_AVAILABLE:
-        try:
-            cached = redis_client.get(cache_key)
-            if cached:
-                sparkline = json.loads(cached)
-                memory_cache_set_fn(cache_key, sparkline, 60) # 1m cache
-                return sparkline
-        except Exception:
-            pass
     
     # 2.5 Try Redis date-specific cache (for after-hours)
     if REDIS_AVAILABLE:
@@ -172,12 +146,11 @@ def get_intraday_sparkline(
                     continue
                 
                 date_key = f"intraday_{ticker}_{check_date.strftime('%Y%m%d')}"
-                cached_data = redis_client.get(date_key)
+                sparkline = cache_get(date_key)
                 
-                if cached_data:
-                    sparkline = json.loads(cached_data)
+                if sparkline:
                     print(f"   [{ticker}] ✓ Loaded {len(sparkline)} cached intraday points from {check_date}")
-                    memory_cache_set_fn(cache_key, sparkline, 3600)
+                    memory_cache_set_fn(cache_key, sparkline, 3600, tags=[f"ticker:{ticker}"])
                     return sparkline
         except Exception as cache_err:
             print(f"   [{ticker}] Date cache read failed: {cache_err}")
@@ -344,13 +317,12 @@ def get_intraday_sparkline(
                 })
             
             # Update Caches with extended TTL
-            memory_cache_set_fn(cache_key, sparkline, 3600)  # 1h in memory
+            memory_cache_set_fn(cache_key, sparkline, 3600, tags=[f"ticker:{ticker}"])  # 1h standard
             if REDIS_AVAILABLE:
                 # Save with date-specific key for long-term retrieval (24h)
                 from datetime import date as dt_date
                 date_key = f"intraday_{ticker}_{dt_date.today().strftime('%Y%m%d')}"
-                redis_client.setex(date_key, 86400, json.dumps(sparkline))  # 24h
-                redis_client.setex(cache_key, 3600, json.dumps(sparkline))  # 1h standard
+                cache_set(date_key, sparkline, 86400)  # 24h
                 print(f"   [{ticker}] ✓ Cached {len(sparkline)} intraday points")
             
             return sparkline
@@ -1,11 +1,25 @@
 # adapters/vnstock_adapter.py
-import json
+import pandas as pd
 from vnstock import Vnstock
-from core.redis_client import get_redis
+from core.redis_client import (
+    NEG_NO_DATA,
+    NEG_NO_FUNDAMENTALS,
+    NEG_UPSTREAM_ERROR,
+    cache_delete,
+    get_redis,
+    negative_cache_get,
+    negative_cache_set,
+)
 
 redis_client = get_redis()
 REDIS_AVAILABLE = redis_client is not None
 
+RATIOS_TTL_SEC = 604800           # 7 ngày
+FALLBACK_RATIOS_TTL_SEC = 86400   # tự tính từ BCTC + giá hiện tại -> làm mới hằng ngày
+
+def _empty_ratios() -> dict:
+    return {"pe": 0, "pb": 0, "market_cap": 0, "roe": 0, "roa": 0}
+
 def get_financial_ratios(ticker: str, memory_cache_get_fn, memory_cache_set_fn) -> dict:
     """
     Fetch financial ratios (PE, ROE, ROA, Market Cap) from vnstock.
@@ -14,26 +28,17 @@ def get_financial_ratios(ticker: str, memory_cache_get_fn, memory_cache_set_fn)
     ticker = ticker.upper()
     cache_key = f"ratios:{ticker}"
     
-    # 1. Try Memory Cache
-    cached_mem = memory_cache_get_fn(cache_key)
-    if cached_mem and cached_mem.get("market_cap", 0) < 1e17:
-        return cached_mem
-        
-    # 2. Try Redis Cache
-    if REDIS_AVAILABLE:
-        try:
-            cached_redis = redis_client.get(cache_key)
-            if cached_redis:
-                r_obj = json.loads(cached_redis)
-                if r_obj.get("market_cap", 0) < 1e17:
-                    # Backfill memory (7 days)
-                    memory_cache_set_fn(cache_key, r_obj, 604800)
-                    return r_obj
-                else:
-                    # Invalidate corrupted cache
-                    redis_client.delete(cache_key)
-        except Exception:
-            pass
+    # 1-2. Try Memory Cache -> Redis
+    cached = memory_cache_get_fn(cache_key)
+    if cached:
+        if cached.get("market_cap", 0) < 1e17:
+            return cached
+        # Invalidate corrupted cache
+        cache_delete(cache_key)
+
+    # 2.5 Negative cache: mã không có dữ liệu cơ bản (ETF, quỹ...) -> không gọi lại chuỗi upstream
+    if negative_cache_get(cache_key):
+        return _empty_ratios()
 
     # 3. Fetch from Vnstock
     try:
@@ -45,7 +50,7 @@ def get_financial_ratios(ticker: str, memory_cache_get_fn, memory_cache_set_fn)
             df_ratio = pd.DataFrame()
 
         if df_ratio is None or df_ratio.empty:
-            return _calculate_fallback_ratios(ticker, stock)
+            return _fallback_and_cache(ticker, cache_key, stock, memory_cache_set_fn)
 
         latest = df_ratio.iloc[0]
         pe = latest.get(('Chỉ tiêu định giá', 'P/E')) or latest.get('priceToEarning') or 0
@@ -74,9 +79,11 @@ def get_financial_ratios(ticker: str, memory_cache_get_fn, memory_cache_set_fn)
             # Try VCI Source before calculating fallback
             print(f"[ADAPTER] Main source empty for {ticker}, trying VCI...")
             vci_ratios = _fetch_ratios_vci(ticker)
-            if vci_ratios: return vci_ratios
+            if vci_ratios:
+                memory_cache_set_fn(cache_key, vci_ratios, RATIOS_TTL_SEC, tags=[f"ticker:{ticker}"])
+                return vci_ratios
             
-            return _calculate_fallback_ratios(ticker, stock)
+            return _fallback_and_cache(ticker, cache_key, stock, memory_cache_set_fn)
 
         r_obj = {
             "pe": float(pe),
@@ -87,9 +94,7 @@ def get_financial_ratios(ticker: str, memory_cache_get_fn, memory_cache_set_fn)
         }
         
         # Save to Caches (7 days = 604800s)
-        memory_cache_set_fn(cache_key, r_obj, 604800)
-        if REDIS_AVAILABLE:
-            redis_client.setex(cache_key, 604800, json.dumps(r_obj))
+        memory_cache_set_fn(cache_key, r_obj, RATIOS_TTL_SEC, tags=[f"ticker:{ticker}"])
             
         return r_obj
 
@@ -97,14 +102,28 @@ def get_financial_ratios(ticker: str, memory_cache_get_fn, memory_cache_set_fn)
         print(f"[ADAPTER] General error for {ticker}: {e}")
         # Last resort fallback
         try:
-            return _calculate_fallback_ratios(ticker, Vnstock().stock(symbol=ticker, source='VCI'))
+            return _fallback_and_cache(
+                ticker, cache_key, Vnstock().stock(symbol=ticker, source='VCI'), memory_cache_set_fn
+            )
         except:
             pass
         
-    return {"pe": 0, "pb": 0, "market_cap": 0, "roe": 0, "roa": 0}
+    return _empty_ratios()
+
+def _fallback_and_cache(ticker: str, cache_key: str, stock_obj, memory_cache_set_fn) -> dict:
+    """Chạy fallback; kết quả rỗng được ghi negative cache kèm reason, kết quả hợp lệ cache 1 ngày."""
+    ratios, reason = _calculate_fallback_ratios(ticker, stock_obj)
+    if reason:
+        negative_cache_set(cache_key, reason, tags=[f"ticker:{ticker}"])
+    else:
+        memory_cache_set_fn(cache_key, ratios, FALLBACK_RATIOS_TTL_SEC, tags=[f"ticker:{ticker}"])
+    return ratios
 
-def _calculate_fallback_ratios(ticker: str, stock_obj) -> dict:
-    """Fallback: Calculate ratios from raw Financial Reports."""
+def _calculate_fallback_ratios(ticker: str, stock_obj) -> tuple[dict, str | None]:
+    """
+    Fallback: Calculate ratios from raw Financial Reports.
+    Returns (ratios, reason): reason is None on success, otherwise a negative-cache reason code.
+    """
     try:
         # 1. Fetch Quarterly Data (4 quarters) with Safe Guards
         try:
@@ -112,10 +131,10 @@ def _calculate_fallback_ratios(ticker: str, stock_obj) -> dict:
             df_bs = stock_obj.finance.balance_sheet(period='quarterly', lang='vi')
         except BaseException as e:
              print(f"[ADAPTER] Fallback BCTC fetch error (Rate Limit?): {e}")
-             return {"pe": 0, "pb": 0, "market_cap": 0, "roe": 0, "roa": 0}
+             return _empty_ratios(), NEG_UPSTREAM_ERROR
         
-        if df_is.empty or df_bs.empty:
-            return {"pe": 0, "pb": 0, "market_cap": 0, "roe": 0, "roa": 0}
+        if df_is is None or df_bs is None or df_is.empty or df_bs.empty:
+            return _empty_ratios(), NEG_NO_FUNDAMENTALS
             
         # Get latest 4 quarters
         df_is = df_is.head(4)
@@ -172,17 +191,20 @@ def _calculate_fallback_ratios(ticker: str, stock_obj) -> dict:
         
         print(f"[ADAPTER] Fallback Calc for {ticker}: ROE={roe:.2f}%, ROA={roa:.2f}%, P/B={pb:.2f}")
         
-        return {
+        ratios = {
             "pe": float(pe),
             "pb": float(pb),
             "market_cap": float(market_cap),
             "roe": float(roe), # Already percentage
             "roa": float(roa)  # Already percentage
         }
+        if all(v == 0 for v in ratios.values()):
+            return ratios, NEG_NO_DATA
+        return ratios, None
         
     except Exception as e:
         print(f"[ADAPTER] Fallback failed for {ticker}: {e}")
-        return {"pe": 0, "pb": 0, "market_cap": 0, "roe": 0, "roa": 0}
+        return _empty_ratios(), NEG_UPSTREAM_ERROR
 
 def get_all_symbols():
     """Fetch all symbols by exchange (HSX, HNX, UPCOM)."""
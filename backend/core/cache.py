@@ -3,12 +3,23 @@ from __future__ import annotations
 
 import functools
 import json
-from typing import Any, Callable, Optional
+import math
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional, Union
 
-from core.redis_client import get_redis, safe_cache_delete
+from core import cache_metrics
+from core.redis_client import acquire_lock, get_redis, key_prefix, release_lock, safe_cache_delete
 
 
-from core.redis_client import cache_get as redis_cache_get, cache_set as redis_cache_set, cache_delete
+from core.redis_client import (
+    cache_get as redis_cache_get,
+    cache_set as redis_cache_set,
+    invalidate_tags,
+    l1_get,
+)
 
 
 def cache_get(r, key: str):
@@ -21,32 +32,142 @@ def cache_setex(r, key: str, ttl_sec: int, obj: Any):
     redis_cache_set(key, obj, ttl=ttl_sec)
 
 
+PORTFOLIO_TAG = "portfolio"
+# Dữ liệu tổng hợp từ historical_prices nhiều mã (vd chart growth); sync lịch sử invalidate tag này
+HISTORY_TAG = "history"
+
+
 def invalidate_dashboard_cache():
-    cache_delete(
-        "dashboard_performance",
-        "dashboard:portfolio",
-        "chart_growth_1m",
-        "chart_growth_3m",
-        "chart_growth_6m",
-        "chart_growth_1y",
-    )
+    """Mọi key gắn tag `portfolio` (dashboard, hiệu suất, chart growth...) sau khi có giao dịch."""
+    invalidate_tags(PORTFOLIO_TAG)
+
+
+# --- STAMPEDE PROTECTION ---
+# Giá trị được lưu dạng envelope {"__v": value, "__delta": thời gian tính (s), "__exp": hạn logic}.
+# Redis giữ thêm một khoảng grace sau __exp để người đến sau vẫn có giá trị cũ trong lúc 1 caller tính lại.
+CACHE_LOCK_WAIT_SEC = float(os.getenv("CACHE_LOCK_WAIT_SEC", "5"))
+CACHE_LOCK_TTL_SEC = int(os.getenv("CACHE_LOCK_TTL_SEC", "30"))
+CACHE_STALE_GRACE_SEC = int(os.getenv("CACHE_STALE_GRACE_SEC", "60"))
+XFETCH_BETA = float(os.getenv("XFETCH_BETA", "1.0"))
+
+# Lock theo key dạng striped: số lock cố định (key theo khoảng ngày/version không làm dict phình mãi);
+# 2 key trùng stripe chỉ phải tính lại lần lượt trong process. RLock: hàm cache gọi lồng hàm cache
+# khác trùng stripe trong cùng thread không tự chặn chính mình.
+CACHE_LOCK_STRIPES = int(os.getenv("CACHE_LOCK_STRIPES", "256"))
+_key_locks = tuple(threading.RLock() for _ in range(max(1, CACHE_LOCK_STRIPES)))
+
+
+def _local_lock(k: str) -> threading.RLock:
+    return _key_locks[hash(k) % len(_key_locks)]
+
+
+def _is_envelope(entry: Any) -> bool:
+    return isinstance(entry, dict) and "__v" in entry and "__exp" in entry
+
+
+def _unwrap(entry: Any) -> Any:
+    return entry["__v"] if _is_envelope(entry) else entry
+
+
+def _needs_refresh(entry: Any) -> bool:
+    """XFetch: tính lại sớm với xác suất tăng dần khi gần hết hạn, tỉ lệ với thời gian tính."""
+    if not _is_envelope(entry):
+        return False
+    delta = float(entry.get("__delta") or 0.0)
+    return time.time() - delta * XFETCH_BETA * math.log(random.random() or 1e-12) >= float(entry["__exp"])
 
 
-def cache(ttl: int = 300, key: Optional[str] = None, key_fn: Optional[Callable[..., str]] = None):
+def _wait_for_value(k: str) -> Any:
+    deadline = time.time() + CACHE_LOCK_WAIT_SEC
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = redis_cache_get(k)
+        if entry is not None:
+            return entry
+    return None
+
+
+def cache(
+    ttl: int = 300,
+    key: Optional[str] = None,
+    key_fn: Optional[Callable[..., str]] = None,
+    tags: Union[Iterable[str], Callable[..., Iterable[str]], None] = None,
+):
+    """`tags`: list tag cố định, hoặc hàm nhận cùng tham số với hàm được cache."""
     def decorator(fn: Callable[..., Any]):
+        def cache_key(*args, **kwargs) -> str:
+            return key or (key_fn(*args, **kwargs) if key_fn else fn.__name__)
+
+        def cache_tags(*args, **kwargs) -> list[str]:
+            if tags is None:
+                return []
+            return list(tags(*args, **kwargs) if callable(tags) else tags)
+
+        def compute_and_store(k: str, args, kwargs) -> Any:
+            started = time.time()
+            result = fn(*args, **kwargs)
+            cache_metrics.record_recompute(key_prefix(k), time.time() - started)
+            envelope = {"__v": result, "__delta": round(time.time() - started, 4), "__exp": time.time() + ttl}
+            # redis_cache_set now handles L1 RAM -> L2 Redis automatically
+            redis_cache_set(
+                k, envelope, ttl=ttl + min(ttl, CACHE_STALE_GRACE_SEC), tags=cache_tags(*args, **kwargs)
+            )
+            return result
+
+        def recompute(k: str, args, kwargs, previous: Any) -> Any:
+            """Chỉ 1 caller (trong process: lock theo stripe, giữa các worker: Redis lock) được tính lại."""
+            local = _local_lock(k)
+            if previous is not None:
+                # Stale-while-revalidate: ai không giành được lock thì trả giá trị cũ ngay
+                if not local.acquire(blocking=False):
+                    return _unwrap(previous)
+                held = True
+            else:
+                held = local.acquire(timeout=CACHE_LOCK_WAIT_SEC)
+            try:
+                if previous is None:
+                    # Thread khác có thể vừa tính xong trong lúc mình chờ lock
+                    entry = redis_cache_get(k)
+                    if entry is not None:
+                        return _unwrap(entry)
+
+                token = acquire_lock(k, CACHE_LOCK_TTL_SEC * 1000)
+                if token is None and get_redis() is not None:
+                    # Worker khác đang tính
+                    if previous is not None:
+                        return _unwrap(previous)
+                    entry = _wait_for_value(k)
+                    if entry is not None:
+                        return _unwrap(entry)
+                try:
+                    return compute_and_store(k, args, kwargs)
+                finally:
+                    release_lock(k, token)
+            finally:
+                if held:
+                    local.release()
+
         @functools.wraps(fn)
         def wrapper(*args, **kwargs):
-            k = key or (key_fn(*args, **kwargs) if key_fn else fn.__name__)
+            k = cache_key(*args, **kwargs)
             # redis_cache_get now handles L1 RAM -> L2 Redis automatically
             cached = redis_cache_get(k)
-            if cached is not None:
-                return cached
+            if cached is not None and not _needs_refresh(cached):
+                return _unwrap(cached)
+            return recompute(k, args, kwargs, cached)
 
-            result = fn(*args, **kwargs)
-            # redis_cache_set now handles L1 RAM -> L2 Redis automatically
-            redis_cache_set(k, result, ttl=ttl)
-            return result
+        def peek(*args, **kwargs):
+            k = cache_key(*args, **kwargs)
+            cached = l1_get(k)
+            # Quá __exp (đang trong grace) -> None để caller đi qua wrapper, nơi có stampede lock và refresh
+            if cached is None or (_is_envelope(cached) and time.time() >= float(cached["__exp"])):
+                return None
+            cache_metrics.record_l1_hit(key_prefix(k))
+            return _unwrap(cached)
 
+        # Async handlers: serve L1 hits on the event loop without borrowing a threadpool slot
+        wrapper.cache_key = cache_key
+        wrapper.peek = peek
         return wrapper
 
     return decorator
@@ -0,0 +1,107 @@
+# core/cache_metrics.py
+"""
+Per-process cache counters grouped by key prefix (see redis_client.key_prefix).
+Each uvicorn worker keeps its own numbers; /admin/cache-stats reports the worker that served it.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import defaultdict
+from typing import Any
+
+_lock = threading.Lock()
+_started_at = time.time()
+
+
+def _new_bucket() -> dict[str, float]:
+    return {
+        "l1_hits": 0,
+        "l2_hits": 0,
+        "misses": 0,
+        "l2_errors": 0,
+        "l2_reads": 0,
+        "l2_latency_ms_total": 0.0,
+        "l2_latency_ms_max": 0.0,
+        "bytes_read": 0,
+        "bytes_written": 0,
+        "writes": 0,
+        "payload_max": 0,
+        "recomputes": 0,
+        "recompute_sec_total": 0.0,
+        "recompute_sec_max": 0.0,
+    }
+
+
+_buckets: dict[str, dict[str, float]] = defaultdict(_new_bucket)
+
+
+def record_l1_hit(prefix: str) -> None:
+    with _lock:
+        _buckets[prefix]["l1_hits"] += 1
+
+
+def record_l2(prefix: str, latency_ms: float, hits: int = 0, size: int = 0, max_size: int = 0) -> None:
+    """One Redis round trip for `prefix` (an MGET counts once per prefix it touched)."""
+    with _lock:
+        b = _buckets[prefix]
+        b["l2_reads"] += 1
+        b["l2_latency_ms_total"] += latency_ms
+        b["l2_latency_ms_max"] = max(b["l2_latency_ms_max"], latency_ms)
+        b["l2_hits"] += hits
+        b["bytes_read"] += size
+        b["payload_max"] = max(b["payload_max"], max_size or size)
+
+
+def record_miss(prefix: str, count: int = 1) -> None:
+    with _lock:
+        _buckets[prefix]["misses"] += count
+
+
+def record_l2_error(prefix: str) -> None:
+    with _lock:
+        _buckets[prefix]["l2_errors"] += 1
+
+
+def record_write(prefix: str, size: int) -> None:
+    with _lock:
+        b = _buckets[prefix]
+        b["writes"] += 1
+        b["bytes_written"] += size
+        b["payload_max"] = max(b["payload_max"], size)
+
+
+def record_recompute(prefix: str, seconds: float) -> None:
+    with _lock:
+        b = _buckets[prefix]
+        b["recomputes"] += 1
+        b["recompute_sec_total"] += seconds
+        b["recompute_sec_max"] = max(b["recompute_sec_max"], seconds)
+
+
+def snapshot() -> dict[str, Any]:
+    """Raw counters plus derived ratios/averages per prefix."""
+    with _lock:
+        buckets = {p: dict(b) for p, b in _buckets.items()}
+
+    out: dict[str, Any] = {}
+    for prefix, b in sorted(buckets.items()):
+        lookups = b["l1_hits"] + b["l2_hits"] + b["misses"]
+        hits = b["l1_hits"] + b["l2_hits"]
+        out[prefix] = {
+            **b,
+            "lookups": lookups,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "l1_hit_ratio": round(b["l1_hits"] / lookups, 4) if lookups else None,
+            "l2_latency_ms_avg": round(b["l2_latency_ms_total"] / b["l2_reads"], 3) if b["l2_reads"] else None,
+            "recompute_sec_avg": round(b["recompute_sec_total"] / b["recomputes"], 4) if b["recomputes"] else None,
+            "avg_write_bytes": round(b["bytes_written"] / b["writes"]) if b["writes"] else None,
+        }
+    return {"since": _started_at, "uptime_sec": round(time.time() - _started_at, 1), "prefixes": out}
+
+
+def reset() -> None:
+    global _started_at
+    with _lock:
+        _buckets.clear()
+        _started_at = time.time()
@@ -76,6 +76,10 @@ class DataEngine:
                 cls.set_setting(db, "last_sync_date", today.strftime("%Y-%m-%d"))
                 logger.info(f"--- [DataEngine] Startup sync completed up to {today}")
 
+        # Self-healing cho NAV: dựng lại các snapshot còn thiếu từ sổ giao dịch
+        from tasks.daily_nav_snapshot import backfill_missing_nav_snapshots
+        backfill_missing_nav_snapshots()
+
     @classmethod
     def sync_historical_data(cls, start_date: date, end_date: date):
         """
@@ -91,7 +95,7 @@ class DataEngine:
             wl_tickers = [w[0] for w in watchlist_tickers]
             
             # 3. Add indices (Core indices)
-            indices = ["VNINDEX", "HNX30"]
+            indices = ["VNINDEX", "VN30", "HNX30"]
             
             all_symbols = list(set(portfolio_tickers + wl_tickers + indices))
             
@@ -242,14 +246,19 @@ class DataEngine:
                     existing.volume = vol
                     existing.value = val
         
+        db.flush()
+        from services.market.latest_quotes import refresh_latest_quotes
+        from services.market.cache import invalidate_history
+        refresh_latest_quotes(db, [symbol])
         db.commit()
+        invalidate_history(symbol)
 
     @classmethod
     def end_of_day_sync(cls):
         """
         Scheduled chốt sổ at 15:05 daily.
         1. Sync history for today (to get final close prices).
-        2. Calculate and save NAV snapshot.
+        2. Calculate and save NAV snapshot (and backfill any missed days).
         """
         today = date.today()
         logger.info(f"--- [DataEngine] Running End-of-Day chot so for {today}")
@@ -258,8 +267,9 @@ class DataEngine:
         cls.sync_historical_data(today, today)
         
         # 2. Save NAV snapshot
-        from tasks.daily_nav_snapshot import save_daily_nav_snapshot
+        from tasks.daily_nav_snapshot import backfill_missing_nav_snapshots, save_daily_nav_snapshot
         save_daily_nav_snapshot()
+        backfill_missing_nav_snapshots()
         
         # 3. Update last sync date
         with SessionLocal() as db:
@@ -2,11 +2,19 @@
 from __future__ import annotations
 
 import os
+import time
 from dotenv import load_dotenv
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from typing import Any, Callable, TypeVar
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 from sqlalchemy.pool import NullPool
+from starlette.concurrency import run_in_threadpool
+
+T = TypeVar("T")
 
 # load .env ở backend/
 load_dotenv(".env", override=True)
@@ -15,29 +23,181 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is missing. Check backend/.env")
 
+# Read replica cho các truy vấn phân tích (chart, NAV history, TITAN...). Không set -> dùng primary.
+# Test local: trỏ 2 instance Postgres, hoặc đặt DATABASE_REPLICA_URL = DATABASE_URL (cùng DSN, 2 engine).
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+# Sau khi ghi (vd vừa khớp lệnh), đọc từ primary trong N giây để tránh replica lag
+READ_YOUR_WRITES_SEC = float(os.getenv("READ_YOUR_WRITES_SEC", "5"))
+READ_PRIMARY_HEADER = "X-Read-Primary"
+
 # SQLAlchemy base + session
 Base = declarative_base()
 
-# CRITICAL FIX: Force dùng driver psycopg (v3) chuẩn tắc
-# Điều này giúp SQLAlchemy nhận diện đúng dialect và áp dụng các arg như prepare_threshold
-if "://" in DATABASE_URL:
-    scheme, rest = DATABASE_URL.split("://", 1)
-    if scheme in ["postgres", "postgresql", "postgresql+psycopg2"]:
-        DATABASE_URL = f"postgresql+psycopg://{rest}"
-
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=False, 
-    poolclass=NullPool,
-    connect_args={
-        "prepare_threshold": None 
-    },
-)
+
+def _normalize_url(url: str) -> str:
+    # CRITICAL FIX: Force dùng driver psycopg (v3) chuẩn tắc
+    # Điều này giúp SQLAlchemy nhận diện đúng dialect và áp dụng các arg như prepare_threshold
+    if "://" in url:
+        scheme, rest = url.split("://", 1)
+        if scheme in ["postgres", "postgresql", "postgresql+psycopg2"]:
+            return f"postgresql+psycopg://{rest}"
+    return url
+
+
+def _make_engine(url: str):
+    return create_engine(
+        url,
+        pool_pre_ping=False,
+        poolclass=NullPool,
+        connect_args={
+            "prepare_threshold": None
+        },
+    )
+
+
+def _make_async_engine(url: str):
+    # psycopg v3 tự chọn biến thể async với cùng URL
+    return create_async_engine(
+        url,
+        poolclass=NullPool,
+        connect_args={
+            "prepare_threshold": None
+        },
+    )
+
+
+DATABASE_URL = _normalize_url(DATABASE_URL)
+if DATABASE_REPLICA_URL:
+    DATABASE_REPLICA_URL = _normalize_url(DATABASE_REPLICA_URL)
+
+engine = _make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def get_db():
+replica_engine = _make_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+def get_db(request: Request = None):
     db = SessionLocal()
+    if request is not None and request.method not in _SAFE_METHODS:
+        db.info[USER_WRITE] = True
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# --- READ-YOUR-WRITES ---
+# Marker dùng chung giữa các worker (Redis, tự hết hạn sau READ_YOUR_WRITES_SEC): recompute cache
+# sau khi worker khác vừa ghi cũng phải đọc primary. Biến local chỉ là fallback khi Redis down.
+# Chỉ commit của request ghi (POST/PUT/DELETE qua get_db) mới bật marker; job nền (poller giá,
+# sync, self-heal) và phần ghi phụ của GET (vd lãi lazy ở /portfolio) không giữ cả cụm ở primary.
+READ_YOUR_WRITES_KEY = "rw:last_primary_write"
+USER_WRITE = "user_write"
+_SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+_last_primary_write: float = 0.0
+
+
+def _redis():
+    # Import muộn: core.redis_client đọc REDIS_URL lúc import, phải sau load_dotenv ở trên
+    from core.redis_client import get_redis
+    return get_redis()
+
+
+def mark_primary_write() -> None:
+    global _last_primary_write
+    _last_primary_write = time.time()
+    r = _redis()
+    if not r:
+        return
+    try:
+        r.set(READ_YOUR_WRITES_KEY, "1", px=max(1, int(READ_YOUR_WRITES_SEC * 1000)))
+    except Exception:
+        pass
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _flag_session_write(session: Session, flush_context) -> None:
+    session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _mark_commit(session: Session) -> None:
+    if session.info.pop("wrote", False) and session.info.get(USER_WRITE):
+        mark_primary_write()
+
+
+def _recent_primary_write() -> bool:
+    if time.time() - _last_primary_write < READ_YOUR_WRITES_SEC:
+        return True
+    r = _redis()
+    if not r:
+        return False
+    try:
+        return bool(r.exists(READ_YOUR_WRITES_KEY))
+    except Exception:
+        return False
+
+
+def _read_from_primary() -> bool:
+    if replica_engine is engine:
+        return True
+    return _recent_primary_write()
+
+
+def get_read_session(force_primary: bool = False) -> Session:
+    """Session cho truy vấn chỉ đọc: replica, trừ khi vừa ghi hoặc bị ép về primary."""
+    return SessionLocal() if (force_primary or _read_from_primary()) else ReadSessionLocal()
+
+
+def get_read_db(request: Request):
+    """
+    Dependency cho endpoint chỉ đọc. Client vừa ghi (vd sau /buy) có thể gửi header
+    `X-Read-Primary: 1` để đọc thẳng primary kể cả khi request rơi vào worker khác.
+    """
+    db = get_read_session(force_primary=bool(request.headers.get(READ_PRIMARY_HEADER)))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Async engine cho các endpoint đọc nhiều
+async_engine = _make_async_engine(DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+async_replica_engine = _make_async_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else async_engine
+AsyncReadSessionLocal = async_sessionmaker(bind=async_replica_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db(request: Request):
+    force = bool(request.headers.get(READ_PRIMARY_HEADER))
+    factory = AsyncSessionLocal if (force or _read_from_primary()) else AsyncReadSessionLocal
+    async with factory() as db:
+        yield db
+
+
+async def run_with_session(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Runs a sync service `fn(db, *args, **kwargs)` on the threadpool with its own Session,
+    so async handlers can reuse the existing sync service layer without blocking the loop.
+    """
+    def _call() -> T:
+        with SessionLocal() as db:
+            return fn(db, *args, **kwargs)
+
+    return await run_in_threadpool(_call)
+
+
+async def run_with_read_session(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Same as run_with_session, but the Session is routed to the read replica."""
+    def _call() -> T:
+        with get_read_session() as db:
+            return fn(db, *args, **kwargs)
+
+    return await run_in_threadpool(_call)
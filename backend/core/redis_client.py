@@ -2,24 +2,51 @@
 from __future__ import annotations
 
 import os
+import re
+import socket
+import struct
+import sys
 import time
 import json
-from typing import Any, Optional
+import threading
+import uuid
+import zlib
+from collections import OrderedDict, defaultdict
+from typing import Any, Iterable, Mapping, Optional
 import redis
 from rq import Queue
 
+from core import cache_metrics
+
+try:
+    import orjson
+except ImportError:  # optional: fallback về json chuẩn
+    orjson = None
+
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
 _redis: Optional[redis.Redis] = None
+_redis_raw: Optional[redis.Redis] = None  # bytes client cho payload đã encode (codec layer)
 _queue: Optional[Queue] = None
 
 _last_check_ts: float = 0.0
 _retry_every_sec: int = 5  # redis down thì 5s thử lại
 
+# Kênh pub/sub để mọi worker cùng bỏ bản L1 khi 1 worker invalidate key/tag
+INVALIDATION_CHANNEL = "cache:invalidate"
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_listener_enabled = False
+_listener_thread: Optional[threading.Thread] = None
+
 
 def init_redis():
-    """Backward-compatible: giữ tên cũ cho main.py."""
-    return get_redis()
+    """Backward-compatible: giữ tên cũ cho main.py. Web process bật thêm listener invalidation."""
+    global _listener_enabled
+    _listener_enabled = True
+    r = get_redis()
+    if r:
+        _start_invalidation_listener()
+    return r
 
 
 def get_redis() -> Optional[redis.Redis]:
@@ -27,7 +54,7 @@ def get_redis() -> Optional[redis.Redis]:
     Trả về redis client nếu kết nối được, None nếu không.
     Có retry theo thời gian để redis bật lại thì app tự reconnect (không cần restart).
     """
-    global _redis, _queue, _last_check_ts
+    global _redis, _redis_raw, _queue, _last_check_ts
 
     now = time.time()
 
@@ -47,16 +74,25 @@ def get_redis() -> Optional[redis.Redis]:
         r = redis.from_url(REDIS_URL, decode_responses=True)
         r.ping()
         _redis = r
+        _redis_raw = redis.from_url(REDIS_URL, decode_responses=False)
         _queue = Queue(connection=r)
         print("✅ Redis kết nối thành công")
+        if _listener_enabled:
+            _start_invalidation_listener()
         return _redis
     except Exception as e:
         _redis = None
+        _redis_raw = None
         _queue = None
         print(f"[REDIS] ⚠️ Không kết nối được, chạy không cache: {e}")
         return None
 
 
+def get_redis_raw() -> Optional[redis.Redis]:
+    """Client trả bytes (không decode) - dùng cho giá trị cache đã qua codec."""
+    return _redis_raw if get_redis() else None
+
+
 def get_queue() -> Optional[Queue]:
     get_redis()
     return _queue
@@ -73,6 +109,7 @@ def safe_cache_delete(*keys: str) -> None:
 
 
 def safe_flushall() -> None:
+    _MEMORY_CACHE.clear()
     r = get_redis()
     if not r:
         return
@@ -80,60 +117,788 @@ def safe_flushall() -> None:
         r.flushdb()
     except Exception:
         pass
+    publish_invalidation(flush=True)
+
+
+# --- CROSS-WORKER L1 INVALIDATION ---
+def publish_invalidation(keys: Iterable[str] = (), tags: Iterable[str] = (), flush: bool = False) -> None:
+    r = get_redis()
+    if not r:
+        return
+    msg = {"origin": WORKER_ID, "keys": list(keys), "tags": list(tags), "flush": flush}
+    if not (msg["keys"] or msg["tags"] or flush):
+        return
+    try:
+        r.publish(INVALIDATION_CHANNEL, json.dumps(msg))
+    except Exception:
+        pass
+
+
+def _apply_invalidation(raw: str) -> None:
+    try:
+        msg = json.loads(raw)
+    except Exception:
+        return
+    if msg.get("origin") == WORKER_ID:
+        return
+    if msg.get("flush"):
+        _MEMORY_CACHE.clear()
+        return
+    for k in msg.get("keys") or []:
+        _MEMORY_CACHE.delete(k)
+    for tag in msg.get("tags") or []:
+        for k in _pop_local_tag(tag):
+            _MEMORY_CACHE.delete(k)
+
+
+def _invalidation_loop() -> None:
+    subscribed_before = False
+    while True:
+        r = get_redis()
+        if not r:
+            time.sleep(_retry_every_sec)
+            continue
+        pubsub = None
+        try:
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Có thể đã lỡ message trong lúc mất kết nối -> bỏ toàn bộ L1 cho chắc
+            # (lần subscribe đầu tiên thì không: giữ lại L1 vừa khôi phục từ snapshot)
+            if subscribed_before:
+                _MEMORY_CACHE.clear()
+            subscribed_before = True
+            for message in pubsub.listen():
+                if message.get("type") == "message":
+                    _apply_invalidation(message.get("data"))
+        except Exception as e:
+            print(f"[REDIS] ⚠️ Mất kết nối kênh invalidation, thử lại: {e}")
+            time.sleep(_retry_every_sec)
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+
+def _start_invalidation_listener() -> None:
+    global _listener_thread
+    if _listener_thread is not None:
+        return
+    _listener_thread = threading.Thread(target=_invalidation_loop, name="cache-invalidation", daemon=True)
+    _listener_thread.start()
+
+# --- DISTRIBUTED LOCK (SET NX PX + token) ---
+_RELEASE_LOCK_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def acquire_lock(name: str, ttl_ms: int = 30000) -> Optional[str]:
+    """Trả về token nếu giành được lock `lock:{name}`, None nếu đang bị giữ hoặc Redis down."""
+    r = get_redis()
+    if not r:
+        return None
+    token = uuid.uuid4().hex
+    try:
+        if r.set(f"lock:{name}", token, nx=True, px=ttl_ms):
+            return token
+    except Exception:
+        pass
+    return None
+
+
+def release_lock(name: str, token: Optional[str]) -> None:
+    """Chỉ xóa lock nếu token còn khớp (không xóa nhầm lock của worker khác sau khi hết hạn)."""
+    r = get_redis()
+    if not r or not token:
+        return
+    try:
+        r.eval(_RELEASE_LOCK_LUA, 1, f"lock:{name}", token)
+    except Exception:
+        pass
+
+# --- CODEC LAYER (L2 payload) ---
+# Header: MAGIC | version | codec id | expires_at (uint32 epoch), rồi tới body.
+# Giá trị cũ (JSON thuần, không header) vẫn đọc được; 0xFE không thể mở đầu một chuỗi JSON UTF-8.
+_CODEC_MAGIC = 0xFE
+_CODEC_VERSION = 1
+_CODEC_HEADER = struct.Struct(">BBBI")
+
+CODEC_JSON = 1
+CODEC_JSON_ZLIB = 2
+
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "1024"))
+CACHE_COMPRESS_LEVEL = int(os.getenv("CACHE_COMPRESS_LEVEL", "6"))
+
+# Chính sách theo prefix key (xem key_prefix): "json" = không nén, "zlib" = luôn nén,
+# "auto" (mặc định) = nén khi payload vượt CACHE_COMPRESS_MIN_BYTES.
+CODEC_BY_PREFIX: dict[str, str] = {
+    "sparkline_v2": "zlib",
+    "intraday_spark_v5": "zlib",
+    "intraday": "zlib",
+    "wl_detail_v1": "zlib",
+    "stock_prices": "zlib",
+    "trending": "json",
+    "sec_meta_v1": "json",
+}
+
+
+def register_codec(prefix: str, policy: str) -> None:
+    if policy not in ("json", "zlib", "auto"):
+        raise ValueError(f"Unknown cache codec policy: {policy}")
+    CODEC_BY_PREFIX[prefix] = policy
+
+
+def _json_default(o: Any) -> Any:
+    # numpy scalar/array -> kiểu Python; còn lại giữ hành vi cũ (default=str)
+    if hasattr(o, "item") and hasattr(o, "dtype"):
+        return o.tolist() if getattr(o, "ndim", 0) else o.item()
+    return str(o)
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                value,
+                default=_json_default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except (TypeError, orjson.JSONEncodeError):
+            pass
+    return json.dumps(value, default=_json_default, separators=(",", ":")).encode()
+
+
+def _loads(body: bytes) -> Any:
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+def encode_value(key: str, value: Any, ttl: int) -> tuple[bytes, int]:
+    """Trả về (payload Redis, kích thước JSON chưa nén - dùng cho accounting L1)."""
+    body = _dumps(value)
+    raw_size = len(body)
+    policy = CODEC_BY_PREFIX.get(key_prefix(key), "auto")
+    codec = CODEC_JSON
+    if policy == "zlib" or (policy == "auto" and raw_size >= CACHE_COMPRESS_MIN_BYTES):
+        packed = zlib.compress(body, CACHE_COMPRESS_LEVEL)
+        if len(packed) < raw_size:
+            body, codec = packed, CODEC_JSON_ZLIB
+    header = _CODEC_HEADER.pack(_CODEC_MAGIC, _CODEC_VERSION, codec, int(time.time()) + max(int(ttl), 0))
+    return header + body, raw_size
+
+
+def decode_value(raw: bytes | str) -> tuple[Any, Optional[float]]:
+    """Trả về (giá trị, expires_at hoặc None với payload cũ)."""
+    if isinstance(raw, str):
+        return json.loads(raw), None
+    if not raw or raw[0] != _CODEC_MAGIC:
+        return _loads(raw), None
+    _, version, codec, expires_at = _CODEC_HEADER.unpack_from(raw)
+    if version != _CODEC_VERSION:
+        raise ValueError(f"Unsupported cache codec version {version}")
+    body = raw[_CODEC_HEADER.size:]
+    if codec == CODEC_JSON_ZLIB:
+        body = zlib.decompress(body)
+    elif codec != CODEC_JSON:
+        raise ValueError(f"Unknown cache codec id {codec}")
+    return _loads(body), float(expires_at)
+
 
 # --- LEVEL 1 CACHE (RAM) TO SAVE REDIS COMMANDS ---
-_MEMORY_CACHE: dict[str, tuple[Any, float]] = {}
+L1_MAX_BYTES = int(os.getenv("L1_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+L1_MAX_ENTRIES = int(os.getenv("L1_CACHE_MAX_ENTRIES", "20000"))
+L1_SWEEP_INTERVAL_SEC = int(os.getenv("L1_SWEEP_INTERVAL_SEC", "30"))
+L1_BACKFILL_TTL_SEC = int(os.getenv("L1_BACKFILL_TTL_SEC", "60"))
 
-def _mem_get(key: str) -> Optional[Any]:
-    if key in _MEMORY_CACHE:
-        val, exp = _MEMORY_CACHE[key]
-        if time.time() < exp:
+_VERSIONED_PREFIX = re.compile(r"^(.*?_v\d+)(?:[:_]|$)")
+_TRAILING_IDS = re.compile(r"(_[A-Z0-9]+)+$")
+
+
+def key_prefix(key: str) -> str:
+    """Gom key theo họ: 'sec_meta_v1:FPT' -> 'sec_meta_v1', 'intraday_spark_v5_FPT' -> 'intraday_spark_v5'."""
+    if ":" in key:
+        return key.split(":", 1)[0]
+    m = _VERSIONED_PREFIX.match(key)
+    if m:
+        return m.group(1)
+    return _TRAILING_IDS.sub("", key) or key
+
+
+def _approx_size(val: Any) -> int:
+    try:
+        return len(json.dumps(val, default=str))
+    except Exception:
+        return sys.getsizeof(val)
+
+
+class _LazyValue:
+    __slots__ = ("raw",)
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+
+
+class _L1Cache:
+    """
+    Thread-safe, size-bounded LRU with per-entry TTL.
+    Byte accounting is approximate (serialized JSON length). Expired entries are
+    dropped on read and by a background sweep; LRU entries are evicted when either
+    the byte or entry budget is exceeded.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[Any, float, int]] = OrderedDict()
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self._stats: dict[str, dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        )
+        self._sweeper: Optional[threading.Thread] = None
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _drop(self, key: str) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key: str) -> Optional[Any]:
+        prefix = key_prefix(key)
+        with self._lock:
+            # defaultdict insert phải nằm trong lock, nếu không stats() có thể lỗi khi đang duyệt
+            stats = self._stats[prefix]
+            entry = self._data.get(key)
+            if entry is None:
+                stats["misses"] += 1
+                return None
+            val, exp, size = entry
+            if time.time() >= exp:
+                self._drop(key)
+                stats["expired"] += 1
+                stats["misses"] += 1
+                return None
+            if isinstance(val, _LazyValue):
+                # Entry khôi phục từ snapshot: chỉ decode khi được đọc lần đầu
+                try:
+                    val = _loads(val.raw)
+                except Exception:
+                    self._drop(key)
+                    stats["misses"] += 1
+                    return None
+                self._data[key] = (val, exp, size)
+            self._data.move_to_end(key)
+            stats["hits"] += 1
             return val
-        del _MEMORY_CACHE[key]
-    return None
 
-def _mem_set(key: str, val: Any, ttl: int) -> None:
-    _MEMORY_CACHE[key] = (val, time.time() + ttl)
+    def set(self, key: str, val: Any, ttl: int, size: Optional[int] = None) -> None:
+        size = size if size is not None else _approx_size(val)
+        self._put(key, val, time.time() + ttl, size)
+
+    def restore(self, key: str, raw: bytes, expires_at: float) -> bool:
+        """Nạp entry từ snapshot (chưa decode); không ghi đè giá trị mới hơn đã có trong RAM."""
+        with self._lock:
+            if key in self._data:
+                return False
+        return self._put(key, _LazyValue(raw), expires_at, len(raw))
+
+    def snapshot_items(self, min_remaining: float) -> list[tuple[str, float, Any]]:
+        now = time.time()
+        with self._lock:
+            return [(k, exp, val) for k, (val, exp, _) in self._data.items() if exp - now >= min_remaining]
+
+    def _put(self, key: str, val: Any, expires_at: float, size: int) -> bool:
+        if size > self.max_bytes:
+            # Không vừa L1: bỏ luôn bản cũ của key, tránh đọc ra giá trị đã lỗi thời
+            self.delete(key)
+            return False
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (val, expires_at, size)
+            self._bytes += size
+            while self._data and (self._bytes > self.max_bytes or len(self._data) > self.max_entries):
+                old_key, (_, _, old_size) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self._stats[key_prefix(old_key)]["evictions"] += 1
+        self._ensure_sweeper()
+        return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+                return True
+            return False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def sweep(self) -> int:
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for key in [k for k, (_, exp, _) in self._data.items() if exp <= now]:
+                self._drop(key)
+                self._stats[key_prefix(key)]["expired"] += 1
+                removed += 1
+        return removed
+
+    def _ensure_sweeper(self) -> None:
+        if self._sweeper is not None or L1_SWEEP_INTERVAL_SEC <= 0:
+            return
+        with self._lock:
+            if self._sweeper is not None:
+                return
+
+            def _loop():
+                while True:
+                    time.sleep(L1_SWEEP_INTERVAL_SEC)
+                    try:
+                        self.sweep()
+                    except Exception:
+                        pass
+
+            self._sweeper = threading.Thread(target=_loop, name="l1-cache-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_prefix: dict[str, dict[str, int]] = {}
+            for key, (_, _, size) in self._data.items():
+                p = by_prefix.setdefault(key_prefix(key), {"entries": 0, "bytes": 0})
+                p["entries"] += 1
+                p["bytes"] += size
+            for prefix, counters in self._stats.items():
+                by_prefix.setdefault(prefix, {"entries": 0, "bytes": 0}).update(counters)
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "prefixes": by_prefix,
+            }
+
+
+_MEMORY_CACHE = _L1Cache(L1_MAX_BYTES, L1_MAX_ENTRIES)
+
+def _mem_get(key: str) -> Optional[Any]:
+    return _MEMORY_CACHE.get(key)
+
+def _mem_set(key: str, val: Any, ttl: int, size: Optional[int] = None) -> None:
+    _MEMORY_CACHE.set(key, val, ttl, size=size)
+
+def l1_get(key: str) -> Optional[Any]:
+    """Chỉ đọc L1 (RAM), không chạm Redis - an toàn để gọi trực tiếp trong event loop."""
+    return _mem_get(key)
+
+def l1_stats() -> dict:
+    """Số entry/bytes và hit/miss/eviction của L1 theo từng prefix key."""
+    return _MEMORY_CACHE.stats()
 
 def cache_get(key: str):
+    prefix = key_prefix(key)
     # 1. Check RAM first (L1)
     cached_mem = _mem_get(key)
     if cached_mem is not None:
+        cache_metrics.record_l1_hit(prefix)
         return cached_mem
 
     # 2. Check Redis (L2)
-    r = get_redis()
+    r = get_redis_raw()
     if not r:
+        cache_metrics.record_miss(prefix)
         return None
     try:
+        started = time.perf_counter()
         v = r.get(key)
+        latency_ms = (time.perf_counter() - started) * 1000
         if v:
-            data = json.loads(v)
-            # Store back in RAM for 60s to buffer frequent requests (Upstash command optimization)
-            _mem_set(key, data, 60)
+            cache_metrics.record_l2(prefix, latency_ms, hits=1, size=len(v))
+            data, expires_at = decode_value(v)
+            _backfill_l1(key, data, expires_at, len(v))
             return data
+        cache_metrics.record_l2(prefix, latency_ms)
+        cache_metrics.record_miss(prefix)
         return None
     except Exception:
+        cache_metrics.record_l2_error(prefix)
+        cache_metrics.record_miss(prefix)
         return None
 
-def cache_set(key: str, value: Any, ttl: int = 300, ex: Optional[int] = None) -> None:
-    """ttl hoặc ex (giống redis-py). ưu tiên ex nếu có."""
+def _backfill_l1(key: str, data: Any, expires_at: Optional[float], size: int) -> None:
+    # Store back in RAM to buffer frequent requests (Upstash command optimization);
+    # pub/sub invalidation keeps it safe across workers. Never outlive the Redis TTL.
+    l1_ttl = L1_BACKFILL_TTL_SEC
+    if expires_at:
+        l1_ttl = min(l1_ttl, int(expires_at - time.time()))
+    if l1_ttl > 0:
+        _mem_set(key, data, l1_ttl, size=size)
+
+def cache_get_many(keys: Iterable[str]) -> dict[str, Any]:
+    """
+    Batch cache_get: L1 trước, phần còn thiếu lấy bằng 1 lệnh MGET.
+    Trả về dict chỉ gồm các key có dữ liệu.
+    """
+    found: dict[str, Any] = {}
+    missing: list[str] = []
+    for k in dict.fromkeys(keys):
+        cached_mem = _mem_get(k)
+        if cached_mem is not None:
+            found[k] = cached_mem
+            cache_metrics.record_l1_hit(key_prefix(k))
+        else:
+            missing.append(k)
+
+    if not missing:
+        return found
+    by_prefix: dict[str, list[str]] = defaultdict(list)
+    for k in missing:
+        by_prefix[key_prefix(k)].append(k)
+
+    r = get_redis_raw()
+    if not r:
+        for prefix, ks in by_prefix.items():
+            cache_metrics.record_miss(prefix, len(ks))
+        return found
+    try:
+        started = time.perf_counter()
+        raws = r.mget(missing)
+        latency_ms = (time.perf_counter() - started) * 1000
+    except Exception:
+        for prefix, ks in by_prefix.items():
+            cache_metrics.record_l2_error(prefix)
+            cache_metrics.record_miss(prefix, len(ks))
+        return found
+
+    raw_by_key = dict(zip(missing, raws))
+    for prefix, ks in by_prefix.items():
+        hits = size = max_size = 0
+        for k in ks:
+            v = raw_by_key.get(k)
+            if not v:
+                continue
+            try:
+                data, expires_at = decode_value(v)
+            except Exception:
+                continue
+            _backfill_l1(k, data, expires_at, len(v))
+            found[k] = data
+            hits += 1
+            size += len(v)
+            max_size = max(max_size, len(v))
+        cache_metrics.record_l2(prefix, latency_ms, hits=hits, size=size, max_size=max_size)
+        if len(ks) > hits:
+            cache_metrics.record_miss(prefix, len(ks) - hits)
+    return found
+
+def cache_set(
+    key: str,
+    value: Any,
+    ttl: int = 300,
+    ex: Optional[int] = None,
+    tags: Optional[Iterable[str]] = None,
+) -> None:
+    """ttl hoặc ex (giống redis-py). ưu tiên ex nếu có. `tags` gắn key vào các nhóm để invalidate_tags()."""
     seconds = int(ex) if ex is not None else int(ttl)
+    tags = list(tags or [])
     
+    try:
+        payload, raw_size = encode_value(key, value, seconds)
+    except Exception:
+        payload, raw_size = None, None
+
     # 1. Update RAM (L1)
-    _mem_set(key, value, seconds)
+    _mem_set(key, value, seconds, size=raw_size)
+    if tags:
+        _index_local_tags(key, tags)
 
     # 2. Update Redis (L2)
-    r = get_redis()
-    if not r:
+    r = get_redis_raw()
+    if not r or payload is None:
         return
+    cache_metrics.record_write(key_prefix(key), len(payload))
     try:
-        r.setex(key, seconds, json.dumps(value, default=str))
+        if tags:
+            pipe = r.pipeline(transaction=False)
+            pipe.setex(key, seconds, payload)
+            for tag in tags:
+                pipe.sadd(f"{TAG_PREFIX}{tag}", key)
+                pipe.expire(f"{TAG_PREFIX}{tag}", max(seconds, TAG_INDEX_TTL_SEC))
+            pipe.execute()
+        else:
+            r.setex(key, seconds, payload)
+    except Exception:
+        pass
+
+def cache_set_many(
+    items: Mapping[str, Any],
+    ttl: int = 300,
+    tags: Optional[Mapping[str, Iterable[str]]] = None,
+) -> None:
+    """Batch cache_set: ghi L1 rồi gửi toàn bộ SETEX (+ tag index) trong 1 pipeline. `tags`: key -> list tag."""
+    if not items:
+        return
+    seconds = int(ttl)
+    payloads: dict[str, bytes] = {}
+    for k, value in items.items():
+        try:
+            payload, raw_size = encode_value(k, value, seconds)
+            payloads[k] = payload
+        except Exception:
+            raw_size = None
+        _mem_set(k, value, seconds, size=raw_size)
+        if tags and tags.get(k):
+            _index_local_tags(k, tags[k])
+
+    r = get_redis_raw()
+    if not r or not payloads:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        for k, payload in payloads.items():
+            cache_metrics.record_write(key_prefix(k), len(payload))
+            pipe.setex(k, seconds, payload)
+            for tag in (tags or {}).get(k) or ():
+                pipe.sadd(f"{TAG_PREFIX}{tag}", k)
+                pipe.expire(f"{TAG_PREFIX}{tag}", max(seconds, TAG_INDEX_TTL_SEC))
+        pipe.execute()
     except Exception:
         pass
 
 def cache_delete(*keys: str) -> None:
     for k in keys:
-        if k in _MEMORY_CACHE:
-            del _MEMORY_CACHE[k]
+        _MEMORY_CACHE.delete(k)
     safe_cache_delete(*keys)
+    publish_invalidation(keys=keys)
+
+
+# --- TAG-BASED INVALIDATION ---
+# Redis set `tag:{tag}` chứa các key phụ thuộc; thêm index cục bộ để xóa được cả khi Redis down.
+TAG_PREFIX = "tag:"
+TAG_INDEX_TTL_SEC = int(os.getenv("TAG_INDEX_TTL_SEC", str(7 * 86400)))
+
+_LOCAL_TAGS: dict[str, set[str]] = defaultdict(set)
+_LOCAL_TAGS_LOCK = threading.Lock()
+
+
+def _index_local_tags(key: str, tags: Iterable[str]) -> None:
+    with _LOCAL_TAGS_LOCK:
+        for tag in tags:
+            _LOCAL_TAGS[tag].add(key)
+
+
+def _pop_local_tag(tag: str) -> set[str]:
+    with _LOCAL_TAGS_LOCK:
+        return _LOCAL_TAGS.pop(tag, set())
+
+
+def invalidate_tags(*tags: str) -> set[str]:
+    """Xóa mọi key gắn một trong các tag (L1 mọi worker + Redis). Trả về tập key đã xóa."""
+    tags = tuple(t for t in tags if t)
+    if not tags:
+        return set()
+
+    keys: set[str] = set()
+    for tag in tags:
+        keys |= _pop_local_tag(tag)
+
+    r = get_redis()
+    if r:
+        try:
+            pipe = r.pipeline(transaction=False)
+            for tag in tags:
+                pipe.smembers(f"{TAG_PREFIX}{tag}")
+            for members in pipe.execute():
+                keys |= set(members or ())
+        except Exception:
+            pass
+
+    for k in keys:
+        _MEMORY_CACHE.delete(k)
+    safe_cache_delete(*keys, *(f"{TAG_PREFIX}{t}" for t in tags))
+    publish_invalidation(keys=keys, tags=tags)
+    return keys
+
+
+# --- NEGATIVE CACHE ---
+# Ghi nhớ "upstream không có dữ liệu" để không gọi lại chuỗi API tốn kém mỗi lần refresh.
+# Key: neg:{key}, giá trị {"reason": ..., "at": epoch}. TTL theo reason code.
+NEG_PREFIX = "neg:"
+NEG_NO_DATA = "no_data"                # upstream trả rỗng (vd ETF/quỹ không có BCTC)
+NEG_NO_FUNDAMENTALS = "no_fundamentals"
+NEG_UPSTREAM_ERROR = "upstream_error"  # lỗi/rate limit: chỉ chặn ngắn để tự hồi phục
+
+NEGATIVE_CACHE_TTL_SEC = int(os.getenv("NEGATIVE_CACHE_TTL_SEC", str(6 * 3600)))
+NEGATIVE_ERROR_TTL_SEC = int(os.getenv("NEGATIVE_ERROR_TTL_SEC", "300"))
+
+_NEG_TTL_BY_REASON = {
+    NEG_NO_DATA: NEGATIVE_CACHE_TTL_SEC,
+    NEG_NO_FUNDAMENTALS: NEGATIVE_CACHE_TTL_SEC,
+    NEG_UPSTREAM_ERROR: NEGATIVE_ERROR_TTL_SEC,
+}
+
+
+def negative_cache_set(
+    key: str,
+    reason: str,
+    ttl: Optional[int] = None,
+    tags: Optional[Iterable[str]] = None,
+) -> None:
+    seconds = ttl if ttl is not None else _NEG_TTL_BY_REASON.get(reason, NEGATIVE_CACHE_TTL_SEC)
+    cache_set(f"{NEG_PREFIX}{key}", {"reason": reason, "at": int(time.time())}, seconds, tags=tags)
+
+
+def negative_cache_get(key: str) -> Optional[dict]:
+    """Trả về {"reason", "at"} nếu key đang bị đánh dấu không có dữ liệu, ngược lại None."""
+    return cache_get(f"{NEG_PREFIX}{key}")
+
+
+def negative_cache_clear(*keys: str) -> None:
+    cache_delete(*(f"{NEG_PREFIX}{k}" for k in keys))
+
+
+# --- L1 SNAPSHOT (restart / rolling deploy) ---
+# Khi shutdown ghi các entry L1 còn sống lâu ra file; khi startup nạp lại (decode lười theo key).
+# Định dạng v2: MAGIC, rồi mỗi entry: key_len(H) exp(d) tags_len(H) val_len(I) key tags(phân tách "\n") val(JSON bytes).
+# File v1 (không có tags) vẫn đọc được.
+L1_SNAPSHOT_PATH = os.getenv("L1_SNAPSHOT_PATH", "")
+L1_SNAPSHOT_MIN_TTL_SEC = int(os.getenv("L1_SNAPSHOT_MIN_TTL_SEC", "600"))
+_SNAPSHOT_MAGIC_V1 = b"L1SNAP1\n"
+_SNAPSHOT_MAGIC = b"L1SNAP2\n"
+_SNAPSHOT_FRAME_V1 = struct.Struct(">HdI")
+_SNAPSHOT_FRAME = struct.Struct(">HdHI")
+
+
+def _local_tags_by_key() -> dict[str, list[str]]:
+    with _LOCAL_TAGS_LOCK:
+        by_key: dict[str, list[str]] = defaultdict(list)
+        for tag, keys in _LOCAL_TAGS.items():
+            for k in keys:
+                by_key[k].append(tag)
+        return by_key
+
+
+def save_l1_snapshot(path: Optional[str] = None) -> int:
+    """Ghi snapshot (atomic: file tạm + os.replace). Trả về số entry đã ghi; 0 nếu tắt."""
+    path = path or L1_SNAPSHOT_PATH
+    if not path:
+        return 0
+    written = 0
+    tmp = f"{path}.{os.getpid()}.tmp"
+    tags_by_key = _local_tags_by_key()
+    try:
+        with open(tmp, "wb") as f:
+            f.write(_SNAPSHOT_MAGIC)
+            for key, expires_at, val in _MEMORY_CACHE.snapshot_items(L1_SNAPSHOT_MIN_TTL_SEC):
+                try:
+                    body = val.raw if isinstance(val, _LazyValue) else _dumps(val)
+                    kb = key.encode()
+                    tb = "\n".join(tags_by_key.get(key, ())).encode()
+                except Exception:
+                    continue
+                f.write(_SNAPSHOT_FRAME.pack(len(kb), expires_at, len(tb), len(body)))
+                f.write(kb)
+                f.write(tb)
+                f.write(body)
+                written += 1
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[CACHE] ⚠️ Không ghi được L1 snapshot: {e}")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return 0
+    return written
+
+
+def _read_snapshot(path: str) -> list[tuple[str, float, list[str], bytes]]:
+    entries: list[tuple[str, float, list[str], bytes]] = []
+    with open(path, "rb") as f:
+        magic = f.read(len(_SNAPSHOT_MAGIC))
+        if magic not in (_SNAPSHOT_MAGIC, _SNAPSHOT_MAGIC_V1):
+            return entries
+        v1 = magic == _SNAPSHOT_MAGIC_V1
+        frame = _SNAPSHOT_FRAME_V1 if v1 else _SNAPSHOT_FRAME
+        while True:
+            head = f.read(frame.size)
+            if len(head) < frame.size:
+                break
+            if v1:
+                key_len, expires_at, val_len = frame.unpack(head)
+                tags_len = 0
+            else:
+                key_len, expires_at, tags_len, val_len = frame.unpack(head)
+            key = f.read(key_len).decode()
+            tags = [t for t in f.read(tags_len).decode().split("\n") if t] if tags_len else []
+            body = f.read(val_len)
+            if len(body) < val_len:
+                break
+            entries.append((key, expires_at, tags, body))
+    return entries
+
+
+def _l2_expiry_headers(keys: list[str]) -> Optional[list[Optional[float]]]:
+    """expires_at ghi trong header codec của từng key ở L2 (None: mất key / payload cũ). None nếu Redis lỗi."""
+    r = get_redis_raw()
+    if r is None:
+        return None
+    try:
+        pipe = r.pipeline(transaction=False)
+        for key in keys:
+            pipe.getrange(key, 0, _CODEC_HEADER.size - 1)
+        heads = pipe.execute()
+    except Exception:
+        return None
+    out: list[Optional[float]] = []
+    for head in heads:
+        if head and len(head) == _CODEC_HEADER.size and head[0] == _CODEC_MAGIC:
+            out.append(float(_CODEC_HEADER.unpack(head)[3]))
+        else:
+            out.append(None)
+    return out
+
+
+def load_l1_snapshot(path: Optional[str] = None) -> int:
+    """
+    Nạp snapshot vào L1 (giá trị giữ dạng bytes tới khi được đọc), giữ nguyên TTL còn lại của từng entry.
+    Trong lúc process tắt, worker khác có thể đã xóa hoặc ghi lại key: chỉ giữ entry mà header codec
+    ở L2 còn mang đúng expires_at của lần ghi đã snapshot. Không tới được Redis thì tin TTL còn lại.
+    Tags được index lại để invalidate_tags() thấy.
+    """
+    path = path or L1_SNAPSHOT_PATH
+    if not path or not os.path.exists(path):
+        return 0
+    try:
+        entries = _read_snapshot(path)
+    except Exception as e:
+        print(f"[CACHE] ⚠️ Không đọc được L1 snapshot: {e}")
+        return 0
+
+    now = time.time()
+    entries = [e for e in entries if e[1] > now]
+    if entries:
+        l2_exp = _l2_expiry_headers([key for key, *_ in entries])
+        if l2_exp is not None:
+            # cache_set ghi L1 và L2 cùng TTL; header lưu epoch nguyên giây nên cho lệch 2s
+            entries = [e for e, exp in zip(entries, l2_exp) if exp is not None and abs(exp - e[1]) <= 2]
+
+    loaded = 0
+    for key, expires_at, tags, body in entries:
+        if _MEMORY_CACHE.restore(key, body, expires_at):
+            if tags:
+                _index_local_tags(key, tags)
+            loaded += 1
+    return loaded
@@ -7,6 +7,8 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from core.logger import logger
 from core.data_engine import DataEngine
+from tasks.cache_warmup import warm_caches_task
+from tasks.intraday_nav import record_intraday_nav
 
 
 scheduler = BackgroundScheduler()
@@ -41,6 +43,25 @@ def init_scheduler():
             replace_existing=True
         )
         
+        # 3. Pre-open cache warm-up (8:50, Mon-Fri) - ratios/sparkline/trending/metadata
+        # trước 9:00; chọn 8:50 để trending (TTL 15 phút) còn hiệu lực lúc mở cửa
+        scheduler.add_job(
+            func=warm_caches_task,
+            trigger=CronTrigger(hour=8, minute=50, day_of_week='mon-fri'),
+            id='cache_warmup',
+            name='Pre-open Cache Warm-up',
+            replace_existing=True
+        )
+
+        # 4. Intraday NAV (every minute 9:00-15:00, Mon-Fri; lunch break skipped by the task)
+        scheduler.add_job(
+            func=record_intraday_nav,
+            trigger=CronTrigger(minute='*', hour='9-15', day_of_week='mon-fri'),
+            id='intraday_nav',
+            name='Per-minute Intraday NAV',
+            replace_existing=True
+        )
+
         # 2. Startup Self-Healing
         # (This is better called here as part of system readiness)
         DataEngine.startup_sync()
@@ -4,7 +4,6 @@ crawler.py - Module lấy dữ liệu giá cổ phiếu & VNINDEX từ vnstock3
 from vnstock import Vnstock, Trading
 from datetime import datetime, timedelta
 import redis
-import json
 import requests
 
 # --- CẤU HÌNH ---
@@ -12,7 +11,7 @@ CACHE_DURATION = 30  # thời gian cache (giây)
 INDICES = ["VNINDEX", "VN30", "HNX30", "HNX", "UPCOM", "HNXINDEX", "UPCOMINDEX"]
 
 # --- CẤU HÌNH REDIS CACHE ---
-from core.redis_client import get_redis
+from core.redis_client import NEG_NO_DATA, cache_get, cache_set, get_redis, negative_cache_get, negative_cache_set
 redis_client = get_redis()
 REDIS_AVAILABLE = redis_client is not None
 
@@ -28,9 +27,8 @@ def get_current_prices(tickers: list) -> dict:
     # 1. KIỂM TRA CACHE
     cache_key = "stock_prices"
     if REDIS_AVAILABLE:
-        cached_data = redis_client.get(cache_key)
-        if cached_data:
-            all_prices = json.loads(cached_data)
+        all_prices = cache_get(cache_key)
+        if all_prices:
             if all(t in all_prices for t in tickers):
                 return {t: all_prices[t] for t in tickers}
     
@@ -97,14 +95,11 @@ def get_current_prices(tickers: list) -> dict:
     # Lưu vào Redis cache (merge với dữ liệu cũ nếu có)
     if REDIS_AVAILABLE and result:
         try:
-            current_cache = {}
-            cached_raw = redis_client.get(cache_key)
-            if cached_raw:
-                current_cache = json.loads(cached_raw)
+            current_cache = dict(cache_get(cache_key) or {})
             current_cache.update(result)
             # Dùng giá trị mặc định 30 nếu CACHE_DURATION bị lỗi vì lý do gì đó
             ttl = globals().get('CACHE_DURATION', 30)
-            redis_client.setex(cache_key, ttl, json.dumps(current_cache))
+            cache_set(cache_key, current_cache, ttl)
         except Exception as re:
             print(f"[CRAWLER] Lỗi cập nhật Redis: {re}")
     
@@ -118,6 +113,11 @@ def get_historical_prices(ticker: str, period: str = "1m") -> list:
     if REDIS_AVAILABLE and redis_client.get("vci_rate_limit_backoff"):
         print(f"[CRAWLER] VCI Backoff active. Skipping historical fetch for {ticker}.")
         return []
+
+    # Negative cache: mã không có lịch sử giá (mới niêm yết, mã sai...) -> không gọi lại vnstock
+    neg_key = f"hist:{ticker.upper()}:{period}"
+    if negative_cache_get(neg_key):
+        return []
         
     try:
         end_date = datetime.now().strftime('%Y-%m-%d')
@@ -158,6 +158,7 @@ def get_historical_prices(ticker: str, period: str = "1m") -> list:
             return result
         else:
             print(f"[CRAWLER] Không có dữ liệu cho {ticker}")
+            negative_cache_set(neg_key, NEG_NO_DATA, tags=[f"ticker:{ticker.upper()}", f"history:{ticker.upper()}"])
             return []
             
     except BaseException as e:
@@ -16,14 +16,15 @@ from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 import models
-from core.db import engine
-from core.redis_client import init_redis
+from core.db import engine, SessionLocal
+from core.redis_client import init_redis, load_l1_snapshot, save_l1_snapshot
 from core.logger import logger
 from core.exceptions import AppBaseException
 
-from routers import trading, portfolio, logs, market, watchlist, titan
+from routers import trading, portfolio, logs, market, watchlist, titan, admin
 from tasks.maintenance import cleanup_expired_data_task
 from core.data_engine import DataEngine
+from services import ledger_service
 
 app = FastAPI(title="Invest Journal")
 
@@ -85,12 +86,23 @@ app.add_middleware(
 @app.on_event("startup")
 def on_startup():
     init_redis()
+    # Warm L1 from the previous process (optional, L1_SNAPSHOT_PATH)
+    restored = load_l1_snapshot()
+    if restored:
+        logger.info(f"Restored {restored} L1 cache entries from snapshot")
     # create tables once at startup (dev)
     try:
         models.Base.metadata.create_all(bind=engine)
     except Exception as e:
         logger.warning(f"Database table creation skipped/error: {e}")
 
+    # Replay baseline for the event ledger (no-op once a snapshot exists)
+    try:
+        with SessionLocal() as db:
+            ledger_service.ensure_bootstrap(db)
+    except Exception as e:
+        logger.warning(f"Ledger bootstrap skipped/error: {e}")
+
     logger.info("🚀 Invest Journal backend is ready!")
     
     # Run cleanup of expired notes (3 year rule)
@@ -117,6 +129,13 @@ def on_startup():
 
 @app.on_event("shutdown")
 def on_shutdown():
+    try:
+        saved = save_l1_snapshot()
+        if saved:
+            logger.info(f"Saved {saved} L1 cache entries to snapshot")
+    except Exception as e:
+        logger.error(f"L1 snapshot failed: {e}")
+
     try:
         from core.scheduler import shutdown_scheduler
         shutdown_scheduler()
@@ -130,6 +149,7 @@ app.include_router(market.router)
 app.include_router(logs.router)
 app.include_router(watchlist.router)
 app.include_router(titan.router)
+app.include_router(admin.router)
 
 
 @app.get("/")
@@ -0,0 +1,23 @@
+from sqlalchemy import text
+
+from core.db import engine
+
+
+def run_migration():
+    print("--- MIGRATING DATABASE: ADDING 'lot_id' COLUMN TO stock_transactions ---")
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            result = conn.execute(text("SELECT column_name FROM information_schema.columns WHERE table_name='stock_transactions' AND column_name='lot_id'"))
+            if result.fetchone():
+                print("Column 'lot_id' already exists.")
+            else:
+                print("Adding column 'lot_id'...")
+                conn.execute(text("ALTER TABLE stock_transactions ADD COLUMN lot_id INTEGER NULL"))
+                print("Success!")
+        except Exception as e:
+            print(f"Migration Error: {e}")
+
+
+if __name__ == "__main__":
+    run_migration()
@@ -5,7 +5,7 @@ from datetime import datetime, date
 from decimal import Decimal
 import enum
 
-from sqlalchemy import Column, Integer, String, Numeric, DateTime, Date, Enum, UniqueConstraint, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Numeric, DateTime, Date, Enum, UniqueConstraint, ForeignKey, Boolean, JSON
 from sqlalchemy.orm import relationship
 
 from core.db import Base
@@ -24,6 +24,15 @@ class CashFlowType(enum.Enum):
     DIVIDEND_CASH = "DIVIDEND_CASH"
 
 
+class LedgerEventType(enum.Enum):
+    DEPOSIT = "DEPOSIT"
+    WITHDRAW = "WITHDRAW"
+    INTEREST = "INTEREST"
+    BUY = "BUY"
+    SELL = "SELL"
+    REVERSAL = "REVERSAL"
+
+
 class AssetSummary(Base):
     """Tổng quan ví tiền mặt và các cài đặt phí thuế"""
     __tablename__ = "asset_summary"
@@ -60,6 +69,8 @@ class StockTransaction(Base):
     transaction_date = Column(DateTime, default=datetime.now, index=True)
     settlement_date = Column(Date, nullable=True)
     note = Column(String(500), nullable=True)
+    # Lệnh bán theo lô chỉ định: id của lệnh MUA (lô) bị trừ trước, NULL = FIFO/giá vốn bình quân
+    lot_id = Column(Integer, nullable=True)
 
 
 class RealizedProfit(Base):
@@ -84,6 +95,36 @@ class CashFlow(Base):
     created_at = Column(DateTime, default=datetime.now, index=True)
 
 
+class LedgerEvent(Base):
+    """Sổ cái append-only: mọi thay đổi tiền mặt / danh mục đều là 1 event (không sửa, không xoá)"""
+    __tablename__ = "ledger_events"
+    id = Column(Integer, primary_key=True, index=True)
+    event_type = Column(Enum(LedgerEventType), index=True)
+    ticker = Column(String(10), nullable=True, index=True)
+    cash_delta = Column(Numeric(20, 4), default=0)
+    deposited_delta = Column(Numeric(20, 4), default=0)
+    volume_delta = Column(Numeric(20, 4), default=0)
+    # BUY: giá vốn cộng thêm (gồm phí). SELL: giá vốn trừ ra (âm, theo phương pháp lô); 0 = event cũ, trừ theo bình quân
+    cost_delta = Column(Numeric(20, 4), default=0)
+    stock_transaction_id = Column(Integer, nullable=True, index=True)
+    cash_flow_id = Column(Integer, nullable=True)
+    reverses_event_id = Column(Integer, nullable=True, index=True)
+    description = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.now, index=True)
+
+
+class LedgerSnapshot(Base):
+    """Trạng thái vật chất hoá sau event last_event_id (tiền mặt + danh mục), dùng làm điểm bắt đầu replay"""
+    __tablename__ = "ledger_snapshots"
+    id = Column(Integer, primary_key=True, index=True)
+    last_event_id = Column(Integer, index=True)
+    cash_balance = Column(Numeric(20, 4), default=0)
+    total_deposited = Column(Numeric(20, 4), default=0)
+    # {ticker: [volume, total_cost]} (chuỗi số để giữ nguyên độ chính xác Decimal)
+    holdings = Column(JSON, default=dict)
+    created_at = Column(DateTime, default=datetime.now)
+
+
 class DailySnapshot(Base):
     """Dữ liệu chốt sổ NAV mỗi ngày để vẽ biểu đồ hiệu suất"""
     __tablename__ = "daily_snapshots"
@@ -106,6 +147,18 @@ class HistoricalPrice(Base):
     __table_args__ = (UniqueConstraint("ticker", "date", name="_ticker_date_uc"),)
 
 
+class LatestQuote(Base):
+    """Bảng tổng hợp giá đóng cửa gần nhất + phiên trước cho mỗi mã (tra cứu theo khóa chính)"""
+    __tablename__ = "latest_quotes"
+    ticker = Column(String(10), primary_key=True)
+    date = Column(Date, nullable=False)
+    close_price = Column(Numeric(20, 4))
+    prev_close = Column(Numeric(20, 4), nullable=True)  # Close của phiên liền trước `date`
+    volume = Column(Numeric(20, 4), default=0)
+    value = Column(Numeric(20, 4), default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
 class IntradayPrice(Base):
     """Intraday minute data used for charting when market is closed."""
     __tablename__ = "intraday_prices"
@@ -0,0 +1,25 @@
+# routers/admin.py
+from fastapi import APIRouter
+
+from core import cache_metrics
+from core.redis_client import WORKER_ID, l1_stats
+from core.response import success
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+@router.get("/cache-stats")
+def get_cache_stats(reset: bool = False):
+    """
+    Cache counters of the worker serving this request: per key prefix L1/L2 hits, misses,
+    L2 latency, payload sizes and @cache recompute durations, plus L1 occupancy.
+    Use `?reset=true` to start a fresh measurement window after reading.
+    """
+    data = {
+        "worker": WORKER_ID,
+        "metrics": cache_metrics.snapshot(),
+        "l1": l1_stats(),
+    }
+    if reset:
+        cache_metrics.reset()
+    return success(data=data)
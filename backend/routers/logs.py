@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from sqlalchemy import cast, Date
 from datetime import datetime
-from core.db import get_db
+from core.db import get_db, get_read_db
 from core.exceptions import EntityNotFoundException, ValidationError
 from core.logger import logger
 import models
@@ -13,7 +13,7 @@ from core.response import success, fail
 router = APIRouter(tags=["Audit Logs"])
 
 @router.get("/logs")
-def get_audit_log(db: Session = Depends(get_db)):
+def get_audit_log(db: Session = Depends(get_read_db)):
     """
     Returns a unified timeline of all financial events: Deposits, Withdrawals, Buy/Sell trades.
     """
@@ -1,11 +1,13 @@
 # routers/market.py
 from fastapi import APIRouter, Depends, BackgroundTasks
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta, date
-from sqlalchemy import cast, Date, text
+from sqlalchemy import text, select
 
 import models
-from core.db import get_db
+from core.db import get_db, get_async_read_db, run_with_session
+from core.redis_client import l1_get
 from core.logger import logger
 from services import market_service
 from core.response import success, fail
@@ -35,11 +37,11 @@ def sync_portfolio_history(background_tasks: BackgroundTasks, db: Session = Depe
     return success(data={"message": f"Syncing history for {len(tickers)} stocks in background."})
 
 @router.get("/historical")
-def get_historical(
+async def get_historical(
     ticker: str,
     background_tasks: BackgroundTasks,
     period: str = "1m",
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
 ):
     """
     Retrieve historical price data from local store.
@@ -49,15 +51,15 @@ def get_historical(
     days_map = {"1m": 30, "3m": 90, "6m": 180, "1y": 365}
     start_date = date.today() - timedelta(days=days_map.get(period, 30))
 
-    stored_data = (
-        db.query(models.HistoricalPrice)
-        .filter(
+    rows = await db.execute(
+        select(models.HistoricalPrice.date, models.HistoricalPrice.close_price)
+        .where(
             models.HistoricalPrice.ticker == ticker,
-            cast(models.HistoricalPrice.date, Date) >= start_date,
+            models.HistoricalPrice.date >= start_date,
         )
         .order_by(models.HistoricalPrice.date.asc())
-        .all()
     )
+    stored_data = rows.all()
 
     if len(stored_data) < 5:
         logger.info(f"Low history cache for {ticker}, triggering background sync.")
@@ -77,12 +79,14 @@ def get_trending(ticker: str, background_tasks: BackgroundTasks, db: Session = D
     return success(data=data)
 
 @router.get("/market-summary")
-def get_market_summary(db: Session = Depends(get_db)):
+async def get_market_summary():
     """
     Get real-time market overview for major indices (VNINDEX, VN30, HNX30).
     Orchestrated by the service layer with dual-layer caching (Redis/Memory).
     """
-    data = market_service.get_market_summary_service(db)
+    data = l1_get(market_service.MARKET_SUMMARY_CACHE_KEY)
+    if not data:
+        data = await run_with_session(market_service.get_market_summary_service)
     return success(data=data)
 
 @router.get("/index-widget")
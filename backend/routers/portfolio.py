@@ -5,7 +5,7 @@ from datetime import date, datetime
 
 import models
 import schemas
-from core.db import get_db
+from core.db import get_db, get_read_db, run_with_session, run_with_read_session
 from core.cache import invalidate_dashboard_cache
 from core.redis_client import safe_flushall
 from core.exceptions import ValidationError
@@ -14,6 +14,7 @@ from core.logger import logger
 from services.portfolio_service import calculate_portfolio, get_ticker_profit
 from services.portfolio_service import calculate_portfolio, get_ticker_profit
 from services.performance_service import calculate_twr_metrics, growth_series, nav_history
+from services import attribution_service, intraday_nav, ledger_service, lot_engine, risk_service
 from core.response import success, fail
 
 router = APIRouter(tags=["Portfolio & Performance"])
@@ -36,12 +37,15 @@ def deposit_money(req: schemas.DepositRequest, db: Session = Depends(get_db)):
     asset.cash_balance += req.amount
     asset.total_deposited += req.amount
 
-    db.add(
-        models.CashFlow(
-            type=models.CashFlowType.DEPOSIT,
-            amount=req.amount,
-            description=req.description,
-        )
+    cash_log = models.CashFlow(
+        type=models.CashFlowType.DEPOSIT,
+        amount=req.amount,
+        description=req.description,
+    )
+    db.add(cash_log)
+    ledger_service.record(
+        db, models.LedgerEventType.DEPOSIT,
+        cash_delta=req.amount, deposited_delta=req.amount, cash_flow=cash_log, description=req.description,
     )
     db.commit()
 
@@ -60,12 +64,15 @@ def withdraw_money(req: schemas.DepositRequest, db: Session = Depends(get_db)):
         raise ValidationError("Insufficient balance for withdrawal.")
 
     asset.cash_balance -= req.amount
-    db.add(
-        models.CashFlow(
-            type=models.CashFlowType.WITHDRAW,
-            amount=req.amount,
-            description=req.description,
-        )
+    cash_log = models.CashFlow(
+        type=models.CashFlowType.WITHDRAW,
+        amount=req.amount,
+        description=req.description,
+    )
+    db.add(cash_log)
+    ledger_service.record(
+        db, models.LedgerEventType.WITHDRAW,
+        cash_delta=-req.amount, cash_flow=cash_log, description=req.description,
     )
     db.commit()
 
@@ -75,30 +82,50 @@ def withdraw_money(req: schemas.DepositRequest, db: Session = Depends(get_db)):
     return success(data={"message": "Funds withdrawn successfully."})
 
 @router.get("/portfolio")
-def get_portfolio(db: Session = Depends(get_db)):
+async def get_portfolio():
     """
     Retrieves the complete portfolio valuation and breakdown.
     """
-    return success(data=calculate_portfolio(db))
+    data = calculate_portfolio.peek()
+    if data is None:
+        data = await run_with_session(calculate_portfolio)
+    return success(data=data)
 
 @router.get("/performance")
-def get_performance(db: Session = Depends(get_db)):
+async def get_performance():
     """
     Retrieves portfolio performance metrics (TWR).
     """
-    return success(data=calculate_twr_metrics(db))
+    data = calculate_twr_metrics.peek()
+    if data is None:
+        data = await run_with_session(calculate_twr_metrics)
+    return success(data=data)
 
 @router.get("/chart-growth")
-def get_chart_growth(period: str = "1m", db: Session = Depends(get_db)):
+async def get_chart_growth(period: str = "1m"):
     """
     Returns data series for the portfolio growth chart.
     """
-    return success(data=growth_series(db, period=period))
+    data = growth_series.peek(None, period=period)
+    if data is None:
+        data = await run_with_read_session(growth_series, period=period)
+    return success(data=data)
+
+@router.get("/risk")
+async def get_risk(period: str = "1y"):
+    """
+    Volatility, drawdown, Sharpe/Sortino and beta/correlation vs VNINDEX/VN30 for the portfolio and holdings.
+    """
+    data = risk_service.risk_metrics.peek(None, period=period)
+    if data is None:
+        data = await run_with_read_session(risk_service.risk_metrics, period=period)
+    return success(data=data)
 
 @router.get("/nav-history")
-def get_nav_history(start_date: str | None = None, end_date: str | None = None, limit: int = 30, db: Session = Depends(get_db)):
+def get_nav_history(start_date: str | None = None, end_date: str | None = None, limit: int | None = None, cursor: str | None = None, db: Session = Depends(get_read_db)):
     """
-    Returns historical NAV data with optional date filtering.
+    Returns historical NAV data with optional date filtering, newest first.
+    Pages are keyset-based: pass `next_cursor` from the previous response as `cursor`.
     """
     def _parse_date(s):
         if not s: return None
@@ -110,7 +137,31 @@ def get_nav_history(start_date: str | None = None, end_date: str | None = None,
     d_start = _parse_date(start_date)
     d_end = _parse_date(end_date)
         
-    return success(data=nav_history(db, start_date=d_start, end_date=d_end, limit=limit))
+    return success(data=nav_history(db, start_date=d_start, end_date=d_end, limit=limit, cursor=cursor))
+
+@router.get("/intraday-nav")
+def get_intraday_nav(day: str | None = None, db: Session = Depends(get_read_db)):
+    """
+    Minute-by-minute NAV for today (or `day`, YYYY-MM-DD) as parallel arrays for a sparkline.
+    """
+    try:
+        d = datetime.strptime(day, "%Y-%m-%d").date() if day else None
+    except ValueError:
+        raise ValidationError("day must be YYYY-MM-DD.")
+    return success(data=intraday_nav.get_series(db, d))
+
+@router.get("/attribution")
+def get_attribution(period: str = "1m", start_date: str | None = None, end_date: str | None = None, db: Session = Depends(get_read_db)):
+    """
+    Per-ticker contribution, weight and active return vs VNINDEX over a period or date range.
+    """
+    try:
+        d_start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+        d_end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    except ValueError:
+        raise ValidationError("Dates must be YYYY-MM-DD.")
+    default_start, default_end = attribution_service.period_window(period, d_end)
+    return success(data=attribution_service.compute_attribution(db, d_start or default_start, d_end or default_end))
 
 @router.get("/ticker-lifetime-profit/{ticker}")
 def get_ticker_lifetime_profit(ticker: str, db: Session = Depends(get_db)):
@@ -119,6 +170,43 @@ def get_ticker_lifetime_profit(ticker: str, db: Session = Depends(get_db)):
     """
     return success(data=get_ticker_profit(db, ticker))
 
+@router.get("/lots")
+def get_lots(db: Session = Depends(get_read_db)):
+    """
+    Open tax lots per ticker with FIFO and average-cost views (cost basis, realized profit).
+    """
+    book = lot_engine.get_all_lots(db)
+    return success(data=[lots.to_dict() for lots in book.values()])
+
+@router.get("/lots/{ticker}")
+def get_ticker_lots(ticker: str, db: Session = Depends(get_read_db)):
+    """
+    Open tax lots of one ticker (lot_id can be passed to /sell with lot_method=SPECIFIC).
+    """
+    return success(data=lot_engine.get_ticker_lots(db, ticker).to_dict())
+
+@router.get("/ledger/events")
+def get_ledger_events(limit: int = 100, before_id: int | None = None, db: Session = Depends(get_read_db)):
+    """
+    Append-only ledger events, newest first (audit trail; page with before_id).
+    """
+    return success(data=ledger_service.list_events(db, limit=min(limit, 500), before_id=before_id))
+
+@router.get("/ledger/state")
+def get_ledger_state(at: str | None = None, event_id: int | None = None, db: Session = Depends(get_read_db)):
+    """
+    Cash and holdings rebuilt from the ledger: latest, after a given event, or as of an ISO datetime.
+    """
+    if at:
+        try:
+            at_dt = datetime.fromisoformat(at)
+        except ValueError:
+            raise ValidationError("Invalid 'at' datetime, expected ISO format.")
+        state = ledger_service.state_at(db, at_dt)
+    else:
+        state = ledger_service.replay(db, upto_event_id=event_id)
+    return success(data=state.to_dict())
+
 @router.post("/save-nav-snapshot")
 def save_nav_snapshot_manual(db: Session = Depends(get_db)):
     """
@@ -145,6 +233,8 @@ def reset_data(db: Session = Depends(get_db)):
     db.query(models.RealizedProfit).delete()
     db.query(models.DailySnapshot).delete()
     db.query(models.HistoricalPrice).delete()
+    db.query(models.LedgerEvent).delete()
+    db.query(models.LedgerSnapshot).delete()
     db.commit()
 
     safe_flushall()
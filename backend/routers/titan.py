@@ -10,7 +10,7 @@ from fastapi import APIRouter, Depends, BackgroundTasks
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 
-from core.db import get_db
+from core.db import get_db, get_read_db
 import models
 from titan.alpha_scanner import AlphaScanner
 from pydantic import BaseModel
@@ -61,7 +61,7 @@ def stop_titan_scan():
     return success(data={"message": "No active TITAN scan process to stop."})
 
 @router.get("/results")
-def get_titan_results(db: Session = Depends(get_db)):
+def get_titan_results(db: Session = Depends(get_read_db)):
     """
     Retrieves the most recent TITAN scan results from the database.
     """
@@ -1,14 +1,19 @@
 # routers/watchlist.py
 from fastapi import APIRouter, Depends, BackgroundTasks
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
+from starlette.concurrency import run_in_threadpool
 from typing import List
 
 import models
 import schemas
-from core.db import get_db
+from core.db import get_db, get_async_db
+from core.redis_client import l1_get
 from core.exceptions import ValidationError, EntityNotFoundException
 from core.logger import logger
 from services.market_service import get_watchlist_detail_service, invalidate_watchlist_detail_cache
+from services.market.cache import record_watchlist_access, watchlist_detail_cache_key
 from core.response import success, fail
 
 router = APIRouter(prefix="/watchlists", tags=["Watchlist"])
@@ -129,21 +134,33 @@ def remove_ticker_from_watchlist(id: int, ticker_id: int, db: Session = Depends(
     return success(data={"message": f"Removed {ticker} from watchlist."})
 
 @router.get("/{id}/detail")
-def get_watchlist_detail(id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def get_watchlist_detail(id: int, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db)):
     """
     Retrieves detailed real-time market data for all symbols in the watchlist.
     Includes the specific WatchlistTicker ID for management purposes.
     """
-    wl = db.query(models.Watchlist).filter(models.Watchlist.id == id).first()
-    if not wl:
-        raise EntityNotFoundException("Watchlist", id)
+    rows = await db.execute(
+        select(models.WatchlistTicker.ticker, models.WatchlistTicker.id)
+        .where(models.WatchlistTicker.watchlist_id == id)
+    )
+    ticker_to_id = {ticker: tid for ticker, tid in rows.all()}
+    if not ticker_to_id:
+        exists = await db.scalar(select(models.Watchlist.id).where(models.Watchlist.id == id))
+        if exists is None:
+            raise EntityNotFoundException("Watchlist", id)
     
     # Create a mapping for ticker -> WatchlistTicker.id
-    ticker_to_id = {t.ticker: t.id for t in wl.tickers}
     tickers = list(ticker_to_id.keys())
     
-    # Pass ID for results caching (10s)
-    market_data = get_watchlist_detail_service(tickers, background_tasks=background_tasks, watchlist_id=id)
+    # Access counter feeds the pre-open cache warm-up priority (runs after the response)
+    background_tasks.add_task(record_watchlist_access, id)
+
+    # Pass ID for results caching (10s); L1 hits are served without a threadpool hop
+    market_data = l1_get(watchlist_detail_cache_key(id)) if tickers else None
+    if not market_data:
+        market_data = await run_in_threadpool(
+            get_watchlist_detail_service, tickers, background_tasks=background_tasks, watchlist_id=id
+        )
     
     # Inject the mapping ID into the market data objects
     for item in market_data:
@@ -151,6 +168,4 @@ def get_watchlist_detail(id: int, background_tasks: BackgroundTasks, db: Session
         if symbol in ticker_to_id:
             item['watchlist_ticker_id'] = ticker_to_id[symbol]
             
-            item['watchlist_ticker_id'] = ticker_to_id[symbol]
-            
     return success(data=market_data)
@@ -1,6 +1,6 @@
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional, Generic, TypeVar, Any, List
+from typing import Optional, Generic, TypeVar, Any, List, Literal
 from pydantic import BaseModel, Field, field_validator
 
 T = TypeVar("T")
@@ -70,6 +70,10 @@ class SellStockRequest(BaseModel):
     transaction_date: datetime = Field(default_factory=datetime.now)
     # THÊM Ô GHI CHÚ CHO LỆNH BÁN
     note: Optional[str] = Field(None, max_length=500)
+    # Cách tính giá vốn: FIFO, AVG (bình quân), SPECIFIC (kèm lot_id = id lệnh mua).
+    # Không truyền = FIFO; vị thế có cổ phiếu không ghép được vào lệnh MUA nào thì dùng AVG
+    lot_method: Optional[Literal["AVG", "FIFO", "SPECIFIC"]] = None
+    lot_id: Optional[int] = None
 
     @field_validator('ticker')
     @classmethod
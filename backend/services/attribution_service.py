@@ -0,0 +1,122 @@
+# services/attribution_service.py
+"""
+Per-ticker performance attribution over a window of trading days.
+
+Holdings are replayed from the ledger (services.nav_reconstruction) onto the VNINDEX trading
+calendar, so every quantity is a (days x tickers) array:
+    w[t-1, i]  = value_i / NAV at the previous close (cash included in NAV)
+    r[t, i]    = close-to-close price return
+    c[t, i]    = w[t-1, i] * r[t, i]                     (contribution)
+    a[t, i]    = w[t-1, i] * (r[t, i] - r_bench[t])       (active contribution)
+Daily contributions are linked over the window with Carino factors, so they add up to the
+compounded holdings return. Returns are price-driven: fees, interest and the intraday effect
+of trades on the trade day itself are not attributed.
+"""
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from core.cache import HISTORY_TAG, PORTFOLIO_TAG, cache
+from services import ledger_service
+from services.nav_reconstruction import build_ledger_matrices, price_matrix, trading_days
+
+BENCHMARK = "VNINDEX"
+PERIOD_DAYS = {"1m": 30, "3m": 90, "6m": 180, "1y": 365}
+
+
+def period_window(period: str, end: date | None = None) -> tuple[date, date]:
+    end = end or date.today()
+    return end - timedelta(days=PERIOD_DAYS.get(period, 30)), end
+
+
+def _simple_returns(prices: np.ndarray) -> np.ndarray:
+    """(days-1 x n) close-to-close returns; 0 where either close is missing."""
+    prev, curr = prices[:-1], prices[1:]
+    ok = (prev > 0) & (curr > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(ok, curr / np.where(ok, prev, 1.0) - 1.0, 0.0)
+
+
+def _carino(r: np.ndarray) -> np.ndarray:
+    """ln(1 + r) / r, with the r -> 0 limit of 1."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(np.abs(r) > 1e-12, np.log1p(r) / r, 1.0)
+
+
+def _attribution_key(db: Session, start: date, end: date) -> str:
+    return f"attribution_v1:{start}:{end}:{ledger_service.ledger_version(db)}"
+
+
+@cache(ttl=600, key_fn=_attribution_key, tags=[PORTFOLIO_TAG, HISTORY_TAG])
+def compute_attribution(db: Session, start: date, end: date) -> Dict[str, Any]:
+    """Contribution, weight and active return vs VNINDEX for every ticker held in [start, end]."""
+    # Anchor on the last trading day at or before `start`
+    calendar = trading_days(db, start - timedelta(days=10), end)
+    before = [d for d in calendar if d <= start]
+    window = ([before[-1]] if before else []) + [d for d in calendar if d > start]
+    empty = {"start_date": str(start), "end_date": str(end), "benchmark": BENCHMARK, "tickers": []}
+    if len(window) < 2:
+        return empty
+
+    m = build_ledger_matrices(db, window)
+    if not m.tickers:
+        return empty
+
+    values = m.holding_values
+    nav = m.cash + values.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = np.where(nav[:, None] > 0, values / nav[:, None], 0.0)
+
+    r = _simple_returns(np.nan_to_num(m.prices))
+    bench_px = price_matrix(db, [BENCHMARK], m.days)[:, 0]
+    rb = _simple_returns(np.nan_to_num(bench_px)[:, None])[:, 0]
+
+    w_prev = weights[:-1]
+    contrib = w_prev * r
+    active = w_prev * (r - rb[:, None])
+    pnl = m.positions[:-1] * np.diff(np.nan_to_num(m.prices), axis=0)
+    pnl = np.where(m.positions[:-1] != 0, pnl, 0.0)
+
+    port_daily = contrib.sum(axis=1)
+    port_total = float(np.prod(1.0 + port_daily) - 1.0)
+    link = _carino(port_daily) / float(_carino(np.array([port_total]))[0])
+    linked_contrib = (contrib * link[:, None]).sum(axis=0)
+    linked_active = (active * link[:, None]).sum(axis=0)
+
+    # Holding-period returns: compound only the days the ticker was held at the previous close
+    held = m.positions[:-1] > 0
+    ticker_ret = np.exp(np.where(held, np.log1p(r), 0.0).sum(axis=0)) - 1.0
+    bench_ret_held = np.exp(np.where(held, np.log1p(rb)[:, None], 0.0).sum(axis=0)) - 1.0
+    bench_total = float(np.prod(1.0 + rb) - 1.0)
+
+    in_window = (m.positions != 0).any(axis=0)
+    rows: List[Dict[str, Any]] = []
+    for j in np.flatnonzero(in_window):
+        rows.append({
+            "ticker": m.tickers[j],
+            "avg_weight": round(float(w_prev[:, j].mean()) * 100, 4),
+            "end_weight": round(float(weights[-1, j]) * 100, 4),
+            "return": round(float(ticker_ret[j]) * 100, 4),
+            "contribution": round(float(linked_contrib[j]) * 100, 4),
+            "contribution_value": round(float(pnl[:, j].sum()), 2),
+            "benchmark_return": round(float(bench_ret_held[j]) * 100, 4),
+            "active_return": round(float(ticker_ret[j] - bench_ret_held[j]) * 100, 4),
+            "active_contribution": round(float(linked_active[j]) * 100, 4),
+        })
+    rows.sort(key=lambda x: x["contribution"], reverse=True)
+
+    cash_weight = float(m.cash[-1] / nav[-1]) if nav[-1] > 0 else 0.0
+    return {
+        "start_date": str(m.days[0]),
+        "end_date": str(m.days[-1]),
+        "benchmark": BENCHMARK,
+        "portfolio_return": round(port_total * 100, 4),
+        "benchmark_return": round(bench_total * 100, 4),
+        "active_return": round((port_total - bench_total) * 100, 4),
+        "cash_weight": round(cash_weight * 100, 4),
+        "tickers": rows,
+    }
@@ -0,0 +1,129 @@
+# services/cashflow_ledger.py
+"""
+In-memory daily cash-flow ledger with prefix sums.
+
+CashFlow rows are bucketed per calendar day (created_at.date()) into a few signed columns;
+each column keeps a prefix-sum array, so the net flow of any date window is P[hi] - P[lo].
+The ledger is rebuilt only when the table fingerprint (count, max id, sum amount) changes,
+which costs one aggregate query per lookup; other workers' writes are picked up the same way.
+
+The fingerprint assumes cash_flow is append-only: rows are inserted (deposit, withdraw, trade
+settlement, interest) or deleted (undo, reset), never edited. An in-place UPDATE that keeps
+count, max id and the amount total (e.g. a changed created_at, type or description) is not
+detected, so rows must not be edited in place. invalidate() only resets this process's copy.
+"""
+from __future__ import annotations
+
+import threading
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+from services.nav_reconstruction import is_trade_flow
+
+# Column semantics
+NET = "net"            # DEPOSIT - WITHDRAW (all rows, incl. Buy/Sell settlement) - legacy _net_cash_flow
+SIGNED = "signed"      # every type positive except WITHDRAW - legacy _get_flows_map
+EXTERNAL = "external"  # DEPOSIT - WITHDRAW excluding Buy/Sell settlement - investor flows for TWR/XIRR
+
+COLUMNS = (NET, SIGNED, EXTERNAL)
+
+
+class _Ledger:
+    def __init__(self, fingerprint: Tuple, days: np.ndarray, daily: Dict[str, np.ndarray]):
+        self.fingerprint = fingerprint
+        self.days = days
+        self.daily = daily
+        self.prefix = {c: np.concatenate(([0.0], np.cumsum(v))) for c, v in daily.items()}
+
+    def _bounds(self, start: Optional[date], end: Optional[date]) -> Tuple[int, int]:
+        lo = 0 if start is None else int(np.searchsorted(self.days, np.datetime64(start, "D"), side="left"))
+        hi = len(self.days) if end is None else int(np.searchsorted(self.days, np.datetime64(end, "D"), side="right"))
+        return lo, max(lo, hi)
+
+    def window_sum(self, column: str, start: Optional[date], end: Optional[date]) -> float:
+        lo, hi = self._bounds(start, end)
+        p = self.prefix[column]
+        return float(p[hi] - p[lo])
+
+    def daily_slice(self, column: str, start: Optional[date], end: Optional[date]) -> Tuple[np.ndarray, np.ndarray]:
+        lo, hi = self._bounds(start, end)
+        values = self.daily[column][lo:hi]
+        nz = values != 0
+        return self.days[lo:hi][nz], values[nz]
+
+
+_lock = threading.Lock()
+_ledger: Optional[_Ledger] = None
+
+
+def _fingerprint(db: Session) -> Tuple:
+    """Detects inserts and deletes only (cash_flow is append-only, see module docstring)."""
+    count, max_id, total = db.query(
+        func.count(models.CashFlow.id), func.max(models.CashFlow.id), func.sum(models.CashFlow.amount)
+    ).one()
+    return int(count or 0), int(max_id or 0), str(total or 0)
+
+
+def _build(db: Session, fingerprint: Tuple) -> _Ledger:
+    rows = db.query(
+        models.CashFlow.type, models.CashFlow.amount, models.CashFlow.description, models.CashFlow.created_at
+    ).all()
+    rows = [r for r in rows if r.created_at is not None]
+    if not rows:
+        return _Ledger(fingerprint, np.array([], dtype="datetime64[D]"), {c: np.zeros(0) for c in COLUMNS})
+
+    flow_days = np.array([r.created_at.date() for r in rows], dtype="datetime64[D]")
+    days, idx = np.unique(flow_days, return_inverse=True)
+    amount = np.fromiter((float(r.amount or 0) for r in rows), dtype=float, count=len(rows))
+    is_dep = np.fromiter((r.type == models.CashFlowType.DEPOSIT for r in rows), dtype=bool, count=len(rows))
+    is_wd = np.fromiter((r.type == models.CashFlowType.WITHDRAW for r in rows), dtype=bool, count=len(rows))
+    is_trade = np.fromiter((is_trade_flow(r.description) for r in rows), dtype=bool, count=len(rows))
+
+    net = np.where(is_dep, amount, np.where(is_wd, -amount, 0.0))
+    per_row = {
+        NET: net,
+        SIGNED: np.where(is_wd, -amount, amount),
+        EXTERNAL: np.where(is_trade, 0.0, net),
+    }
+    daily = {}
+    for c, v in per_row.items():
+        col = np.zeros(len(days))
+        np.add.at(col, idx, v)
+        daily[c] = col
+    return _Ledger(fingerprint, days, daily)
+
+
+def get_ledger(db: Session) -> _Ledger:
+    """Current ledger; rebuilt from cash_flow only when the fingerprint moved."""
+    global _ledger
+    fp = _fingerprint(db)
+    ledger = _ledger
+    if ledger is not None and ledger.fingerprint == fp:
+        return ledger
+    with _lock:
+        if _ledger is None or _ledger.fingerprint != fp:
+            _ledger = _build(db, fp)
+        return _ledger
+
+
+def invalidate() -> None:
+    global _ledger
+    with _lock:
+        _ledger = None
+
+
+def net_flow(db: Session, start: Optional[date], end: Optional[date] = None, column: str = NET) -> Decimal:
+    """Net flow dated within [start, end] (inclusive, None = open-ended)."""
+    return Decimal(str(round(get_ledger(db).window_sum(column, start, end), 4)))
+
+
+def flows_by_day(db: Session, start: Optional[date], end: Optional[date], column: str = SIGNED) -> Dict[date, Decimal]:
+    """{day: net flow} for days with a non-zero flow in [start, end]."""
+    days, values = get_ledger(db).daily_slice(column, start, end)
+    return {d: Decimal(str(round(v, 4))) for d, v in zip(days.astype(object), values.tolist())}
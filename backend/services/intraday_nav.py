@@ -0,0 +1,190 @@
+# services/intraday_nav.py
+"""
+Intraday NAV curve. DailySnapshot keeps one point per day; this keeps one per minute for today.
+
+Each tick is cash + volumes @ prices over the open holdings, priced from the live snapshot
+(crawler.get_current_prices) with latest_quotes and the average cost as fallbacks. Points are
+written to a per-day Redis hash {minute: nav} (HSET is atomic per field, so workers taking turns
+on the minute lock never overwrite each other's points, and nothing is kept in L1) and served as
+parallel arrays {"t": ["09:15", ...], "nav": [...]}. When the hash is empty (market closed, Redis
+flushed) the curve is rebuilt from intraday_prices for the current holdings.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+import models
+import crawler
+from core.logger import logger
+from core.redis_client import get_redis
+from core.utils import get_vietnam_time
+from services.market.latest_quotes import get_latest_quotes
+
+CACHE_PREFIX = "intraday_nav_v2"
+CACHE_TTL = 2 * 24 * 3600
+
+# Không có Redis (1 worker, dev): giữ series trong process
+_local_points: Dict[str, Dict[str, float]] = {}
+
+# Phiên sáng 9:00-11:30, phiên chiều 13:00-15:00 (gồm ATC)
+SESSIONS: Tuple[Tuple[time, time], ...] = ((time(9, 0), time(11, 30)), (time(13, 0), time(15, 0)))
+
+
+def in_session(now: datetime) -> bool:
+    if now.weekday() >= 5:
+        return False
+    t = now.time()
+    return any(start <= t <= end for start, end in SESSIONS)
+
+
+def cache_key(day: date) -> str:
+    return f"{CACHE_PREFIX}:{day.isoformat()}"
+
+
+def _to_vnd(prices: np.ndarray) -> np.ndarray:
+    # Nguồn intraday/board có thể trả giá theo nghìn đồng (xem DataEngine.normalize_units)
+    return np.where((prices > 0) & (prices < 1000), prices * 1000, prices)
+
+
+def _book(db: Session) -> Tuple[float, List[str], np.ndarray, np.ndarray]:
+    """(cash, tickers, volumes, average prices) of the open holdings."""
+    asset = db.query(models.AssetSummary).first()
+    rows = (
+        db.query(models.TickerHolding.ticker, models.TickerHolding.total_volume, models.TickerHolding.average_price)
+        .filter(models.TickerHolding.total_volume > 0)
+        .order_by(models.TickerHolding.ticker)
+        .all()
+    )
+    cash = float(asset.cash_balance or 0) if asset else 0.0
+    tickers = [r.ticker for r in rows]
+    volumes = np.fromiter((float(r.total_volume or 0) for r in rows), dtype=float, count=len(rows))
+    avg = np.fromiter((float(r.average_price or 0) for r in rows), dtype=float, count=len(rows))
+    return cash, tickers, volumes, avg
+
+
+def _fallback_prices(db: Session, tickers: Sequence[str], avg: np.ndarray, day: date) -> np.ndarray:
+    """Reference price per ticker: last close before `day` from latest_quotes, else average cost."""
+    quotes = get_latest_quotes(db, tickers)
+    ref = np.empty(len(tickers))
+    for i, t in enumerate(tickers):
+        q = quotes.get(t.upper())
+        p = (q.prev_close if q.date >= day else q.close_price) if q else None
+        ref[i] = float(p or 0)
+    ref = _to_vnd(ref)
+    return np.where(ref > 0, ref, avg)
+
+
+def live_nav(db: Session) -> float:
+    """NAV from the live price snapshot: one dot product over the holdings vector."""
+    cash, tickers, volumes, avg = _book(db)
+    if not tickers:
+        return cash
+    try:
+        board = crawler.get_current_prices(tickers)
+    except Exception as e:
+        logger.warning(f"[INTRADAY_NAV] Live prices unavailable: {e}")
+        board = {}
+
+    def _px(info: Any) -> float:
+        if isinstance(info, dict):
+            return float(info.get("price") or info.get("ref") or 0)
+        return float(info or 0)
+
+    live = _to_vnd(np.fromiter((_px(board.get(t)) for t in tickers), dtype=float, count=len(tickers)))
+    if (live <= 0).any():
+        live = np.where(live > 0, live, _fallback_prices(db, tickers, avg, get_vietnam_time().date()))
+    return cash + float(volumes @ live)
+
+
+def _store_points(day: date, points: Dict[str, float]) -> None:
+    key = cache_key(day)
+    r = get_redis()
+    if r is None:
+        _local_points.setdefault(key, {}).update(points)
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.hset(key, mapping={m: repr(v) for m, v in points.items()})
+        pipe.expire(key, CACHE_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"[INTRADAY_NAV] Could not store points for {day}: {e}")
+
+
+def _load_points(day: date) -> Dict[str, float]:
+    key = cache_key(day)
+    r = get_redis()
+    if r is None:
+        return dict(_local_points.get(key, {}))
+    try:
+        return {m: float(v) for m, v in r.hgetall(key).items()}
+    except Exception as e:
+        logger.warning(f"[INTRADAY_NAV] Could not read points for {day}: {e}")
+        return {}
+
+
+def _as_series(day: date, points: Dict[str, float]) -> Dict[str, Any]:
+    minutes = sorted(points)  # "HH:MM" sorts chronologically
+    return {"date": day.isoformat(), "t": minutes, "nav": [points[m] for m in minutes]}
+
+
+def append_point(day: date, minute: str, nav: float) -> None:
+    """Records (minute, nav) for the day; a repeated minute overwrites its point."""
+    _store_points(day, {minute: round(nav, 2)})
+
+
+def rebuild_from_intraday_prices(db: Session, day: date) -> Dict[str, Any]:
+    """
+    Minute curve for `day` from intraday_prices: (minutes x tickers) price matrix, forward-filled
+    from the previous close, times the current volume vector. Trades made during `day` are not
+    replayed, so this is an approximation for days the poller missed.
+    """
+    empty = {"date": day.isoformat(), "t": [], "nav": []}
+    cash, tickers, volumes, avg = _book(db)
+    if not tickers:
+        return empty
+
+    start = datetime.combine(day, time(0, 0))
+    rows = (
+        db.query(models.IntradayPrice.ticker, models.IntradayPrice.timestamp, models.IntradayPrice.price)
+        .filter(
+            models.IntradayPrice.ticker.in_(tickers),
+            models.IntradayPrice.timestamp >= start,
+            models.IntradayPrice.timestamp < start + timedelta(days=1),
+        )
+        .all()
+    )
+    if not rows:
+        return empty
+
+    df = pd.DataFrame(rows, columns=["ticker", "timestamp", "price"])
+    df["minute"] = pd.to_datetime(df["timestamp"]).dt.floor("min")
+    df["price"] = df["price"].astype(float)
+    matrix = df.pivot_table(index="minute", columns="ticker", values="price", aggfunc="last").reindex(columns=tickers)
+    prices = _to_vnd(matrix.ffill().to_numpy(dtype=float))
+    ref = _fallback_prices(db, tickers, avg, day)
+    prices = np.where(np.isnan(prices) | (prices <= 0), ref, prices)
+
+    navs = cash + prices @ volumes
+    return {
+        "date": day.isoformat(),
+        "t": [m.strftime("%H:%M") for m in matrix.index],
+        "nav": np.round(navs, 2).tolist(),
+    }
+
+
+def get_series(db: Session, day: Optional[date] = None) -> Dict[str, Any]:
+    """Today's (or `day`'s) minute NAV series for the sparkline."""
+    day = day or get_vietnam_time().date()
+    points = _load_points(day)
+    if points:
+        return _as_series(day, points)
+    series = rebuild_from_intraday_prices(db, day)
+    if series["t"]:
+        _store_points(day, dict(zip(series["t"], series["nav"])))
+    return series
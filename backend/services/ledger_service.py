@@ -0,0 +1,291 @@
+# services/ledger_service.py
+"""
+Event-sourced trade ledger.
+
+Every money/position change appends a LedgerEvent in the same DB transaction as the write it
+describes. State (cash, total deposited, per-ticker volume + average-cost total) is a pure fold
+over events; LedgerSnapshot rows materialize that fold every LEDGER_SNAPSHOT_EVERY events, so any
+state is the nearest snapshot plus a short replay. Reversals are events too: replay skips the
+reversed event, which makes undo a deterministic rebuild instead of a compensating write.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import desc, func
+from sqlalchemy.orm import Session
+
+import models
+from core.logger import logger
+
+LEDGER_SNAPSHOT_EVERY = int(os.getenv("LEDGER_SNAPSHOT_EVERY", "200"))
+
+_ZERO = Decimal("0")
+
+
+def _dec(x: Any) -> Decimal:
+    if x is None:
+        return _ZERO
+    return x if isinstance(x, Decimal) else Decimal(str(x))
+
+
+@dataclass
+class LedgerState:
+    last_event_id: int = 0
+    cash_balance: Decimal = _ZERO
+    total_deposited: Decimal = _ZERO
+    # ticker -> [volume, total_cost]
+    holdings: Dict[str, List[Decimal]] = field(default_factory=dict)
+
+    def apply(self, ev: models.LedgerEvent) -> None:
+        self.last_event_id = ev.id
+        self.cash_balance += _dec(ev.cash_delta)
+        self.total_deposited += _dec(ev.deposited_delta)
+        vol_delta = _dec(ev.volume_delta)
+        if not ev.ticker or vol_delta == 0:
+            return
+        pos = self.holdings.setdefault(ev.ticker, [_ZERO, _ZERO])
+        if vol_delta > 0:
+            pos[0] += vol_delta
+            pos[1] += _dec(ev.cost_delta)
+        else:
+            cost_delta = _dec(ev.cost_delta)
+            if cost_delta < 0:
+                # Sell with a recorded basis (FIFO / specific lot / average at trade time)
+                pos[1] = max(pos[1] + cost_delta, _ZERO)
+            else:
+                # Older sell events: remove cost at the running average
+                sold = min(-vol_delta, pos[0])
+                if pos[0] > 0:
+                    pos[1] -= pos[1] * sold / pos[0]
+            pos[0] += vol_delta
+        if pos[0] <= 0:
+            self.holdings.pop(ev.ticker, None)
+
+    def average_price(self, ticker: str) -> Decimal:
+        vol, cost = self.holdings.get(ticker, (_ZERO, _ZERO))
+        return cost / vol if vol > 0 else _ZERO
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "last_event_id": self.last_event_id,
+            "cash_balance": float(self.cash_balance),
+            "total_deposited": float(self.total_deposited),
+            "holdings": {
+                t: {"volume": float(v), "total_cost": float(c), "average_price": float(c / v) if v > 0 else 0.0}
+                for t, (v, c) in sorted(self.holdings.items())
+            },
+        }
+
+
+# --- snapshots ---
+def _state_from_snapshot(snap: Optional[models.LedgerSnapshot]) -> LedgerState:
+    if snap is None:
+        return LedgerState()
+    return LedgerState(
+        last_event_id=snap.last_event_id or 0,
+        cash_balance=_dec(snap.cash_balance),
+        total_deposited=_dec(snap.total_deposited),
+        holdings={t: [_dec(v), _dec(c)] for t, (v, c) in (snap.holdings or {}).items()},
+    )
+
+
+def _write_snapshot(db: Session, state: LedgerState) -> models.LedgerSnapshot:
+    snap = models.LedgerSnapshot(
+        last_event_id=state.last_event_id,
+        cash_balance=state.cash_balance,
+        total_deposited=state.total_deposited,
+        holdings={t: [str(v), str(c)] for t, (v, c) in state.holdings.items()},
+    )
+    db.add(snap)
+    return snap
+
+
+def _materialized_state(db: Session, last_event_id: int) -> LedgerState:
+    """Current AssetSummary/TickerHolding rows as a ledger state (bootstrap baseline)."""
+    asset = db.query(models.AssetSummary).first()
+    holdings = db.query(models.TickerHolding).filter(models.TickerHolding.total_volume > 0).all()
+    return LedgerState(
+        last_event_id=last_event_id,
+        cash_balance=_dec(asset.cash_balance) if asset else _ZERO,
+        total_deposited=_dec(asset.total_deposited) if asset else _ZERO,
+        holdings={
+            h.ticker: [_dec(h.total_volume), _dec(h.total_volume) * _dec(h.average_price)] for h in holdings
+        },
+    )
+
+
+def ensure_bootstrap(db: Session) -> bool:
+    """
+    Data written before the ledger existed has no events: the first run snapshots the current
+    materialized state as the replay baseline. Returns True if a baseline was created.
+    """
+    if db.query(models.LedgerSnapshot.id).first():
+        return False
+    last_id = db.query(func.max(models.LedgerEvent.id)).scalar() or 0
+    _write_snapshot(db, _materialized_state(db, last_id))
+    db.commit()
+    logger.info(f"Ledger bootstrap snapshot created at event {last_id}")
+    return True
+
+
+def _nearest_snapshot(db: Session, before_or_at: Optional[int] = None) -> Optional[models.LedgerSnapshot]:
+    q = db.query(models.LedgerSnapshot)
+    if before_or_at is not None:
+        q = q.filter(models.LedgerSnapshot.last_event_id <= before_or_at)
+    return q.order_by(desc(models.LedgerSnapshot.last_event_id), desc(models.LedgerSnapshot.id)).first()
+
+
+def _reversed_ids(db: Session) -> Set[int]:
+    rows = db.query(models.LedgerEvent.reverses_event_id).filter(models.LedgerEvent.reverses_event_id.isnot(None)).all()
+    return {r[0] for r in rows}
+
+
+def replay(db: Session, upto_event_id: Optional[int] = None, exclude: Iterable[int] = ()) -> LedgerState:
+    """State after event `upto_event_id` (default: latest), from the nearest snapshot forward."""
+    # Snapshots never contain reversed events (reverse_event drops them), but ad-hoc
+    # exclusions must start from a snapshot taken before the first excluded event
+    exclude = set(exclude)
+    base_cap = upto_event_id
+    if exclude:
+        base_cap = min(exclude) - 1 if base_cap is None else min(base_cap, min(exclude) - 1)
+    state = _state_from_snapshot(_nearest_snapshot(db, base_cap))
+    skip = _reversed_ids(db) | exclude
+
+    q = db.query(models.LedgerEvent).filter(models.LedgerEvent.id > state.last_event_id)
+    if upto_event_id is not None:
+        q = q.filter(models.LedgerEvent.id <= upto_event_id)
+    for ev in q.order_by(models.LedgerEvent.id).all():
+        # A REVERSAL that points at an event only marks it skipped; one without a target
+        # compensates a write that predates the ledger and carries its own deltas
+        if ev.id in skip or (ev.event_type == models.LedgerEventType.REVERSAL and ev.reverses_event_id is not None):
+            state.last_event_id = ev.id
+            continue
+        state.apply(ev)
+    return state
+
+
+def ledger_version(db: Session) -> int:
+    """Monotonic version of the ledger (last event id); cache keys derived from holdings use it."""
+    return db.query(func.max(models.LedgerEvent.id)).scalar() or 0
+
+
+def state_at(db: Session, at: datetime) -> LedgerState:
+    """Historical state as of a wall-clock time (audit)."""
+    last_id = db.query(func.max(models.LedgerEvent.id)).filter(models.LedgerEvent.created_at <= at).scalar() or 0
+    return replay(db, upto_event_id=last_id)
+
+
+# --- writes ---
+def record(
+    db: Session,
+    event_type: models.LedgerEventType,
+    *,
+    cash_delta: Any = 0,
+    deposited_delta: Any = 0,
+    ticker: Optional[str] = None,
+    volume_delta: Any = 0,
+    cost_delta: Any = 0,
+    stock_transaction: Optional[models.StockTransaction] = None,
+    cash_flow: Optional[models.CashFlow] = None,
+    reverses_event_id: Optional[int] = None,
+    description: Optional[str] = None,
+) -> models.LedgerEvent:
+    """
+    Appends an event next to the caller's pending writes (flushes to obtain linked ids).
+    The caller commits; snapshots are taken every LEDGER_SNAPSHOT_EVERY events.
+    """
+    db.flush()
+    ev = models.LedgerEvent(
+        event_type=event_type,
+        ticker=ticker,
+        cash_delta=_dec(cash_delta),
+        deposited_delta=_dec(deposited_delta),
+        volume_delta=_dec(volume_delta),
+        cost_delta=_dec(cost_delta),
+        stock_transaction_id=stock_transaction.id if stock_transaction is not None else None,
+        cash_flow_id=cash_flow.id if cash_flow is not None else None,
+        reverses_event_id=reverses_event_id,
+        description=description,
+    )
+    db.add(ev)
+    db.flush()
+
+    last = _nearest_snapshot(db)
+    if last is None:
+        # First event ever: the materialized rows already include it
+        _write_snapshot(db, _materialized_state(db, ev.id))
+    elif ev.id - (last.last_event_id or 0) >= LEDGER_SNAPSHOT_EVERY:
+        _write_snapshot(db, replay(db))
+    return ev
+
+
+def materialize(db: Session, state: LedgerState, tickers: Iterable[str]) -> None:
+    """Writes a replayed state back into AssetSummary and the given TickerHolding rows."""
+    asset = db.query(models.AssetSummary).first()
+    if asset:
+        asset.cash_balance = state.cash_balance
+        asset.total_deposited = state.total_deposited
+    for ticker in tickers:
+        holding = db.query(models.TickerHolding).filter_by(ticker=ticker).first()
+        vol, cost = state.holdings.get(ticker, (_ZERO, _ZERO))
+        if vol <= 0:
+            if holding:
+                db.delete(holding)
+            continue
+        if holding is None:
+            holding = models.TickerHolding(ticker=ticker)
+            db.add(holding)
+        holding.total_volume = vol
+        holding.available_volume = vol
+        holding.average_price = cost / vol
+
+
+def reverse_event(db: Session, ev: models.LedgerEvent, description: Optional[str] = None) -> LedgerState:
+    """
+    Appends a REVERSAL for `ev`, drops snapshots that already folded it in, and rebuilds
+    cash + the affected holding by replaying without it. The caller deletes linked rows and commits.
+    """
+    record(db, models.LedgerEventType.REVERSAL, ticker=ev.ticker, reverses_event_id=ev.id, description=description)
+    db.query(models.LedgerSnapshot).filter(models.LedgerSnapshot.last_event_id >= ev.id).delete(synchronize_session=False)
+    state = replay(db, exclude=[ev.id])
+    materialize(db, state, [ev.ticker] if ev.ticker else [])
+    _write_snapshot(db, state)
+    return state
+
+
+def last_open_event(db: Session, event_type: models.LedgerEventType) -> Optional[models.LedgerEvent]:
+    """Most recent event of `event_type` that has not been reversed."""
+    reversed_q = db.query(models.LedgerEvent.reverses_event_id).filter(models.LedgerEvent.reverses_event_id.isnot(None))
+    return (
+        db.query(models.LedgerEvent)
+        .filter(models.LedgerEvent.event_type == event_type, ~models.LedgerEvent.id.in_(reversed_q))
+        .order_by(desc(models.LedgerEvent.id))
+        .first()
+    )
+
+
+def list_events(db: Session, limit: int = 100, before_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    q = db.query(models.LedgerEvent)
+    if before_id is not None:
+        q = q.filter(models.LedgerEvent.id < before_id)
+    rows = q.order_by(desc(models.LedgerEvent.id)).limit(limit).all()
+    return [
+        {
+            "id": e.id,
+            "type": e.event_type.value if e.event_type else None,
+            "ticker": e.ticker,
+            "cash_delta": float(e.cash_delta or 0),
+            "volume_delta": float(e.volume_delta or 0),
+            "stock_transaction_id": e.stock_transaction_id,
+            "cash_flow_id": e.cash_flow_id,
+            "reverses_event_id": e.reverses_event_id,
+            "description": e.description,
+            "created_at": e.created_at.isoformat() if e.created_at else None,
+        }
+        for e in rows
+    ]
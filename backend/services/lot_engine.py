@@ -0,0 +1,272 @@
+# services/lot_engine.py
+"""
+Tax-lot engine. Lots are derived from stock_transactions (each BUY row is a lot, lot_id = its id)
+and kept per ticker in compact preallocated arrays; SELL rows consume them FIFO, or from the lot
+named in stock_transactions.lot_id (specific-lot sells).
+
+Cost basis includes the buy fee (unit_cost = BUY total_value / volume), matching
+TickerHolding.average_price; proceeds are SELL total_value (net of fee and tax).
+Both views are replayed side by side: FIFO/specific-lot and weighted average cost.
+"""
+from __future__ import annotations
+
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+from core.exceptions import ValidationError
+
+LOT_METHOD_AVG = "AVG"
+LOT_METHOD_FIFO = "FIFO"
+LOT_METHOD_SPECIFIC = "SPECIFIC"
+LOT_METHODS = (LOT_METHOD_AVG, LOT_METHOD_FIFO, LOT_METHOD_SPECIFIC)
+
+_EPS = 1e-9
+
+
+class TickerLots:
+    """Open lots of one ticker as parallel arrays; rows [head:size) may still be open."""
+
+    __slots__ = (
+        "ticker", "lot_ids", "buy_dates", "remaining", "unit_cost", "head", "size",
+        "avg_volume", "avg_cost_total", "realized_fifo", "realized_avg", "unmatched_volume",
+    )
+
+    def __init__(self, ticker: str, capacity: int):
+        self.ticker = ticker
+        self.lot_ids = np.zeros(capacity, dtype=np.int64)
+        self.buy_dates = np.zeros(capacity, dtype="datetime64[D]")
+        self.remaining = np.zeros(capacity)
+        self.unit_cost = np.zeros(capacity)
+        self.head = 0
+        self.size = 0
+        self.avg_volume = 0.0
+        self.avg_cost_total = 0.0
+        self.realized_fifo = 0.0
+        self.realized_avg = 0.0
+        self.unmatched_volume = 0.0
+
+    # --- replay ---
+    def buy(self, lot_id: int, day: date, volume: float, total_cost: float) -> None:
+        if self.size == len(self.lot_ids):
+            self._grow()
+        i = self.size
+        self.lot_ids[i] = lot_id
+        self.buy_dates[i] = np.datetime64(day, "D")
+        self.remaining[i] = volume
+        self.unit_cost[i] = total_cost / volume if volume else 0.0
+        self.size += 1
+        self.avg_volume += volume
+        self.avg_cost_total += total_cost
+
+    def sell(self, volume: float, proceeds: float, lot_id: Optional[int] = None) -> float:
+        """Consumes lots, updates both realized views and returns the FIFO/specific cost basis."""
+        take = self.allocate(volume, lot_id)
+        basis = float(take @ self.unit_cost[self.head:self.size])
+        self.remaining[self.head:self.size] -= take
+        matched = float(take.sum())
+        self.unmatched_volume += max(volume - matched, 0.0)
+        while self.head < self.size and self.remaining[self.head] <= _EPS:
+            self.head += 1
+
+        avg_basis = self.avg_cost_basis(volume)
+        self.realized_fifo += proceeds - basis
+        self.realized_avg += proceeds - avg_basis
+        self.avg_cost_total -= avg_basis
+        self.avg_volume -= volume
+        if self.avg_volume <= _EPS:
+            self.avg_volume = 0.0
+            self.avg_cost_total = 0.0
+        return basis
+
+    def _grow(self) -> None:
+        cap = max(8, len(self.lot_ids) * 2)
+        for name in ("lot_ids", "buy_dates", "remaining", "unit_cost"):
+            arr = getattr(self, name)
+            new = np.zeros(cap, dtype=arr.dtype)
+            new[: self.size] = arr[: self.size]
+            setattr(self, name, new)
+
+    # --- queries (no mutation) ---
+    def allocate(self, volume: float, lot_id: Optional[int] = None) -> np.ndarray:
+        """Volume taken from each open lot [head:size): the named lot first, then FIFO."""
+        rem = self.remaining[self.head:self.size].copy()
+        take = np.zeros_like(rem)
+        if lot_id is not None:
+            hit = np.flatnonzero(self.lot_ids[self.head:self.size] == lot_id)
+            if hit.size:
+                j = hit[0]
+                take[j] = min(volume, rem[j])
+                rem[j] -= take[j]
+                volume -= take[j]
+        if volume > _EPS:
+            before = np.cumsum(rem) - rem
+            take += np.clip(volume - before, 0.0, rem)
+        return take
+
+    def avg_cost_basis(self, volume: float) -> float:
+        if self.avg_volume <= _EPS:
+            return 0.0
+        return volume * self.avg_cost_total / self.avg_volume
+
+    def open_slice(self) -> slice:
+        return slice(self.head, self.size)
+
+    @property
+    def open_volume(self) -> float:
+        return float(self.remaining[self.open_slice()].sum())
+
+    def to_dict(self, as_of: Optional[date] = None) -> Dict[str, Any]:
+        s = self.open_slice()
+        open_mask = self.remaining[s] > _EPS
+        as_of_d = np.datetime64(as_of or date.today(), "D")
+        ids, days = self.lot_ids[s][open_mask], self.buy_dates[s][open_mask]
+        rem, cost = self.remaining[s][open_mask], self.unit_cost[s][open_mask]
+        held = (as_of_d - days).astype(int)
+        fifo_cost = float(rem @ cost)
+        return {
+            "ticker": self.ticker,
+            "open_volume": float(rem.sum()),
+            "fifo": {
+                "cost_basis": fifo_cost,
+                "unit_cost": fifo_cost / float(rem.sum()) if rem.sum() > _EPS else 0.0,
+                "realized_profit": self.realized_fifo,
+            },
+            "average_cost": {
+                "cost_basis": self.avg_cost_total,
+                "unit_cost": self.avg_cost_total / self.avg_volume if self.avg_volume > _EPS else 0.0,
+                "realized_profit": self.realized_avg,
+            },
+            "unmatched_sell_volume": self.unmatched_volume,
+            "lots": [
+                {
+                    "lot_id": int(i),
+                    "buy_date": str(d),
+                    "remaining_volume": float(r),
+                    "unit_cost": float(c),
+                    "holding_days": int(h),
+                }
+                for i, d, r, c, h in zip(ids, days, rem, cost, held)
+            ],
+        }
+
+
+def _day(ts: Any) -> date:
+    return ts.date() if isinstance(ts, datetime) else ts
+
+
+def replay(rows: Sequence[Any]) -> Dict[str, TickerLots]:
+    """
+    Bulk replay of StockTransaction-like rows (id, ticker, type, volume, total_value,
+    transaction_date, lot_id), already ordered by (transaction_date, id).
+    """
+    buys_per_ticker: Dict[str, int] = {}
+    for r in rows:
+        if r.type == models.TransactionType.BUY:
+            t = r.ticker.upper()
+            buys_per_ticker[t] = buys_per_ticker.get(t, 0) + 1
+
+    book: Dict[str, TickerLots] = {}
+    for r in rows:
+        t = r.ticker.upper()
+        lots = book.get(t)
+        if lots is None:
+            lots = book[t] = TickerLots(t, buys_per_ticker.get(t, 0) or 1)
+        vol = float(r.volume or 0)
+        if r.type == models.TransactionType.BUY:
+            lots.buy(r.id, _day(r.transaction_date), vol, float(r.total_value or 0))
+        else:
+            lots.sell(vol, float(r.total_value or 0), r.lot_id)
+    return book
+
+
+def _tx_query(db: Session):
+    st = models.StockTransaction
+    return db.query(st.id, st.ticker, st.type, st.volume, st.total_value, st.transaction_date, st.lot_id).order_by(
+        st.transaction_date, st.id
+    )
+
+
+# Per-process cache: ticker -> (fingerprint, lots). Fingerprint = (count, max id) of that ticker's rows.
+_lock = threading.Lock()
+_cache: Dict[str, Tuple[Tuple[int, int], TickerLots]] = {}
+
+
+def get_ticker_lots(db: Session, ticker: str) -> TickerLots:
+    ticker = ticker.upper()
+    st = models.StockTransaction
+    count, max_id = db.query(func.count(st.id), func.max(st.id)).filter(st.ticker == ticker).one()
+    fp = (int(count or 0), int(max_id or 0))
+    hit = _cache.get(ticker)
+    if hit and hit[0] == fp:
+        return hit[1]
+    lots = replay(_tx_query(db).filter(st.ticker == ticker).all()).get(ticker) or TickerLots(ticker, 1)
+    with _lock:
+        _cache[ticker] = (fp, lots)
+    return lots
+
+
+def get_all_lots(db: Session) -> Dict[str, TickerLots]:
+    """Replays every ticker in one query (reports / bulk realized PnL)."""
+    book = replay(_tx_query(db).all())
+    return dict(sorted(book.items()))
+
+
+def invalidate(ticker: Optional[str] = None) -> None:
+    with _lock:
+        if ticker is None:
+            _cache.clear()
+        else:
+            _cache.pop(ticker.upper(), None)
+
+
+def covers_holding(db: Session, ticker: str, holding_volume: float) -> bool:
+    """True when the open lots account for the whole holding (no shares that predate their BUY rows)."""
+    return abs(get_ticker_lots(db, ticker).open_volume - holding_volume) <= 1e-6
+
+
+def default_method(db: Session, ticker: str, holding_volume: float) -> str:
+    """FIFO when the open lots are the whole holding; AVG for positions that predate their BUY rows."""
+    return LOT_METHOD_FIFO if covers_holding(db, ticker, holding_volume) else LOT_METHOD_AVG
+
+
+def unit_cost_after_sell(db: Session, ticker: str, volume: float, lot_id: Optional[int] = None) -> float:
+    """Average unit cost of the lots still open after selling `volume` (named lot first, then FIFO)."""
+    lots = get_ticker_lots(db, ticker)
+    s = lots.open_slice()
+    left = np.maximum(lots.remaining[s] - lots.allocate(volume, lot_id), 0.0)
+    vol = float(left.sum())
+    return float(left @ lots.unit_cost[s]) / vol if vol > _EPS else 0.0
+
+
+def plan_sell(db: Session, ticker: str, volume: float, method: str, lot_id: Optional[int] = None) -> Tuple[float, Optional[int]]:
+    """
+    Cost basis for selling `volume` of `ticker` under `method`, without mutating anything.
+    Returns (cost_basis, lot_id to store on the SELL row).
+    """
+    lots = get_ticker_lots(db, ticker)
+    if method == LOT_METHOD_AVG:
+        return lots.avg_cost_basis(volume), None
+
+    if method == LOT_METHOD_SPECIFIC:
+        if lot_id is None:
+            raise ValidationError("lot_id is required for SPECIFIC lot sells.")
+        s = lots.open_slice()
+        hit = np.flatnonzero(lots.lot_ids[s] == lot_id)
+        if not hit.size or lots.remaining[s][hit[0]] <= _EPS:
+            raise ValidationError(f"Lot {lot_id} is not an open lot of {ticker}.")
+        available = float(lots.remaining[s][hit[0]])
+        if volume > available + _EPS:
+            raise ValidationError(f"Lot {lot_id} only has {available:,.0f} shares left.")
+    else:
+        lot_id = None
+
+    take = lots.allocate(volume, lot_id)
+    if float(take.sum()) < volume - _EPS:
+        raise ValidationError(f"Open lots of {ticker} only cover {float(take.sum()):,.0f} shares.")
+    return float(take @ lots.unit_cost[lots.open_slice()]), lot_id
@@ -1,6 +1,9 @@
 
-from typing import Any, Optional
-from core.redis_client import cache_get, cache_set, cache_delete, get_redis
+from typing import Any, Iterable, Optional
+from core.cache import HISTORY_TAG
+from core.redis_client import (
+    cache_get, cache_set, cache_get_many, cache_set_many, cache_delete, get_redis, invalidate_tags,
+)
 
 redis_client = get_redis()
 REDIS_AVAILABLE = redis_client is not None
@@ -8,11 +11,60 @@ REDIS_AVAILABLE = redis_client is not None
 def mem_get(key: str) -> Optional[Any]:
     return cache_get(key)
 
-def mem_set(key: str, val: Any, ttl: int) -> None:
-    cache_set(key, val, ttl)
+def mem_set(key: str, val: Any, ttl: int, tags: Optional[Iterable[str]] = None) -> None:
+    cache_set(key, val, ttl, tags=tags)
+
+def mem_get_many(keys: Iterable[str]) -> dict[str, Any]:
+    """RAM trước, còn thiếu thì 1 lệnh MGET tới Redis."""
+    return cache_get_many(keys)
+
+def mem_set_many(items: dict[str, Any], ttl: int, tags: Optional[dict[str, Iterable[str]]] = None) -> None:
+    cache_set_many(items, ttl, tags=tags)
+
+# Metadata danh mục chứng khoán (sec_meta_v1:*); sync securities invalidate tag này
+SECURITIES_TAG = "securities"
+
+def ticker_tags(ticker: str) -> list[str]:
+    """Tag cho dữ liệu theo mã (sparkline, ratios, metadata...)."""
+    return [f"ticker:{ticker.upper()}"]
+
+def history_tags(ticker: str) -> list[str]:
+    """Tag cho dữ liệu suy ra từ historical_prices của một mã; sync lịch sử sẽ invalidate."""
+    return [f"ticker:{ticker.upper()}", f"history:{ticker.upper()}"]
+
+def watchlist_detail_cache_key(watchlist_id: int) -> str:
+    return f"wl_detail_v1:{watchlist_id}"
+
+def invalidate_history(*tickers: str) -> None:
+    """Sau khi ghi historical_prices: bỏ cache theo mã (trending, sparkline) và các chart tổng hợp."""
+    invalidate_tags(*(f"history:{t.upper()}" for t in tickers if t), HISTORY_TAG)
+
+def watchlist_tag(watchlist_id: int) -> str:
+    return f"watchlist:{watchlist_id}"
+
+WATCHLIST_ACCESS_KEY = "wl_access"
+
+def record_watchlist_access(watchlist_id: int) -> None:
+    """Đếm số lần mở watchlist (Redis ZSET) để job warm-up ưu tiên watchlist hay dùng."""
+    r = get_redis()
+    if not r:
+        return
+    try:
+        r.zincrby(WATCHLIST_ACCESS_KEY, 1, str(watchlist_id))
+    except Exception:
+        pass
+
+def watchlist_access_scores() -> dict[int, float]:
+    r = get_redis()
+    if not r:
+        return {}
+    try:
+        return {int(m): float(sc) for m, sc in r.zrevrange(WATCHLIST_ACCESS_KEY, 0, -1, withscores=True)}
+    except Exception:
+        return {}
 
 def invalidate_watchlist_detail_cache(watchlist_id: int):
     """Xóa cache chi tiết của một watchlist (dùng khi thêm/xóa mã)"""
-    cache_key = f"wl_detail_v1:{watchlist_id}"
-    cache_delete(cache_key)
+    invalidate_tags(watchlist_tag(watchlist_id))
+    cache_delete(watchlist_detail_cache_key(watchlist_id))
     print(f"[CACHE] Đã xóa cache cho watchlist {watchlist_id}")
@@ -8,7 +8,7 @@ from sqlalchemy.orm import Session
 
 import models
 from core.db import SessionLocal
-from services.market.cache import mem_get, mem_set
+from services.market.cache import history_tags, mem_get, mem_get_many, mem_set, mem_set_many
 
 from core.logger import logger
 from adapters import vci_adapter, vnstock_adapter
@@ -61,7 +61,32 @@ def _get_intraday_from_db(db: Session, ticker: str) -> list[dict]:
         })
     return result
 
+# Watermark per ticker: (session_date, last persisted ts, (price, volume) at that ts)
+_INTRADAY_WATERMARK: dict[str, tuple[date, datetime, tuple[Decimal, Decimal]]] = {}
+
+def _load_intraday_watermark(db: Session, ticker: str, session_date: date):
+    start_dt = datetime.combine(session_date, time(0, 0))
+    end_dt = datetime.combine(session_date, time(23, 59, 59))
+    row = (
+        db.query(models.IntradayPrice.timestamp, models.IntradayPrice.price, models.IntradayPrice.volume)
+        .filter(
+            models.IntradayPrice.ticker == ticker,
+            models.IntradayPrice.timestamp >= start_dt,
+            models.IntradayPrice.timestamp <= end_dt,
+        )
+        .order_by(models.IntradayPrice.timestamp.desc())
+        .first()
+    )
+    if not row:
+        return None
+    return (session_date, row.timestamp, (Decimal(str(row.price)), Decimal(str(row.volume or 0))))
+
 def _save_intraday_session(db: Session, ticker: str, points: list[dict]) -> None:
+    """
+    Append-only intraday persistence.
+    Only minutes after the last persisted timestamp (plus that minute itself if its
+    price/volume changed) are written, as one batched INSERT ... ON CONFLICT DO UPDATE.
+    """
     if not points:
         return
 
@@ -70,28 +95,51 @@ def _save_intraday_session(db: Session, ticker: str, points: list[dict]) -> None
         return
 
     session_date = datetime.fromtimestamp(first_ts).date()
-    start_dt = datetime.combine(session_date, time(0, 0))
-    end_dt = datetime.combine(session_date, time(23, 59, 59))
 
-    db.query(models.IntradayPrice).filter(
-        models.IntradayPrice.ticker == ticker,
-        models.IntradayPrice.timestamp >= start_dt,
-        models.IntradayPrice.timestamp <= end_dt,
-    ).delete(synchronize_session=False)
+    mark = _INTRADAY_WATERMARK.get(ticker)
+    if not mark or mark[0] != session_date:
+        mark = _load_intraday_watermark(db, ticker, session_date)
+
+    last_ts = mark[1] if mark else None
+    last_val = mark[2] if mark else None
 
+    rows = {}
     for p in points:
         ts = p.get("timestamp")
         price = p.get("p")
         if not ts or price is None:
             continue
         ts_dt = datetime.fromtimestamp(ts)
-        db.add(models.IntradayPrice(
-            ticker=ticker,
-            timestamp=ts_dt,
-            price=Decimal(str(price)),
-            volume=Decimal(str(p.get("v") or 0)),
-        ))
-    db.commit()
+        val = (Decimal(str(price)), Decimal(str(p.get("v") or 0)))
+        if last_ts is not None:
+            if ts_dt < last_ts:
+                continue
+            if ts_dt == last_ts and val == last_val:
+                continue
+        rows[ts_dt] = {"ticker": ticker, "timestamp": ts_dt, "price": val[0], "volume": val[1]}
+
+    if not rows:
+        if mark:
+            _INTRADAY_WATERMARK[ticker] = mark
+        return
+
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+    stmt = pg_insert(models.IntradayPrice.__table__).values(list(rows.values()))
+    stmt = stmt.on_conflict_do_update(
+        constraint="_ticker_ts_uc",
+        set_={"price": stmt.excluded.price, "volume": stmt.excluded.volume},
+    )
+    try:
+        db.execute(stmt)
+        db.commit()
+    except Exception:
+        db.rollback()
+        _INTRADAY_WATERMARK.pop(ticker, None)
+        raise
+
+    newest = max(rows)
+    _INTRADAY_WATERMARK[ticker] = (session_date, newest, (rows[newest]["price"], rows[newest]["volume"]))
 
 def get_trending_indicator(ticker: str, db: Session, background_tasks: Optional[BackgroundTasks] = None) -> dict:
     """
@@ -142,7 +190,7 @@ def get_trending_indicator(ticker: str, db: Session, background_tasks: Optional[
     result = {"trend": trend, "change_pct": round(change_pct, 2), "needs_sync": needs_sync}
     
     # 3. Save to Cache (RAM + Redis) with 15m TTL (900s)
-    mem_set(cache_key, result, 900)
+    mem_set(cache_key, result, 900, tags=history_tags(ticker))
     return result
 
 def get_trending_indicators_batch(tickers: list[str], db: Session, background_tasks: Optional[BackgroundTasks] = None) -> dict[str, dict]:
@@ -153,9 +201,10 @@ def get_trending_indicators_batch(tickers: list[str], db: Session, background_ta
     results = {}
     missing_tickers = []
     
-    # 1. Check Cache First
+    # 1. Check Cache First (RAM -> 1 lệnh MGET cho phần còn thiếu)
+    cached_map = mem_get_many(f"trending:{ticker}" for ticker in tickers)
     for ticker in tickers:
-        cached = mem_get(f"trending:{ticker}")
+        cached = cached_map.get(f"trending:{ticker}")
         if cached:
             results[ticker] = cached
         else:
@@ -169,6 +218,7 @@ def get_trending_indicators_batch(tickers: list[str], db: Session, background_ta
     # but for accuracy of "last 5 sessions", sequential limit queries is simplest and safe enough 
     # since session overhead is removed.
     
+    fresh: dict[str, dict] = {}
     for ticker in missing_tickers:
         prices = (
             db.query(models.HistoricalPrice)
@@ -202,8 +252,9 @@ def get_trending_indicators_batch(tickers: list[str], db: Session, background_ta
         
         res_obj = {"trend": trend, "change_pct": round(change_pct, 2)}
         results[ticker] = res_obj
-        mem_set(f"trending:{ticker}", res_obj, 900)
-        
+        fresh[f"trending:{ticker}"] = res_obj
+
+    mem_set_many(fresh, 900, tags={k: history_tags(k.split(":", 1)[1]) for k in fresh})
     return results
 
 def _process_single_ticker(t: str, p_info: dict, sec_info: dict | None = None, trending_info: dict | None = None) -> dict:
@@ -0,0 +1,135 @@
+
+from __future__ import annotations
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable
+
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+import models
+from core.logger import logger
+
+_LQ = models.LatestQuote.__table__
+_HP = models.HistoricalPrice
+
+
+def record_quote(db: Session, ticker: str, d: date, close: Decimal, volume: Decimal, value: Decimal) -> None:
+    """
+    Incrementally folds one daily bar into `latest_quotes` (single UPSERT, caller commits).
+    - Same date as stored row  -> refresh close/volume/value (intraday updates).
+    - Newer date               -> stored close rolls into prev_close.
+    - Older date (backfill)    -> ignored.
+    On first insert the previous close is looked up once from historical_prices.
+    """
+    ticker = (ticker or "").upper().strip()
+    if not ticker or d is None:
+        return
+
+    prev_subq = (
+        select(_HP.close_price)
+        .where(_HP.ticker == ticker, _HP.date < d)
+        .order_by(_HP.date.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    stmt = pg_insert(_LQ).values(
+        ticker=ticker,
+        date=d,
+        close_price=close,
+        prev_close=prev_subq,
+        volume=volume,
+        value=value,
+        updated_at=datetime.now(),
+    )
+    ex = stmt.excluded
+    newer = ex.date > _LQ.c.date
+    not_older = ex.date >= _LQ.c.date
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[_LQ.c.ticker],
+        set_={
+            "prev_close": case((newer, _LQ.c.close_price), else_=_LQ.c.prev_close),
+            "close_price": case((not_older, ex.close_price), else_=_LQ.c.close_price),
+            "volume": case((not_older, ex.volume), else_=_LQ.c.volume),
+            "value": case((not_older, ex.value), else_=_LQ.c.value),
+            "date": func.greatest(ex.date, _LQ.c.date),
+            "updated_at": ex.updated_at,
+        },
+    )
+    db.execute(stmt)
+
+
+def refresh_latest_quotes(db: Session, tickers: Iterable[str]) -> int:
+    """
+    Recomputes `latest_quotes` for the given tickers from historical_prices in one
+    set-based statement (ROW_NUMBER window, top-2 bars per ticker). Used after batch
+    history syncs where many bars land at once. Caller commits.
+    """
+    symbols = sorted({(t or "").upper().strip() for t in tickers if t})
+    if not symbols:
+        return 0
+
+    rn = func.row_number().over(partition_by=_HP.ticker, order_by=_HP.date.desc()).label("rn")
+    ranked = (
+        select(_HP.ticker, _HP.date, _HP.close_price, _HP.volume, _HP.value, rn)
+        .where(_HP.ticker.in_(symbols))
+        .subquery()
+    )
+    prev_close = func.max(case((ranked.c.rn == 2, ranked.c.close_price)))
+    src = (
+        select(
+            ranked.c.ticker,
+            func.max(case((ranked.c.rn == 1, ranked.c.date))).label("date"),
+            func.max(case((ranked.c.rn == 1, ranked.c.close_price))).label("close_price"),
+            prev_close.label("prev_close"),
+            func.max(case((ranked.c.rn == 1, ranked.c.volume))).label("volume"),
+            func.max(case((ranked.c.rn == 1, ranked.c.value))).label("value"),
+            func.now().label("updated_at"),
+        )
+        .where(ranked.c.rn <= 2)
+        .group_by(ranked.c.ticker)
+    )
+    stmt = pg_insert(_LQ).from_select(
+        ["ticker", "date", "close_price", "prev_close", "volume", "value", "updated_at"], src
+    )
+    ex = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[_LQ.c.ticker],
+        set_={
+            "date": ex.date,
+            "close_price": ex.close_price,
+            "prev_close": ex.prev_close,
+            "volume": ex.volume,
+            "value": ex.value,
+            "updated_at": ex.updated_at,
+        },
+    )
+    res = db.execute(stmt)
+    return res.rowcount or 0
+
+
+def get_latest_quotes(db: Session, tickers: Iterable[str]) -> dict[str, models.LatestQuote]:
+    """
+    Primary-key lookup of latest/previous close for several tickers.
+    Tickers never materialized yet (fresh table) are rebuilt once from history.
+    """
+    symbols = [(t or "").upper().strip() for t in tickers if t]
+    if not symbols:
+        return {}
+
+    rows = db.query(models.LatestQuote).filter(models.LatestQuote.ticker.in_(symbols)).all()
+    quotes = {r.ticker: r for r in rows}
+
+    missing = [t for t in symbols if t not in quotes]
+    if missing:
+        try:
+            if refresh_latest_quotes(db, missing):
+                db.commit()
+                rows = db.query(models.LatestQuote).filter(models.LatestQuote.ticker.in_(missing)).all()
+                quotes.update({r.ticker: r for r in rows})
+        except Exception as e:
+            db.rollback()
+            logger.debug(f"latest_quotes self-heal failed for {missing}: {e}")
+
+    return quotes
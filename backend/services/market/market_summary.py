@@ -14,6 +14,7 @@ from services.market.cache import mem_get, mem_set
 from services.market.data_processor import (
     _vn_now, _is_market_open, _get_intraday_from_db, _save_intraday_session
 )
+from services.market.latest_quotes import get_latest_quotes, record_quote
 from adapters.vci_adapter import get_intraday_sparkline
 
 def _process_market_row(row: Any, index_name: str, db: Session, vps_data: dict = None) -> Optional[dict]:
@@ -73,13 +74,18 @@ def _process_market_row(row: Any, index_name: str, db: Session, vps_data: dict =
         if price <= 0 or ref <= 0:
             return None
 
+        # Latest stored bar (PK lookup on latest_quotes), fetched at most once per row
+        _latest = []
+        def latest_quote():
+            if not _latest:
+                _latest.append(get_latest_quotes(db, [index_name]).get(index_name))
+            return _latest[0]
+
         # Determine value fallback if still 0
         if value <= 0:
-            latest_hist = db.query(models.HistoricalPrice).filter(
-                models.HistoricalPrice.ticker == index_name
-            ).order_by(models.HistoricalPrice.date.desc()).first()
+            latest_hist = latest_quote()
             if latest_hist:
-                if latest_hist.value > 0:
+                if latest_hist.value and latest_hist.value > 0:
                     # Historical value is usually in VND, convert to Billions
                     value = float(latest_hist.value) / (1e9 if latest_hist.value > 1e6 else 1)
                 if volume <= 0:
@@ -100,9 +106,7 @@ def _process_market_row(row: Any, index_name: str, db: Session, vps_data: dict =
                 fallback_date = None
                 fallback_close = None
                 if index_name == "VNINDEX":
-                    latest_hist = db.query(models.HistoricalPrice).filter(
-                        models.HistoricalPrice.ticker == index_name
-                    ).order_by(models.HistoricalPrice.date.desc()).first()
+                    latest_hist = latest_quote()
                     if latest_hist:
                         fallback_date = latest_hist.date.strftime("%Y-%m-%d")
                         fallback_close = float(latest_hist.close_price)
@@ -144,6 +148,8 @@ def _process_market_row(row: Any, index_name: str, db: Session, vps_data: dict =
                     existing.close_price = Decimal(str(price))
                     existing.volume = Decimal(str(volume))
                     existing.value = Decimal(str(value))
+                db.flush()
+                record_quote(db, index_name, today_d, Decimal(str(price)), Decimal(str(volume)), Decimal(str(value)))
                 db.commit()
                 logger.info(f"[DB] Saved {index_name} to HistoricalPrice: {price:.2f}")
             except Exception as db_e:
@@ -169,85 +175,35 @@ def _process_market_row(row: Any, index_name: str, db: Session, vps_data: dict =
 def _get_market_fallback(db: Session, indices: list[str]) -> list[dict]:
     """
     Helper for database fallback synchronization.
-    Optimized to use batch queries instead of N+1 loop.
+    Latest/previous closes come from the materialized `latest_quotes` table (PK lookups).
     """
     if not indices:
         return []
 
-    from sqlalchemy import func, tuple_, desc, literal_column
-    
     fallback_results = []
-    
-    # 1. Helper to fetch latest records for multiple tickers from a specific table
-    def fetch_latest_from_table(model, tickers):
-        if not tickers: return []
-        subq = (
-            db.query(
-                model.ticker,
-                func.max(model.date).label('max_date')
-            )
-            .filter(model.ticker.in_(tickers))
-            .group_by(model.ticker)
-            .subquery()
-        )
-        
-        return (
-            db.query(model)
-            .join(subq, (model.ticker == subq.c.ticker) & (model.date == subq.c.max_date))
-            .all()
-        )
 
-    # 2. Try TestHistoricalPrice first (Priority 1)
-    latest_test = fetch_latest_from_table(models.TestHistoricalPrice, indices)
-    latest_map = {r.ticker: r for r in latest_test}
-    
-    # 3. Try HistoricalPrice for missing ones (Priority 2)
-    missing_indices = [i for i in indices if i not in latest_map]
-    if missing_indices:
-        latest_real = fetch_latest_from_table(models.HistoricalPrice, missing_indices)
-        for r in latest_real:
+    # 1. TestHistoricalPrice first (Priority 1) - small, test-only table
+    latest_map = {}
+    prev_map = {}
+    test_rows = (
+        db.query(models.TestHistoricalPrice)
+        .filter(models.TestHistoricalPrice.ticker.in_(indices))
+        .order_by(models.TestHistoricalPrice.ticker, models.TestHistoricalPrice.date.desc())
+        .all()
+    )
+    for r in test_rows:
+        if r.ticker not in latest_map:
             latest_map[r.ticker] = r
+        elif r.ticker not in prev_map:
+            prev_map[r.ticker] = float(r.close_price)
 
-    # 4. Fetch Previous Records for Change Calculation (Batch)
-    # We need to find the record immediately preceding the latest date for each ticker
-    prev_map = {}
-    
-    # Collect queries for each valid ticker to find its previous record
-    # Since specific dates vary per ticker, a single simple batch query is hard without window functions
-    # or complex self-joins. Given standard simple SQL usage, we can iterate for PREVIOUS record 
-    # (checking 2-3 indices is fast enough if LATEST is already batched, or use UNION ALL)
-    
-    valid_tickers = [t for t in indices if t in latest_map]
-    if valid_tickers:
-        # Optimization: Use UNION ALL to fetch previous records in one go
-        queries = []
-        for t in valid_tickers:
-            latest_date = latest_map[t].date
-            is_test = isinstance(latest_map[t], models.TestHistoricalPrice)
-            table = models.TestHistoricalPrice if is_test else models.HistoricalPrice
-            
-            # Wrap in subquery to avoid UNION ALL ORDER BY/LIMIT syntax issues
-            sub_q = (
-                db.query(table.ticker, table.close_price)
-                .filter(table.ticker == t, table.date < latest_date)
-                .order_by(table.date.desc())
-                .limit(1)
-                .subquery()
-            )
-            # Select from the subquery to make it a compatible Selectable
-            q = db.query(sub_q.c.ticker, sub_q.c.close_price)
-            queries.append(q)
-            
-        if queries:
-            from sqlalchemy import union_all
-            # This returns (ticker, close_price) tuples
-            try:
-                prev_results = db.execute(union_all(*queries)).all()
-                for row in prev_results:
-                    # row is like ('VNINDEX', Decimal('1234.56'))
-                    prev_map[row[0]] = float(row[1])
-            except Exception as e:
-                logger.debug(f"Batch prev fetch failed: {e}")
+    # 2. Materialized latest quotes for the rest (Priority 2)
+    missing_indices = [i for i in indices if i not in latest_map]
+    if missing_indices:
+        for t, q in get_latest_quotes(db, missing_indices).items():
+            latest_map[t] = q
+            if q.prev_close is not None:
+                prev_map[t] = float(q.prev_close)
 
     # 5. Build Results
     for index_name in indices:
@@ -277,7 +233,7 @@ def _get_market_fallback(db: Session, indices: list[str]) -> list[dict]:
         if not sparkline:
             fallback_date = None
             fallback_close = None
-            if isinstance(latest, models.HistoricalPrice) and latest.ticker == "VNINDEX":
+            if isinstance(latest, models.LatestQuote) and latest.ticker == "VNINDEX":
                 fallback_date = latest.date.strftime("%Y-%m-%d")
                 fallback_close = float(latest.close_price)
             sparkline = get_intraday_sparkline(
@@ -306,10 +262,12 @@ def _get_market_fallback(db: Session, indices: list[str]) -> list[dict]:
         
     return fallback_results
 
+MARKET_SUMMARY_CACHE_KEY = "market_summary_full_v10"
+
 def get_market_summary_service(db: Session) -> list[dict]:
     """Fetch market summary (VNINDEX, VN30)."""
     indices = ["VNINDEX", "VN30"]
-    cache_key = "market_summary_full_v10"
+    cache_key = MARKET_SUMMARY_CACHE_KEY
     
     # 0. Check cache
     cached = mem_get(cache_key)
@@ -4,6 +4,8 @@ from datetime import datetime, date
 from decimal import Decimal
 import time
 from typing import Iterable
+import pandas as pd
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
 import models
@@ -11,6 +13,9 @@ import crawler
 from adapters import vnstock_adapter
 from core.db import SessionLocal
 from core.logger import logger
+from services.market.cache import SECURITIES_TAG, invalidate_history
+from services.market.latest_quotes import refresh_latest_quotes
+from core.redis_client import invalidate_tags
 
 def seed_index_data_task() -> None:
     """
@@ -58,7 +63,10 @@ def seed_index_data_task() -> None:
                     continue
             total_count += count
         
+        db.flush()
+        refresh_latest_quotes(db, indices)
         db.commit()
+        invalidate_history(*indices)
 
     logger.info(f"Historical index sync completed. Added {total_count} records.")
 
@@ -108,7 +116,10 @@ def sync_portfolio_history_task(tickers: Iterable[str], sleep_sec: float = 2.0)
                     except Exception as e:
                         logger.debug(f"Error parsing history for {t}: {e}")
                         continue
+                db.flush()
+                refresh_latest_quotes(db, [t])
                 db.commit()
+                invalidate_history(t)
 
         logger.debug(f"Finished {t}, sleeping for {sleep_sec}s")
         time.sleep(sleep_sec)
@@ -164,72 +175,121 @@ def sync_historical_task(ticker: str, period: str) -> None:
                 except Exception as e:
                     logger.debug(f"Error parsing historical item for {ticker}: {e}")
                     continue
+            db.flush()
+            refresh_latest_quotes(db, [ticker])
             db.commit()
+            invalidate_history(ticker)
         logger.info(f"Finished seeding {ticker}")
     except Exception as e:
         logger.error(f"Failed to sync historical data for {ticker}: {e}")
 
 
-def _upsert_security(db, row) -> bool:
+_SECURITY_COLS = ["symbol", "short_name", "full_name", "exchange", "type"]
+
+
+def _normalize_listing(df):
     """
-    Helper to create or update a security record in the database.
-    
-    Returns:
-        bool: True if new record created, False if updated.
+    Vectorized transform of the vnstock listing into `securities` rows
+    (filter exchanges/types, normalize symbol + exchange, drop duplicates).
     """
-    symbol = str(row["symbol"]).upper().strip()
-    exchange = "HOSE" if row["exchange"] == "HSX" else row["exchange"]
-
-    exist = db.query(models.Security).filter_by(symbol=symbol).first()
-    if exist:
-        exist.short_name = row.get("organ_short_name")
-        exist.full_name = row.get("organ_name")
-        exist.exchange = exchange
-        exist.type = row["type"]
-        exist.last_synced = datetime.now()
-        return False
-    else:
-        db.add(
-            models.Security(
-                symbol=symbol,
-                short_name=row.get("organ_short_name"),
-                full_name=row.get("organ_name"),
-                exchange=exchange,
-                type=row["type"],
-                last_synced=datetime.now()
-            )
-        )
-        return True
+    valid_exchanges = ["HSX", "HOSE", "HNX", "UPCOM"]
+    valid_types = ["STOCK", "ETF", "FUND"]
 
-def sync_securities_task() -> None:
+    df = df[(df["exchange"].isin(valid_exchanges)) & (df["type"].isin(valid_types))]
+    out = pd.DataFrame({
+        "symbol": df["symbol"].astype(str).str.upper().str.strip(),
+        "short_name": df["organ_short_name"] if "organ_short_name" in df.columns else None,
+        "full_name": df["organ_name"] if "organ_name" in df.columns else None,
+        "exchange": df["exchange"].replace({"HSX": "HOSE"}),
+        "type": df["type"],
+    })
+    out = out[out["symbol"] != ""].drop_duplicates(subset="symbol", keep="last")
+    # NaN -> None để ghi NULL
+    return out.astype(object).where(out.notna(), None).reset_index(drop=True)
+
+
+def _content_hash(df) -> pd.Series:
+    cols = [c for c in _SECURITY_COLS if c != "symbol"]
+    # str: giữ nguyên giá trị uint64 qua merge (NaN sẽ ép cột số sang float)
+    return pd.util.hash_pandas_object(df[cols].astype(str), index=False).astype(str)
+
+
+def sync_securities_task() -> dict:
     """
     Worker task to sync the list of all valid securities from VNStock adapter.
     Filters for relevant exchanges and types (STOCK, ETF, FUND).
+    Set-based: one SELECT for the current catalog, content-hash diff in pandas,
+    then a single INSERT ... ON CONFLICT (symbol) DO UPDATE for new/changed rows.
+
+    Returns:
+        dict: {"new": int, "updated": int, "unchanged": int, "delisted": int}
     """
     logger.info("Background job started: Syncing securities list")
+    counts = {"new": 0, "updated": 0, "unchanged": 0, "delisted": 0}
     try:
         df = vnstock_adapter.get_all_symbols()
         if df is None or df.empty:
             logger.warning("No security data received from adapter")
-            return
-
-        valid_exchanges = ["HSX", "HOSE", "HNX", "UPCOM"]
-        valid_types = ["STOCK", "ETF", "FUND"]
+            return counts
 
-        df_filtered = df[
-            (df["exchange"].isin(valid_exchanges)) &
-            (df["type"].isin(valid_types))
-        ]
+        incoming = _normalize_listing(df)
+        if incoming.empty:
+            return counts
 
         with SessionLocal() as db:
-            count_new = 0
-            count_upd = 0
-            for _, row in df_filtered.iterrows():
-                is_new = _upsert_security(db, row)
-                if is_new: count_new += 1
-                else: count_upd += 1
-            db.commit()
-            logger.info(f"Securities sync completed. New: {count_new}, Updated: {count_upd}")
+            existing = pd.DataFrame(
+                db.query(
+                    models.Security.symbol,
+                    models.Security.short_name,
+                    models.Security.full_name,
+                    models.Security.exchange,
+                    models.Security.type,
+                ).all(),
+                columns=_SECURITY_COLS,
+            )
+
+            incoming["_hash"] = _content_hash(incoming)
+            if not existing.empty:
+                existing = existing.astype(object).where(existing.notna(), None)
+                existing["_hash"] = _content_hash(existing)
+                merged = incoming.merge(existing[["symbol", "_hash"]], on="symbol", how="left", suffixes=("", "_old"))
+                is_new = merged["_hash_old"].isna()
+                is_changed = ~is_new & (merged["_hash"] != merged["_hash_old"])
+                counts["delisted"] = int((~existing["symbol"].isin(incoming["symbol"])).sum())
+            else:
+                merged = incoming.assign(_hash_old=None)
+                is_new = pd.Series(True, index=merged.index)
+                is_changed = pd.Series(False, index=merged.index)
+
+            counts["new"] = int(is_new.sum())
+            counts["updated"] = int(is_changed.sum())
+            counts["unchanged"] = int(len(merged) - counts["new"] - counts["updated"])
+
+            to_write = merged.loc[is_new | is_changed, _SECURITY_COLS]
+            if not to_write.empty:
+                now = datetime.now()
+                records = [dict(r, last_synced=now) for r in to_write.to_dict("records")]
+                stmt = pg_insert(models.Security.__table__).values(records)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["symbol"],
+                    set_={
+                        "short_name": stmt.excluded.short_name,
+                        "full_name": stmt.excluded.full_name,
+                        "exchange": stmt.excluded.exchange,
+                        "type": stmt.excluded.type,
+                        "last_synced": stmt.excluded.last_synced,
+                    },
+                )
+                db.execute(stmt)
+                db.commit()
+                invalidate_tags(SECURITIES_TAG)
+
+        logger.info(
+            f"Securities sync completed. New: {counts['new']}, Updated: {counts['updated']}, "
+            f"Unchanged: {counts['unchanged']}, Delisted: {counts['delisted']}"
+        )
 
     except Exception as e:
         logger.error(f"Failed to sync securities list: {e}")
+
+    return counts
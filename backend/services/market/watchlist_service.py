@@ -1,8 +1,10 @@
 from __future__ import annotations
 import concurrent.futures
-import json
 from typing import Optional
-from services.market.cache import mem_get, mem_set, REDIS_AVAILABLE, redis_client
+from services.market.cache import (
+    mem_get, mem_set, mem_get_many, mem_set_many, watchlist_detail_cache_key,
+    watchlist_tag, ticker_tags, SECURITIES_TAG,
+)
 from services.market.data_processor import _process_single_ticker
 import models
 from core.db import SessionLocal
@@ -10,66 +12,62 @@ from crawler import get_current_prices
 
 from fastapi import BackgroundTasks
 
-def get_watchlist_detail_service(tickers: list[str], background_tasks: Optional[BackgroundTasks] = None, watchlist_id: int | None = None) -> list[dict]:
+def load_security_metadata(tickers_upper: list[str]) -> dict[str, dict]:
     """
-    Lấy dữ liệu chi tiết Watchlist (Tối ưu Parallel + Memory Cache + Batch Metadata + Result Cache)
+    Metadata (tên, sàn) cho danh sách mã: RAM -> 1 lệnh MGET -> 1 query DB cho phần còn thiếu.
+    Dùng chung cho watchlist detail và job warm-up trước giờ mở cửa.
     """
-    if not tickers:
-        return []
-
-    tickers_upper = [t.upper() for t in tickers]
-    
-    # 0. Result Caching (Tối ưu chuyển TAB)
-    result_cache_key = None
-    if watchlist_id:
-        result_cache_key = f"wl_detail_v1:{watchlist_id}"
-        # Thử lấy từ Memory
-        cached_res = mem_get(result_cache_key)
-        if cached_res:
-            return cached_res
-        
-        # Thử lấy từ Redis
-        if REDIS_AVAILABLE:
-            try:
-                raw_redis = redis_client.get(result_cache_key)
-                if raw_redis:
-                    res_obj = json.loads(raw_redis)
-                    mem_set(result_cache_key, res_obj, 10) # Backfill memory 10s
-                    return res_obj
-            except Exception as e:
-                from core.logger import logger
-                logger.debug(f"Redis cache fetch error: {e}")
-
-    # 1. Batch Metadata Fetch (LONG-TERM CACHE 1H)
     sec_metadata = {}
     missing_meta_tickers = []
     
+    # RAM trước, phần còn thiếu lấy bằng 1 lệnh MGET
+    cached_meta = mem_get_many(f"sec_meta_v1:{t}" for t in tickers_upper)
     for t in tickers_upper:
-        meta_key = f"sec_meta_v1:{t}"
-        # Ưu tiên lấy từ Memory (vì 1h là rất lâu)
-        cached_meta = mem_get(meta_key)
-        if cached_meta:
-            sec_metadata[t] = cached_meta
+        meta = cached_meta.get(f"sec_meta_v1:{t}")
+        if meta:
+            sec_metadata[t] = meta
         else:
             missing_meta_tickers.append(t)
             
     if missing_meta_tickers:
         with SessionLocal() as db:
             securities = db.query(models.Security).filter(models.Security.symbol.in_(missing_meta_tickers)).all()
+            fresh_meta = {}
             for sec in securities:
                 meta_obj = {
                     "name": sec.short_name,
                     "exchange": sec.exchange
                 }
                 sec_metadata[sec.symbol] = meta_obj
-                # Cache metadata 8h (28800s)
-                mem_set(f"sec_meta_v1:{sec.symbol}", meta_obj, 28800)
-                if REDIS_AVAILABLE:
-                    try:
-                        redis_client.setex(f"sec_meta_v1:{sec.symbol}", 28800, json.dumps(meta_obj))
-                    except Exception as e:
-                        from core.logger import logger
-                        logger.debug(f"Redis setex error: {e}")
+                fresh_meta[f"sec_meta_v1:{sec.symbol}"] = meta_obj
+            # Cache metadata 8h (28800s) - 1 pipeline cho cả batch
+            mem_set_many(
+                fresh_meta,
+                28800,
+                tags={k: [*ticker_tags(k.split(":", 1)[1]), SECURITIES_TAG] for k in fresh_meta},
+            )
+    return sec_metadata
+
+def get_watchlist_detail_service(tickers: list[str], background_tasks: Optional[BackgroundTasks] = None, watchlist_id: int | None = None) -> list[dict]:
+    """
+    Lấy dữ liệu chi tiết Watchlist (Tối ưu Parallel + Memory Cache + Batch Metadata + Result Cache)
+    """
+    if not tickers:
+        return []
+
+    tickers_upper = [t.upper() for t in tickers]
+    
+    # 0. Result Caching (Tối ưu chuyển TAB)
+    result_cache_key = None
+    if watchlist_id:
+        result_cache_key = watchlist_detail_cache_key(watchlist_id)
+        # Thử lấy từ Memory -> Redis
+        cached_res = mem_get(result_cache_key)
+        if cached_res:
+            return cached_res
+
+    # 1. Batch Metadata Fetch (LONG-TERM CACHE 8H)
+    sec_metadata = load_security_metadata(tickers_upper)
 
     # 2. Lấy giá Real-time (Batch Request)
     try:
@@ -90,6 +88,9 @@ def get_watchlist_detail_service(tickers: list[str], background_tasks: Optional[
     except Exception as e:
         print(f"[ERR] Batch Trending Fetch Failed: {e}")
 
+    # 3.5 Prefetch sparkline/ratios vào RAM bằng 1 lệnh MGET, để các thread bên dưới chỉ đọc L1
+    mem_get_many([*(f"sparkline_v2:{t}" for t in tickers_upper), *(f"ratios:{t}" for t in tickers_upper)])
+
     results = []
     
     # 4. Chạy Parallel xử lý từng mã
@@ -115,13 +116,7 @@ def get_watchlist_detail_service(tickers: list[str], background_tasks: Optional[
     
     # Lưu vào Result Cache (10 giây)
     if result_cache_key:
-        mem_set(result_cache_key, ordered_results, 10)
-        if REDIS_AVAILABLE:
-            try:
-                redis_client.setex(result_cache_key, 10, json.dumps(ordered_results))
-            except Exception as e:
-                from core.logger import logger
-                logger.debug(f"Redis setex error: {e}")
+        mem_set(result_cache_key, ordered_results, 10, tags=[watchlist_tag(watchlist_id)])
     
     # Check if any ticker needs historical sync
     if background_tasks:
@@ -20,6 +20,7 @@ from services.market.cache import (
     invalidate_watchlist_detail_cache
 )
 from services.market.market_summary import (
+    MARKET_SUMMARY_CACHE_KEY,
     get_market_summary_service,
     get_index_widget_data,
     get_intraday_data_service
@@ -0,0 +1,241 @@
+# services/nav_reconstruction.py
+"""
+Rebuilds end-of-day NAV for arbitrary dates by replaying the ledger:
+StockTransaction -> position matrix (dates x tickers), CashFlow + trade cash -> cash vector,
+joined against a forward-filled historical_prices matrix. Everything is vectorized, so
+years of history cost a handful of queries and a few array ops.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+import models
+from core.cache import invalidate_dashboard_cache
+from core.logger import logger
+
+# Trade settlement cash is logged as CashFlow "Buy ..."/"Sell ..." (see trading_service);
+# it is replayed from StockTransaction instead, dated by transaction_date.
+TRADE_FLOW_PATTERN = re.compile(r"^(Buy|Sell) ")
+
+_FLOW_SIGN = {
+    models.CashFlowType.DEPOSIT: 1.0,
+    models.CashFlowType.WITHDRAW: -1.0,
+    models.CashFlowType.INTEREST: 1.0,
+    models.CashFlowType.DIVIDEND_CASH: 1.0,
+    models.CashFlowType.CUSTODY_FEE: -1.0,
+}
+
+PRICE_LOOKBACK_DAYS = 31
+BENCHMARK_CALENDAR_TICKER = "VNINDEX"
+
+
+def is_trade_flow(description: Optional[str]) -> bool:
+    return bool(description) and bool(TRADE_FLOW_PATTERN.match(description))
+
+
+def _day_index(days: np.ndarray, stamps: Iterable[datetime | date]) -> np.ndarray:
+    """Index of the first target day >= each event day (event counted at that day's close)."""
+    ev = np.array([s.date() if isinstance(s, datetime) else s for s in stamps], dtype="datetime64[D]")
+    return np.searchsorted(days, ev, side="left")
+
+
+@dataclass
+class LedgerMatrices:
+    """End-of-day ledger state on `days`: positions/prices are (days x tickers), cash is per day."""
+    days: np.ndarray
+    tickers: List[str]
+    positions: np.ndarray
+    prices: np.ndarray
+    cash: np.ndarray
+
+    @property
+    def holding_values(self) -> np.ndarray:
+        held = (self.positions != 0) & ~np.isnan(self.prices)
+        return np.where(held, self.positions * np.nan_to_num(self.prices), 0.0)
+
+
+def build_ledger_matrices(db: Session, dates: Sequence[date]) -> LedgerMatrices:
+    """
+    Replays the ledger onto the requested dates (any order, may be sparse).
+    Prices: last close on or before the date; if a ticker has no history yet, its latest
+    trade price is used instead (NaN if neither exists).
+    """
+    target = sorted(set(dates))
+    days = np.array(target, dtype="datetime64[D]")
+    n_d = len(days)
+    if not n_d:
+        return LedgerMatrices(days, [], np.zeros((0, 0)), np.zeros((0, 0)), np.zeros(0))
+    end_dt = datetime.combine(target[-1] + timedelta(days=1), time.min)
+
+    txs = (
+        db.query(
+            models.StockTransaction.ticker,
+            models.StockTransaction.type,
+            models.StockTransaction.volume,
+            models.StockTransaction.price,
+            models.StockTransaction.total_value,
+            models.StockTransaction.transaction_date,
+        )
+        .filter(models.StockTransaction.transaction_date < end_dt)
+        .order_by(models.StockTransaction.transaction_date, models.StockTransaction.id)
+        .all()
+    )
+    flows = (
+        db.query(models.CashFlow.type, models.CashFlow.amount, models.CashFlow.description, models.CashFlow.created_at)
+        .filter(models.CashFlow.created_at < end_dt)
+        .all()
+    )
+
+    tickers = sorted({t.ticker.upper() for t in txs})
+    col_of = {t: i for i, t in enumerate(tickers)}
+    n_t = len(tickers)
+
+    cash_delta = np.zeros(n_d)
+    positions = np.zeros((n_d, n_t))
+    trade_px = np.full((n_d, n_t), np.nan)
+
+    # 1. Trades -> position deltas + settlement cash
+    if txs:
+        idx = _day_index(days, (t.transaction_date for t in txs))
+        cols = np.fromiter((col_of[t.ticker.upper()] for t in txs), dtype=np.int64, count=len(txs))
+        is_buy = np.fromiter((t.type == models.TransactionType.BUY for t in txs), dtype=bool, count=len(txs))
+        vol = np.fromiter((float(t.volume or 0) for t in txs), dtype=float, count=len(txs))
+        value = np.fromiter((float(t.total_value or 0) for t in txs), dtype=float, count=len(txs))
+        price = np.fromiter((float(t.price or 0) for t in txs), dtype=float, count=len(txs))
+
+        keep = idx < n_d
+        idx, cols = idx[keep], cols[keep]
+        np.add.at(positions, (idx, cols), np.where(is_buy, vol, -vol)[keep])
+        np.add.at(cash_delta, idx, np.where(is_buy, -value, value)[keep])
+        # Sorted by date, so for repeated (day, ticker) the latest trade wins
+        trade_px[idx, cols] = price[keep]
+        positions = np.cumsum(positions, axis=0)
+
+    # 2. External cash flows (deposit/withdraw/interest/dividend/fee)
+    ext = [f for f in flows if not is_trade_flow(f.description)]
+    if ext:
+        idx = _day_index(days, (f.created_at for f in ext))
+        signed = np.fromiter((_FLOW_SIGN.get(f.type, 0.0) * float(f.amount or 0) for f in ext), dtype=float, count=len(ext))
+        keep = idx < n_d
+        np.add.at(cash_delta, idx[keep], signed[keep])
+    cash = np.cumsum(cash_delta)
+
+    # 3. Prices: pivot (date x ticker), forward-fill, align to target days
+    px = price_matrix(db, tickers, days)
+    if n_t:
+        fallback_px = pd.DataFrame(trade_px).ffill().to_numpy()
+        px = np.where(np.isnan(px), fallback_px, px)
+
+    return LedgerMatrices(days, tickers, positions, px, cash)
+
+
+def price_matrix(db: Session, tickers: Sequence[str], days: np.ndarray) -> np.ndarray:
+    """(days x tickers) last close on or before each day, NaN where no close exists yet."""
+    n_d, n_t = len(days), len(tickers)
+    if not n_d or not n_t:
+        return np.full((n_d, n_t), np.nan)
+    first_day = days[0].astype(object)
+    rows = (
+        db.query(models.HistoricalPrice.date, models.HistoricalPrice.ticker, models.HistoricalPrice.close_price)
+        .filter(
+            models.HistoricalPrice.ticker.in_(list(tickers)),
+            models.HistoricalPrice.date >= first_day - timedelta(days=PRICE_LOOKBACK_DAYS),
+            models.HistoricalPrice.date <= days[-1].astype(object),
+        )
+        .all()
+    )
+    if not rows:
+        return np.full((n_d, n_t), np.nan)
+    target_index = pd.DatetimeIndex(days)
+    hist = pd.DataFrame(rows, columns=["date", "ticker", "close"])
+    hist["date"] = pd.to_datetime(hist["date"])
+    hist["close"] = hist["close"].astype(float)
+    pivot = hist.pivot_table(index="date", columns="ticker", values="close", aggfunc="last")
+    pivot = pivot.reindex(columns=list(tickers))
+    pivot = pivot.reindex(pivot.index.union(target_index)).sort_index().ffill()
+    return pivot.reindex(target_index).to_numpy(dtype=float)
+
+
+def reconstruct_nav(db: Session, dates: Sequence[date]) -> pd.DataFrame:
+    """End-of-day cash, stock value and NAV for each requested date (any order, may be sparse)."""
+    m = build_ledger_matrices(db, dates)
+    if not len(m.days):
+        return pd.DataFrame(columns=["cash", "stock_value", "total_nav"])
+
+    unpriced = (m.positions != 0) & np.isnan(m.prices)
+    if unpriced.any():
+        logger.warning(f"NAV reconstruction: {int(unpriced.sum())} position-days without any price, valued at 0")
+    stock_value = m.holding_values.sum(axis=1)
+
+    return pd.DataFrame(
+        {"cash": m.cash, "stock_value": stock_value, "total_nav": m.cash + stock_value},
+        index=pd.Index(m.days.astype(object), name="date"),
+    )
+
+
+def trading_days(db: Session, start: date, end: date) -> list[date]:
+    """Trading calendar from the benchmark's price history; weekdays if it is not synced."""
+    rows = (
+        db.query(models.HistoricalPrice.date)
+        .filter(
+            models.HistoricalPrice.ticker == BENCHMARK_CALENDAR_TICKER,
+            models.HistoricalPrice.date >= start,
+            models.HistoricalPrice.date <= end,
+        )
+        .all()
+    )
+    if rows:
+        return sorted({r[0] for r in rows})
+    return [d.date() for d in pd.bdate_range(start, end)]
+
+
+def _first_activity_date(db: Session) -> Optional[date]:
+    first_tx = db.query(func.min(models.StockTransaction.transaction_date)).scalar()
+    first_flow = db.query(func.min(models.CashFlow.created_at)).scalar()
+    stamps = [s for s in (first_tx, first_flow) if s is not None]
+    return min(s.date() if isinstance(s, datetime) else s for s in stamps) if stamps else None
+
+
+def backfill_missing_nav_snapshots(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """
+    Inserts reconstructed snapshots for every trading day in [start, end] that has none.
+    Defaults: from the first ledger activity to yesterday (today belongs to the EOD job).
+    Existing snapshots are never overwritten. Returns the number of rows inserted.
+    """
+    end = end or (date.today() - timedelta(days=1))
+    start = start or _first_activity_date(db)
+    if start is None or start > end:
+        return 0
+
+    existing = {
+        r[0]
+        for r in db.query(models.DailySnapshot.date)
+        .filter(models.DailySnapshot.date >= start, models.DailySnapshot.date <= end)
+        .all()
+    }
+    missing = [d for d in trading_days(db, start, end) if d not in existing]
+    if not missing:
+        return 0
+
+    nav = reconstruct_nav(db, missing)
+    now = datetime.now()
+    values = [
+        {"date": d, "total_nav": round(float(v), 4), "created_at": now}
+        for d, v in nav["total_nav"].items()
+    ]
+    stmt = pg_insert(models.DailySnapshot.__table__).values(values).on_conflict_do_nothing(index_elements=["date"])
+    inserted = db.execute(stmt).rowcount or 0
+    db.commit()
+    if inserted:
+        invalidate_dashboard_cache()
+    logger.info(f"NAV backfill: {inserted} snapshots reconstructed between {missing[0]} and {missing[-1]}")
+    return inserted
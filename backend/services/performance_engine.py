@@ -0,0 +1,191 @@
+# services/performance_engine.py
+"""
+Time-weighted (chain-linked) and money-weighted (XIRR) returns over daily_snapshots.
+
+Sub-period i runs from snapshot i-1 to snapshot i; its return uses the SSI formula
+    r_i = (NAV_i - NAV_{i-1} - F_i) / (NAV_{i-1} + max(0, F_i))
+where F_i is the net external flow (deposits - withdrawals, trade settlement excluded)
+dated in (d_{i-1}, d_i]. The growth index G = cumprod(1 + r) makes every horizon a
+ratio G[end] / G[anchor] - 1, so all horizons come out of one pass.
+"""
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import models
+from services import cashflow_ledger
+
+XIRR_MAX_ITER = 50
+XIRR_TOL = 1e-9
+XIRR_LOWER = -0.9999
+XIRR_UPPER = 100.0
+
+
+def horizon_anchors(today: date) -> List[Tuple[str, Optional[date]]]:
+    """(key, anchor date). Anchor None = since inception. Returns are measured from the last snapshot <= anchor."""
+    return [
+        ("1d", today - timedelta(days=1)),
+        ("1w", today - timedelta(days=7)),
+        ("1m", today - timedelta(days=30)),
+        ("3m", today - timedelta(days=90)),
+        ("ytd", date(today.year, 1, 1)),
+        ("1y", today - timedelta(days=365)),
+        ("inception", None),
+    ]
+
+
+def chain_link(navs: np.ndarray, flows: np.ndarray) -> np.ndarray:
+    """Growth index G (G[0] = 1) from NAV points and per-sub-period flows (flows[0] is ignored)."""
+    prev = navs[:-1]
+    f = flows[1:]
+    denom = prev + np.maximum(f, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.where(denom > 0, (navs[1:] - prev - f) / denom, 0.0)
+    return np.concatenate(([1.0], np.cumprod(1.0 + r)))
+
+
+def _npv(rates: np.ndarray, amounts: np.ndarray, years: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    base = (1.0 + rates)[:, None]
+    disc = base ** (-years)
+    npv = (amounts * disc).sum(axis=1)
+    d_npv = (-years * amounts * disc / base).sum(axis=1)
+    return npv, d_npv
+
+
+def xirr_many(amounts: np.ndarray, years: np.ndarray) -> np.ndarray:
+    """
+    Solves NPV(rate) = 0 for every row of a zero-padded (problems x flows) matrix at once.
+    Newton first; rows that do not converge fall back to bisection on [XIRR_LOWER, XIRR_UPPER].
+    Rows without a sign change in their cash flows (no solution) return NaN.
+    """
+    n = amounts.shape[0]
+    out = np.full(n, np.nan)
+    if n == 0:
+        return out
+
+    solvable = (amounts > 0).any(axis=1) & (amounts < 0).any(axis=1)
+    scale = np.abs(amounts).sum(axis=1)
+    tol = XIRR_TOL * np.where(scale > 0, scale, 1.0)
+
+    x = np.full(n, 0.1)
+    done = ~solvable
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        for _ in range(XIRR_MAX_ITER):
+            npv, d_npv = _npv(x, amounts, years)
+            conv = np.abs(npv) < tol
+            out[conv & ~done] = x[conv & ~done]
+            done |= conv
+            if done.all():
+                return out
+            step = np.where(d_npv != 0, npv / d_npv, 0.0)
+            x = np.clip(x - step, XIRR_LOWER, XIRR_UPPER)
+            done |= ~np.isfinite(x)
+
+        # Bisection for what Newton could not settle
+        todo = solvable & np.isnan(out)
+        if todo.any():
+            a, t = amounts[todo], years[todo]
+            lo = np.full(a.shape[0], XIRR_LOWER)
+            hi = np.full(a.shape[0], XIRR_UPPER)
+            f_lo, _ = _npv(lo, a, t)
+            f_hi, _ = _npv(hi, a, t)
+            bracketed = np.sign(f_lo) != np.sign(f_hi)
+            for _ in range(200):
+                mid = (lo + hi) / 2
+                f_mid, _ = _npv(mid, a, t)
+                left = np.sign(f_mid) == np.sign(f_lo)
+                lo = np.where(left, mid, lo)
+                f_lo = np.where(left, f_mid, f_lo)
+                hi = np.where(left, hi, mid)
+                if np.all(hi - lo < 1e-10):
+                    break
+            out[np.flatnonzero(todo)[bracketed]] = ((lo + hi) / 2)[bracketed]
+    return out
+
+
+def _load_series(db: Session, today: date, curr_nav: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Tuple[date, float]]]:
+    """NAV points (virtual zero start, snapshots before today, live NAV today), flows per sub-period, daily external flows."""
+    snaps = (
+        db.query(models.DailySnapshot.date, models.DailySnapshot.total_nav)
+        .filter(models.DailySnapshot.date < today)
+        .order_by(models.DailySnapshot.date)
+        .all()
+    )
+    flow_days, flow_amt = cashflow_ledger.get_ledger(db).daily_slice(cashflow_ledger.EXTERNAL, None, None)
+    ext_flows = list(zip(flow_days.astype(object), flow_amt.tolist()))
+
+    first = min([s.date for s in snaps] + [d for d, _ in ext_flows] + [today])
+    dates = [first - timedelta(days=1)] + [s.date for s in snaps] + [today]
+    navs = np.array([0.0] + [float(s.total_nav or 0) for s in snaps] + [curr_nav])
+    days = np.array(dates, dtype="datetime64[D]")
+
+    flows = np.zeros(len(dates))
+    if len(flow_days):
+        idx = np.searchsorted(days, flow_days, side="left")
+        keep = idx < len(dates)
+        np.add.at(flows, idx[keep], flow_amt[keep])
+    return days, navs, flows, ext_flows
+
+
+def compute_performance(db: Session, curr_nav: float, today: Optional[date] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    {horizon: {"val", "pct", "mwr", "start_date"}} for every horizon in horizon_anchors().
+    val = P&L net of external flows, pct = chain-linked TWR (%), mwr = money-weighted return (%),
+    annualized for horizons of a year or more and compounded over the period otherwise.
+    """
+    today = today or date.today()
+    days, navs, flows, ext_flows = _load_series(db, today, curr_nav)
+    growth = chain_link(navs, flows)
+    cum_flows = np.cumsum(flows)
+
+    anchors = horizon_anchors(today)
+    anchor_days = np.array([a or today for _, a in anchors], dtype="datetime64[D]")
+    k = np.maximum(np.searchsorted(days, anchor_days, side="right") - 1, 0)
+    k[[a is None for _, a in anchors]] = 0
+
+    twr = (growth[-1] / growth[k] - 1.0) * 100
+    val = navs[-1] - navs[k] - (cum_flows[-1] - cum_flows[k])
+
+    # XIRR matrix: [-NAV_anchor, -flow..., +NAV_end] per horizon, padded with zeros.
+    # Horizons under a year are timed in units of their own span, so the root is the period rate.
+    flow_days = np.array([d for d, _ in ext_flows], dtype="datetime64[D]")
+    flow_amt = np.array([a for _, a in ext_flows], dtype=float)
+    end_day = days[-1]
+    width = len(ext_flows) + 2
+    amounts = np.zeros((len(anchors), width))
+    years = np.zeros((len(anchors), width))
+    for i in range(len(anchors)):
+        start_day = days[k[i]]
+        span_days = float((end_day - start_day).astype(int))
+        if span_days <= 0:
+            continue  # anchor on the last point (ytd on Jan 1): pct = val = 0, no MWR
+        unit = 365.0 if span_days >= 365 else span_days
+        amounts[i, 0] = -navs[k[i]]
+        if len(ext_flows):
+            m = (flow_days > start_day) & (flow_days <= end_day)
+            n_m = int(m.sum())
+            amounts[i, 1:1 + n_m] = -flow_amt[m]
+            years[i, 1:1 + n_m] = (flow_days[m] - start_day).astype(int) / unit
+        amounts[i, -1] = navs[-1]
+        years[i, -1] = span_days / unit
+
+    mwr = xirr_many(amounts, years) * 100
+
+    result: Dict[str, Dict[str, Any]] = {}
+    for i, (key, _) in enumerate(anchors):
+        result[key] = {
+            "val": _finite(val[i]),
+            "pct": _finite(twr[i]),
+            "mwr": _finite(mwr[i]) if np.isfinite(mwr[i]) else None,
+            "start_date": str(days[k[i]]) if k[i] > 0 else None,
+        }
+    return result
+
+
+def _finite(x: Any) -> float:
+    x = float(x)
+    return x if np.isfinite(x) else 0.0
@@ -1,19 +1,24 @@
 # services/performance_service.py
 from __future__ import annotations
 
+import base64
+import json
 import math
 from datetime import date, timedelta, datetime
 from decimal import Decimal
 from typing import Any, Dict, List, Tuple, Optional
 
-from sqlalchemy import cast, Date, desc
+import numpy as np
+from sqlalchemy import Float, case, cast, func, literal, select
 from sqlalchemy.orm import Session
 
 import models
 import crawler
-from core.cache import cache
-from core.redis_client import get_queue
+from core.cache import HISTORY_TAG, PORTFOLIO_TAG, cache
+from core.exceptions import ValidationError
 from core.logger import logger
+from services import cashflow_ledger
+from services.performance_engine import compute_performance
 
 
 def _safe_float(x: Any, default: float = 0.0) -> float:
@@ -57,34 +62,22 @@ def _pick_current_price(price_info: Any, avg_price: Decimal) -> Decimal:
 
 def _net_cash_flow(db: Session, start: date, end: date | None = None) -> Decimal:
     """Calculates net cash flow (Deposits - Withdrawals) for a period."""
-    q = db.query(models.CashFlow).filter(cast(models.CashFlow.created_at, Date) >= start)
-    if end is not None:
-        q = q.filter(cast(models.CashFlow.created_at, Date) <= end)
-
-    net = Decimal("0")
-    for f in q.all():
-        if f.type == models.CashFlowType.DEPOSIT:
-            net += _d(f.amount)
-        elif f.type == models.CashFlowType.WITHDRAW:
-            net -= _d(f.amount)
-    return net
+    return cashflow_ledger.net_flow(db, start, end)
 
 
 def _get_flows_map(db: Session, start: date, end: date) -> Dict[date, Decimal]:
     """Returns a map of {date: daily_net_flow} within a period."""
-    flows = db.query(models.CashFlow).filter(
-        cast(models.CashFlow.created_at, Date) >= start,
-        cast(models.CashFlow.created_at, Date) <= end
-    ).all()
-    
-    res = {}
-    for f in flows:
-        d_key = f.created_at.date()
-        amt = _d(f.amount)
-        if f.type == models.CashFlowType.WITHDRAW:
-            amt = -amt
-        res[d_key] = res.get(d_key, Decimal("0")) + amt
-    return res
+    return cashflow_ledger.flows_by_day(db, start, end)
+
+
+def _growth_pct(values: np.ndarray, base: np.ndarray | float) -> np.ndarray:
+    """
+    (values - base) * 100 / base where both are positive, else 0.
+    Multiplying before the single division keeps the float result equal to the old Decimal
+    formula after round(..., 2); (v - b) / b * 100 rounds twice and drifts on ties.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where((base > 0) & (values > 0), (values - base) * 100 / base, 0.0)
 
 
 def _calc_profit_pct(curr_nav: Decimal, old_nav: Decimal, net_flow: Decimal) -> Tuple[float, float]:
@@ -99,11 +92,11 @@ def _calc_profit_pct(curr_nav: Decimal, old_nav: Decimal, net_flow: Decimal) ->
     return _safe_float(profit, 0.0), _safe_float(pct, 0.0)
 
 
-@cache(ttl=300, key="dashboard_performance")
+@cache(ttl=300, key="dashboard_performance", tags=[PORTFOLIO_TAG])
 def calculate_twr_metrics(db: Session) -> Dict[str, Any]:
     """
-    Calculates portfolio performance metrics for various time horizons (1D, 1M, 1Y, YTD).
-    Uses DailySnapshot for historical comparison.
+    Calculates portfolio performance metrics for various time horizons (1D, 1W, 1M, 3M, YTD, 1Y, inception).
+    Chain-links DailySnapshot sub-period returns (see services.performance_engine).
     """
     asset = db.query(models.AssetSummary).first()
     if not asset:
@@ -126,42 +119,8 @@ def calculate_twr_metrics(db: Session) -> Dict[str, Any]:
 
     curr_nav = _d(asset.cash_balance) + _d(curr_stock_val)
 
-    def calc_for_target(target_day: date) -> Tuple[float, float]:
-        snap = (
-            db.query(models.DailySnapshot)
-            .filter(models.DailySnapshot.date <= target_day)
-            .order_by(desc(models.DailySnapshot.date))
-            .first()
-        )
-        old_nav = _d(snap.total_nav) if snap else Decimal("0")
-        net_flow = _net_cash_flow(db, start=target_day)
-        return _calc_profit_pct(curr_nav, old_nav, net_flow)
-
-    today = date.today()
-    ytd_day = date(today.year, 1, 1)
-
-    p1d = calc_for_target(today - timedelta(days=1))
-    p1m = calc_for_target(today - timedelta(days=30))
-    p1y = calc_for_target(today - timedelta(days=365))
-    pytd = calc_for_target(ytd_day)
-
-    result = {
-        "1d": {"val": _safe_float(p1d[0]), "pct": _safe_float(p1d[1])},
-        "1m": {"val": _safe_float(p1m[0]), "pct": _safe_float(p1m[1])},
-        "1y": {"val": _safe_float(p1y[0]), "pct": _safe_float(p1y[1])},
-        "ytd": {"val": _safe_float(pytd[0]), "pct": _safe_float(pytd[1])},
-    }
-
-    # Asynchronously dispatch snapshot update
-    try:
-        q = get_queue()
-        if q:
-            from tasks import update_daily_snapshot_task
-            q.enqueue(update_daily_snapshot_task)
-    except Exception:
-        pass
-
-    return result
+    # Chain-linked TWR + money-weighted return for every horizon in one pass
+    return compute_performance(db, _safe_float(curr_nav))
 
 
 def _growth_key_fn(*args, **kwargs) -> str:
@@ -169,7 +128,7 @@ def _growth_key_fn(*args, **kwargs) -> str:
     return f"chart_growth_v3_{period}"
 
 
-@cache(ttl=300, key_fn=_growth_key_fn)
+@cache(ttl=300, key_fn=_growth_key_fn, tags=[PORTFOLIO_TAG, HISTORY_TAG])
 def growth_series(db: Session, period: str = "1m") -> Dict[str, Any]:
     """
     Generates time-series data for portfolio growth vs. individual assets and benchmarks.
@@ -184,90 +143,56 @@ def growth_series(db: Session, period: str = "1m") -> Dict[str, Any]:
     fetch_tickers = tickers + ["VNINDEX"]
 
     raw_prices = (
-        db.query(models.HistoricalPrice)
+        db.query(models.HistoricalPrice.date, models.HistoricalPrice.ticker, models.HistoricalPrice.close_price)
         .filter(
             models.HistoricalPrice.ticker.in_(fetch_tickers),
             models.HistoricalPrice.date >= start_date
         )
-        .order_by(models.HistoricalPrice.date)
         .all()
     )
 
-    price_map: Dict[date, Dict[str, Decimal]] = {}
-    all_dates = set()
-    for p in raw_prices:
-        if p.date not in price_map:
-            price_map[p.date] = {}
-        price_map[p.date][p.ticker] = _d(p.close_price)
-        all_dates.add(p.date)
-
-    sorted_dates = sorted(list(all_dates))
+    sorted_dates = sorted({p.date for p in raw_prices})
     if not sorted_dates:
          return {"portfolio": [], "message": "No historical price data found for selected period."}
 
-    ticker_base_prices: Dict[str, Decimal] = {}
-    portfolio_daily_values = []
-    first_valid_port_idx = -1
-    
-    # Forward-fill price map to handle missing data (prevents nosedive)
-    last_known_prices: Dict[str, Decimal] = {}
+    # (dates x tickers) price matrix; missing / non-positive closes are 0
+    columns = list(dict.fromkeys(fetch_tickers))
+    col_of = {t: j for j, t in enumerate(columns)}
+    row_of = {d: i for i, d in enumerate(sorted_dates)}
+    prices = np.zeros((len(sorted_dates), len(columns)))
+    for p in raw_prices:
+        prices[row_of[p.date], col_of[p.ticker]] = _safe_float(p.close_price)
 
-    for i, day in enumerate(sorted_dates):
-        day_prices = price_map[day]
-        
-        # 1. Update last known prices with today's available data
-        for t in fetch_tickers:
-            p = day_prices.get(t, Decimal("0"))
-            if p > 0:
-                last_known_prices[t] = p
-            elif t in last_known_prices:
-                # Fallback to previous day's price if missing
-                day_prices[t] = last_known_prices[t]
-
-        # 2. Capture Base Prices (First non-zero occurrence)
-        for t in fetch_tickers:
-            price = last_known_prices.get(t, Decimal("0"))
-            if t not in ticker_base_prices and price > 0:
-                ticker_base_prices[t] = price
-
-        # 3. Calculate Portfolio Value
-        val_t = Decimal("0")
-        for h in holdings:
-            # Use forward-filled price
-            p = day_prices.get(h.ticker, Decimal("0"))
-            if p == 0:
-                 p = last_known_prices.get(h.ticker, Decimal("0"))
-            val_t += _d(h.total_volume) * p
-        portfolio_daily_values.append(val_t)
-        
-        if first_valid_port_idx == -1 and val_t > 0:
-            first_valid_port_idx = i
-
-    base_nav = portfolio_daily_values[first_valid_port_idx] if first_valid_port_idx != -1 else Decimal("0")
+    # Forward-fill from the last positive close (prevents nosedive on missing data)
+    valid = prices > 0
+    last_idx = np.maximum.accumulate(np.where(valid, np.arange(len(sorted_dates))[:, None], 0), axis=0)
+    seen = np.maximum.accumulate(valid, axis=0)
+    filled = np.where(seen, np.take_along_axis(prices, last_idx, axis=0), 0.0)
 
+    # Base price = first positive close in the window
+    base = np.where(valid.any(axis=0), prices[valid.argmax(axis=0), np.arange(len(columns))], 0.0)
+    ticker_growth = _growth_pct(filled, base)
+
+    # Portfolio value = current holdings x forward-filled prices
+    volumes = np.zeros(len(columns))
+    for h in holdings:
+        volumes[col_of[h.ticker]] += _safe_float(h.total_volume)
+    port_values = filled @ volumes
+    positive = np.flatnonzero(port_values > 0)
+    first_valid_port_idx = int(positive[0]) if positive.size else -1
+    base_nav = float(port_values[first_valid_port_idx]) if first_valid_port_idx != -1 else 0.0
+    port_growth = np.zeros(len(sorted_dates))
+    if base_nav > 0:
+        port_growth[first_valid_port_idx:] = (port_values[first_valid_port_idx:] - base_nav) * 100 / base_nav
+
+    port_growth_list = port_growth.tolist()
+    ticker_growth_rows = ticker_growth.tolist()
     series: List[Dict[str, Any]] = []
     for i, day in enumerate(sorted_dates):
-        day_prices = price_map[day]
-        item = {"date": day.strftime("%Y-%m-%d")}
-        
-        # 1. PORTFOLIO GROWTH
-        val_t = portfolio_daily_values[i]
-        p_growth = Decimal("0")
-        if base_nav > 0 and i >= first_valid_port_idx:
-            p_growth = (val_t - base_nav) / base_nav * 100
-        item["PORTFOLIO"] = round(_safe_float(p_growth), 2)
-        
-        # 2. TICKER GROWTH (Indices & Stocks)
+        item = {"date": day.strftime("%Y-%m-%d"), "PORTFOLIO": round(_safe_float(port_growth_list[i]), 2)}
+        row = ticker_growth_rows[i]
         for t in fetch_tickers:
-            t_growth = Decimal("0")
-            # Use forward-filled price for consistency
-            curr_p = day_prices.get(t, Decimal("0"))
-            base_p = ticker_base_prices.get(t, Decimal("0"))
-            
-            if base_p > 0 and curr_p > 0:
-                t_growth = (curr_p - base_p) / base_p * 100
-            item[t] = round(_safe_float(t_growth), 2)
-
+            item[t] = round(_safe_float(row[col_of[t]]), 2)
         series.append(item)
 
     return {
@@ -278,101 +203,170 @@ def growth_series(db: Session, period: str = "1m") -> Dict[str, Any]:
     }
 
 
-def nav_history(db: Session, start_date: date | None = None, end_date: date | None = None, limit: int = 30) -> Dict[str, Any]:
+NAV_HISTORY_DEFAULT_LIMIT = 30
+NAV_HISTORY_RANGE_LIMIT = 500
+
+
+def encode_nav_cursor(d: date) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"d": d.isoformat()}).encode()).decode().rstrip("=")
+
+
+def decode_nav_cursor(cursor: str) -> date:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return date.fromisoformat(json.loads(raw)["d"])
+    except Exception:
+        raise ValidationError("Invalid cursor.")
+
+
+def _nav_rows(start_date: date | None, end_date: date | None, before: date | None):
     """
-    Returns historical NAV records with performance summary metrics.
+    Snapshots with prev_nav from LEAD over the range not yet cut by start_date (so the oldest row
+    still sees its predecessor) and the day's net flow as a correlated sum over the created_at index.
     """
-    query = db.query(models.DailySnapshot)
-    if start_date:
-        search_start = start_date - timedelta(days=7)
-        query = query.filter(models.DailySnapshot.date >= search_start)
+    snap = models.DailySnapshot
+    cf = models.CashFlow
+
+    window = select(
+        snap.date.label("date"),
+        snap.total_nav.label("total_nav"),
+        func.lead(snap.total_nav).over(order_by=snap.date.desc()).label("prev_nav"),
+    )
     if end_date:
-        query = query.filter(models.DailySnapshot.date <= end_date)
-    
-    snaps = query.order_by(desc(models.DailySnapshot.date)).all()
-    if not start_date:
-        snaps = snaps[:limit]
+        window = window.where(snap.date <= end_date)
+    if before:
+        window = window.where(snap.date < before)
+    w = window.subquery()
+
+    net_flow = (
+        select(func.coalesce(func.sum(case((cf.type == models.CashFlowType.WITHDRAW, -cf.amount), else_=cf.amount)), 0))
+        .where(cf.created_at >= w.c.date, cf.created_at < w.c.date + literal(1))
+        .scalar_subquery()
+    )
+    q = select(w.c.date, w.c.total_nav, w.c.prev_nav, net_flow.label("net_flow"))
+    if start_date:
+        q = q.where(w.c.date >= start_date)
+    return q
+
+
+def _nav_page_query(start_date: date | None, end_date: date | None, before: date | None, limit: int):
+    """Newest-first keyset page of snapshots (limit + 1 rows to detect a next page)."""
+    rows = _nav_rows(start_date, end_date, before).subquery()
+    return select(rows).order_by(rows.c.date.desc()).limit(limit + 1)
+
+
+def _nav_range_summary(db: Session, start_date: date, end_date: date | None) -> Dict[str, Any]:
+    """
+    Summary of the whole [start_date, end_date] range in one aggregate, independent of the page:
+    TWR = exp(sum(ln(1 + r))) with r from _calc_profit_pct's SSI formula per day.
+    """
+    base = _nav_rows(start_date, end_date, None).subquery()
+    prev = func.coalesce(base.c.prev_nav, 0)
+    rows = select(
+        base.c.total_nav,
+        prev.label("prev_nav"),
+        base.c.net_flow,
+        func.first_value(prev).over(order_by=base.c.date.asc()).label("start_nav"),
+        func.first_value(base.c.total_nav).over(order_by=base.c.date.desc()).label("end_nav"),
+    ).subquery()
+
+    denom = rows.c.prev_nav + case((rows.c.net_flow > 0, rows.c.net_flow), else_=0)
+    growth = 1 + case((denom > 0, (rows.c.total_nav - rows.c.prev_nav - rows.c.net_flow) / denom), else_=0)
+    agg = db.execute(
+        select(
+            func.count().label("n"),
+            func.max(rows.c.start_nav).label("start_nav"),
+            func.max(rows.c.end_nav).label("end_nav"),
+            func.sum(rows.c.net_flow).label("net_flow"),
+            func.sum(case((growth > 0, func.ln(cast(growth, Float))), else_=0)).label("log_growth"),
+            func.sum(case((growth <= 0, 1), else_=0)).label("wiped"),
+        )
+    ).one()
+
+    if not agg.n:
+        return {"start_nav": 0, "end_nav": 0, "net_flow": 0, "total_profit": 0, "total_performance_pct": 0}
+    start_nav, end_nav, flow = _d(agg.start_nav), _d(agg.end_nav), _d(agg.net_flow)
+    perf_pct = -100.0 if agg.wiped else (math.exp(float(agg.log_growth or 0)) - 1) * 100
+    return {
+        "start_nav": _safe_float(start_nav),
+        "end_nav": _safe_float(end_nav),
+        "net_flow": _safe_float(flow),
+        # End = Start + Flow + Profit
+        "total_profit": _safe_float(end_nav - start_nav - flow),
+        "total_performance_pct": _safe_float(perf_pct),
+    }
+
+
+def nav_history(
+    db: Session,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> Dict[str, Any]:
+    """
+    Returns historical NAV records (newest first, keyset-paginated) with performance summary metrics.
+    Pass the returned `next_cursor` back as `cursor` for the next (older) page.
+    """
+    limit = max(1, min(limit or (NAV_HISTORY_RANGE_LIMIT if start_date else NAV_HISTORY_DEFAULT_LIMIT), NAV_HISTORY_RANGE_LIMIT))
+    before = decode_nav_cursor(cursor) if cursor else None
 
-    if snaps:
-        flows_map = _get_flows_map(db, snaps[-1].date, snaps[0].date)
-    else:
-        flows_map = {}
+    rows = db.execute(_nav_page_query(start_date, end_date, before, limit)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
 
     res: List[Dict[str, Any]] = []
     total_r_plus_1 = 1.0
-    total_net_flow = Decimal("0")
-    cached_start_nav = None  # Optimize: Store Start NAV from loop to avoid redundant query
-
-    for i in range(len(snaps)):
-        curr = snaps[i]
-        if start_date and curr.date < start_date:
-            continue
-        curr_nav = _d(curr.total_nav)
-        
-        if i + 1 < len(snaps):
-            prev = snaps[i + 1]
-            prev_nav = _d(prev.total_nav)
-            net_flow = flows_map.get(curr.date, Decimal("0"))
+    visible_start_nav = Decimal("0")
+
+    for i, row in enumerate(rows):
+        curr_nav = _d(row.total_nav)
+        net_flow = _d(row.net_flow)
+        is_oldest = i == len(rows) - 1
+
+        if row.prev_nav is None:
+            # GENESIS: No predecessor exists at all. This is Day 1 (Start NAV = 0).
+            prev_nav = Decimal("0")
             profit, pct = _calc_profit_pct(curr_nav, prev_nav, net_flow)
             if math.isfinite(pct):
                 total_r_plus_1 *= (1 + pct / 100)
-            total_net_flow += net_flow
-            change = curr_nav - prev_nav - net_flow
+            change = profit
         else:
-            # Viewing the oldest snapshot in this list
-            # We must check if there is a real predecessor in the DB to calculate change/pct
-            prev_db = db.query(models.DailySnapshot).filter(models.DailySnapshot.date < curr.date).order_by(desc(models.DailySnapshot.date)).first()
-            
-            if prev_db:
-                # Predecessor exists outside usage limit, but we can't calculate exact TWR contribution for the *window* 
-                # effectively without fetching it. But for "Change" display, we can calc it.
-                prev_nav = _d(prev_db.total_nav)
-                net_flow = flows_map.get(curr.date, Decimal("0"))
-                # Note: We do NOT add this to total_r_plus_1 because that would imply we are measuring return SINCE prev_db date,
-                # but our window starts at 'curr.date'. TWRR is usually relative to the window start.
-                # HOWEVER, if the user wants "Lifetime TWRR" when viewing Full History, we need to include everything.
-                
-                # If we are just slicing (limit=30), we ignore the return of the boundary day relative to outside.
-                pct = 0.0
-                change = curr_nav - prev_nav - net_flow
-                cached_start_nav = prev_nav # Cache for summary
-            else:
-                # GENESIS: No predecessor exists at all. This is Day 1.
-                # Start NAV = 0.
-                prev_nav = Decimal("0")
-                net_flow = flows_map.get(curr.date, Decimal("0"))
-                
-                # Calculate return for Day 1
-                profit, pct = _calc_profit_pct(curr_nav, prev_nav, net_flow)
-                if math.isfinite(pct):
-                    total_r_plus_1 *= (1 + pct / 100)
-                
-                total_net_flow += net_flow
-                change = profit # For Day 1, Change = Profit (NAV - Flow)
-                cached_start_nav = Decimal("0") # Cache for summary
+            prev_nav = _d(row.prev_nav)
+            change = curr_nav - prev_nav - net_flow
+            # The oldest row of a page still has its predecessor (LEAD), so its return is real;
+            # the page summary starts from that predecessor's NAV and compounds it too.
+            _, pct = _calc_profit_pct(curr_nav, prev_nav, net_flow)
+            if math.isfinite(pct):
+                total_r_plus_1 *= (1 + pct / 100)
+
+        if is_oldest:
+            visible_start_nav = prev_nav
 
         res.append({
-            "date": curr.date.strftime("%Y-%m-%d"),
+            "date": row.date.strftime("%Y-%m-%d"),
             "nav": _safe_float(curr_nav),
             "change": _safe_float(change),
             "pct": pct,
         })
-    
-    perf_pct = (total_r_plus_1 - 1) * 100
-    
+
+    next_cursor = encode_nav_cursor(rows[-1].date) if has_more and rows else None
+
+    if start_date:
+        # A date range is summarized as a whole, whichever page is being returned
+        return {"history": res, "summary": _nav_range_summary(db, start_date, end_date), "next_cursor": next_cursor}
+
     if not res:
-        return {"history": [], "summary": {"start_nav": 0, "end_nav": 0, "net_flow": 0, "total_profit": 0, "total_performance_pct": 0}}
+        return {
+            "history": [],
+            "summary": {"start_nav": 0, "end_nav": 0, "net_flow": 0, "total_profit": 0, "total_performance_pct": 0},
+            "next_cursor": None,
+        }
 
+    # No range: the summary covers the visible page
+    perf_pct = (total_r_plus_1 - 1) * 100
     visible_end_nav = res[0]["nav"]
     visible_profit = sum(item["change"] for item in res)
-    
-    # Determine correct Start NAV relative to the window
-    # Recalculated from loop (cached_start_nav) to avoid redundant DB query
-    if cached_start_nav is not None:
-         visible_start_nav = cached_start_nav
-    else:
-        # Fallback (should not happen if loop ran)
-        visible_start_nav = 0
 
     # Derive Net Flow from accounting identity: End = Start + Flow + Profit
     visible_net_flow = _d(visible_end_nav) - _d(visible_start_nav) - _d(visible_profit)
@@ -385,4 +379,4 @@ def nav_history(db: Session, start_date: date | None = None, end_date: date | No
         "total_performance_pct": _safe_float(perf_pct)
     }
 
-    return {"history": res, "summary": summary}
+    return {"history": res, "summary": summary, "next_cursor": next_cursor}
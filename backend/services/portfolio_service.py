@@ -8,6 +8,7 @@ import models
 import crawler
 from core.redis_client import cache_get, cache_set
 from core.logger import logger
+from services import ledger_service
 
 CACHE_KEY = "dashboard:portfolio"
 
@@ -61,21 +62,24 @@ def _lazy_interest(asset: models.AssetSummary, db: Session) -> None:
 
     if interest > Decimal("0.01"):
         asset.cash_balance = _d(asset.cash_balance) + interest
-        db.add(
-            models.CashFlow(
-                type=models.CashFlowType.INTEREST,
-                amount=interest,
-                description=f"Overnight interest ({days} days)",
-            )
+        cash_log = models.CashFlow(
+            type=models.CashFlowType.INTEREST,
+            amount=interest,
+            description=f"Overnight interest ({days} days)",
+        )
+        db.add(cash_log)
+        ledger_service.record(
+            db, models.LedgerEventType.INTEREST,
+            cash_delta=interest, cash_flow=cash_log, description=cash_log.description,
         )
         asset.last_interest_calc_date = today
         logger.info(f"Applied interest: {interest:,.2f} VNĐ for {days} days.")
         db.commit()
 
 
-from core.cache import cache
+from core.cache import PORTFOLIO_TAG, cache
 
-@cache(ttl=60, key=CACHE_KEY)
+@cache(ttl=60, key=CACHE_KEY, tags=[PORTFOLIO_TAG])
 def calculate_portfolio(db: Session) -> Dict[str, Any]:
     """
     Calculates detailed portfolio metrics including real-time valuation, 
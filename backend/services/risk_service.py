@@ -0,0 +1,348 @@
+# services/risk_service.py
+"""
+Risk analytics for the portfolio (daily_snapshots NAV, flow-adjusted) and every current holding
+(historical_prices closes), all aligned on the snapshot dates:
+volatility (period + rolling), max drawdown with duration, Sharpe/Sortino, beta/correlation
+against VNINDEX and VN30.
+
+Window metrics are vectorized over a (days x series) return matrix. Since-inception portfolio
+stats live in a running accumulator (sums, peak, drawdown state) that on_new_snapshot() advances
+by one day instead of re-reading the whole history.
+"""
+from __future__ import annotations
+
+import copy
+import math
+import os
+import warnings
+from dataclasses import asdict, dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import models
+from core.cache import HISTORY_TAG, PORTFOLIO_TAG, cache
+from core.logger import logger
+from core.redis_client import cache_get, cache_set
+from services import cashflow_ledger
+from services.nav_reconstruction import price_matrix
+
+BENCHMARKS = ("VNINDEX", "VN30")
+TRADING_DAYS_PER_YEAR = 252
+ROLLING_WINDOW = int(os.getenv("RISK_ROLLING_WINDOW", "20"))
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", "0.03"))
+PERIOD_DAYS = {"3m": 90, "6m": 180, "1y": 365, "3y": 1095}
+
+ACCUMULATOR_KEY = "risk_acc_v1"
+ACCUMULATOR_TTL_SEC = 7 * 24 * 3600
+
+_ANN = math.sqrt(TRADING_DAYS_PER_YEAR)
+_RF_DAILY = RISK_FREE_RATE / TRADING_DAYS_PER_YEAR
+
+
+# --- vectorized column metrics ---
+def _price_returns(prices: np.ndarray) -> np.ndarray:
+    prev, curr = prices[:-1], prices[1:]
+    ok = (prev > 0) & (curr > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(ok, curr / np.where(ok, prev, 1.0) - 1.0, np.nan)
+
+
+def _nav_returns(navs: np.ndarray, flows: np.ndarray) -> np.ndarray:
+    """Flow-adjusted daily returns (same SSI formula as performance_engine)."""
+    prev, f = navs[:-1], flows[1:]
+    denom = prev + np.maximum(f, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denom > 0, (navs[1:] - prev - f) / denom, np.nan)
+
+
+def _drawdown(r: np.ndarray) -> Dict[str, np.ndarray]:
+    """Max drawdown (negative fraction) and its longest under-water stretch in days, per column."""
+    wealth = np.cumprod(1.0 + np.nan_to_num(r), axis=0)
+    wealth = np.vstack([np.ones((1, r.shape[1])), wealth])
+    peak = np.maximum.accumulate(wealth, axis=0)
+    dd = wealth / peak - 1.0
+    idx = np.arange(len(wealth))[:, None]
+    last_peak = np.maximum.accumulate(np.where(dd >= 0, idx, 0), axis=0)
+    under = idx - last_peak
+    return {
+        "max_drawdown": dd.min(axis=0),
+        "max_drawdown_days": under.max(axis=0),
+        "current_drawdown": dd[-1],
+        "current_drawdown_days": under[-1],
+    }
+
+
+def _column_stats(r: np.ndarray, bench: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """r: (days x series) with NaN gaps; bench: name -> (days,) returns."""
+    n = np.sum(~np.isnan(r), axis=0)
+    with warnings.catch_warnings():
+        # All-NaN / single-observation columns just yield NaN (reported as null)
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(r, axis=0)
+        std = np.nanstd(r, axis=0, ddof=1)
+        downside = np.sqrt(np.nanmean(np.minimum(r - _RF_DAILY, 0.0) ** 2, axis=0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = {
+            "observations": n,
+            "volatility": std * _ANN,
+            "annual_return": (1.0 + mean) ** TRADING_DAYS_PER_YEAR - 1.0,
+            "sharpe": np.where(std > 0, (mean - _RF_DAILY) / std * _ANN, np.nan),
+            "sortino": np.where(downside > 0, (mean - _RF_DAILY) / downside * _ANN, np.nan),
+        }
+        for name, b in bench.items():
+            both = ~np.isnan(r) & ~np.isnan(b)[:, None]
+            rc = np.where(both, r, 0.0)
+            bc = np.where(both, b[:, None], 0.0)
+            k = both.sum(axis=0)
+            mr = rc.sum(axis=0) / np.maximum(k, 1)
+            mb = bc.sum(axis=0) / np.maximum(k, 1)
+            cov = ((rc - mr) * (bc - mb) * both).sum(axis=0) / np.maximum(k - 1, 1)
+            var_b = (((bc - mb) ** 2) * both).sum(axis=0) / np.maximum(k - 1, 1)
+            var_r = (((rc - mr) ** 2) * both).sum(axis=0) / np.maximum(k - 1, 1)
+            out[f"beta_{name.lower()}"] = np.where(var_b > 0, cov / var_b, np.nan)
+            out[f"corr_{name.lower()}"] = np.where((var_b > 0) & (var_r > 0), cov / np.sqrt(var_b * var_r), np.nan)
+    out.update(_drawdown(r))
+    return out
+
+
+def _rolling_vol(r: np.ndarray, window: int) -> np.ndarray:
+    """Annualized rolling std of a 1-D return series via cumulative sums (NaN until the window fills)."""
+    x = np.nan_to_num(r)
+    valid = (~np.isnan(r)).astype(float)
+    c1 = np.concatenate(([0.0], np.cumsum(x)))
+    c2 = np.concatenate(([0.0], np.cumsum(x * x)))
+    cn = np.concatenate(([0.0], np.cumsum(valid)))
+    out = np.full(len(r), np.nan)
+    if len(r) < window:
+        return out
+    s1 = c1[window:] - c1[:-window]
+    s2 = c2[window:] - c2[:-window]
+    n = cn[window:] - cn[:-window]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = (s2 - s1 * s1 / n) / (n - 1)
+    out[window - 1:] = np.where(n > 1, np.sqrt(np.maximum(var, 0.0)) * _ANN, np.nan)
+    return out
+
+
+def _clean(x: Any, digits: int = 6) -> Optional[float]:
+    x = float(x)
+    return round(x, digits) if math.isfinite(x) else None
+
+
+def _series_row(stats: Dict[str, np.ndarray], j: int) -> Dict[str, Any]:
+    row = {}
+    for k, v in stats.items():
+        if k in ("observations", "max_drawdown_days", "current_drawdown_days"):
+            row[k] = int(v[j])
+        else:
+            row[k] = _clean(v[j])
+    return row
+
+
+# --- window metrics ---
+def _risk_key(db: Session, period: str = "1y") -> str:
+    return f"risk_v1_{period}"
+
+
+@cache(ttl=600, key_fn=_risk_key, tags=[PORTFOLIO_TAG, HISTORY_TAG])
+def risk_metrics(db: Session, period: str = "1y") -> Dict[str, Any]:
+    """Portfolio + per-holding risk over `period`, plus the since-inception accumulator."""
+    start = date.today() - timedelta(days=PERIOD_DAYS.get(period, 365))
+    snaps = (
+        db.query(models.DailySnapshot.date, models.DailySnapshot.total_nav)
+        .filter(models.DailySnapshot.date >= start)
+        .order_by(models.DailySnapshot.date)
+        .all()
+    )
+    base = {"period": period, "risk_free_rate": RISK_FREE_RATE, "benchmarks": list(BENCHMARKS)}
+    if len(snaps) < 3:
+        return {**base, "portfolio": None, "holdings": [], "rolling_volatility": [], "inception": get_accumulator(db)}
+
+    days = np.array([s.date for s in snaps], dtype="datetime64[D]")
+    navs = np.array([float(s.total_nav or 0) for s in snaps])
+    flows = _flows_on(db, days)
+
+    holdings = db.query(models.TickerHolding.ticker).filter(models.TickerHolding.total_volume > 0).all()
+    tickers = sorted({h[0].upper() for h in holdings})
+
+    px = price_matrix(db, [*BENCHMARKS, *tickers], days)
+    bench_r = {name: _price_returns(px[:, [i]])[:, 0] for i, name in enumerate(BENCHMARKS)}
+    r = np.column_stack([_nav_returns(navs, flows), _price_returns(px[:, len(BENCHMARKS):])]) if tickers \
+        else _nav_returns(navs, flows)[:, None]
+
+    stats = _column_stats(r, bench_r)
+    rolling = _rolling_vol(r[:, 0], ROLLING_WINDOW)
+
+    return {
+        **base,
+        "start_date": str(days[0]),
+        "end_date": str(days[-1]),
+        "portfolio": _series_row(stats, 0),
+        "holdings": [{"ticker": t, **_series_row(stats, j + 1)} for j, t in enumerate(tickers)],
+        "rolling_volatility": [
+            {"date": str(d), "value": _clean(v)} for d, v in zip(days[1:], rolling) if math.isfinite(v)
+        ],
+        "inception": get_accumulator(db),
+    }
+
+
+def _flows_on(db: Session, days: np.ndarray) -> np.ndarray:
+    """External flows binned into the sub-period (previous snapshot, this snapshot]."""
+    flow_days, flow_amt = cashflow_ledger.get_ledger(db).daily_slice(cashflow_ledger.EXTERNAL, None, None)
+    flows = np.zeros(len(days))
+    if len(flow_days):
+        idx = np.searchsorted(days, flow_days, side="left")
+        keep = (idx < len(days)) & (flow_days > days[0])
+        np.add.at(flows, idx[keep], flow_amt[keep])
+    return flows
+
+
+# --- since-inception accumulator ---
+@dataclass
+class RiskAccumulator:
+    last_date: Optional[str] = None
+    last_nav: float = 0.0
+    n: int = 0
+    s1: float = 0.0
+    s2: float = 0.0
+    down2: float = 0.0
+    wealth: float = 1.0
+    peak: float = 1.0
+    max_drawdown: float = 0.0
+    under_days: int = 0
+    max_drawdown_days: int = 0
+    # per benchmark: last close, n, sum b, sum b^2, sum r*b, sum r (paired)
+    bench: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+    def push(self, day: date, nav: float, flow: float, bench_px: Dict[str, float]) -> None:
+        if self.last_date is not None:
+            denom = self.last_nav + max(flow, 0.0)
+            if denom > 0:
+                r = (nav - self.last_nav - flow) / denom
+                self.n += 1
+                self.s1 += r
+                self.s2 += r * r
+                self.down2 += min(r - _RF_DAILY, 0.0) ** 2
+                self.wealth *= 1.0 + r
+                if self.wealth >= self.peak:
+                    self.peak, self.under_days = self.wealth, 0
+                else:
+                    self.under_days += 1
+                self.max_drawdown = min(self.max_drawdown, self.wealth / self.peak - 1.0)
+                self.max_drawdown_days = max(self.max_drawdown_days, self.under_days)
+                for name, p in bench_px.items():
+                    b = self.bench.setdefault(name, {"last": 0.0, "n": 0, "sb": 0.0, "sbb": 0.0, "srb": 0.0, "sr": 0.0, "srr": 0.0})
+                    if b["last"] > 0 and p > 0:
+                        rb = p / b["last"] - 1.0
+                        b["n"] += 1
+                        b["sb"] += rb
+                        b["sbb"] += rb * rb
+                        b["srb"] += r * rb
+                        b["sr"] += r
+                        b["srr"] += r * r
+        for name, p in bench_px.items():
+            if p > 0:
+                self.bench.setdefault(name, {"last": 0.0, "n": 0, "sb": 0.0, "sbb": 0.0, "srb": 0.0, "sr": 0.0, "srr": 0.0})["last"] = p
+        self.last_date = str(day)
+        self.last_nav = nav
+
+    def summary(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"since": None, "as_of": self.last_date, "observations": self.n}
+        if self.n > 1:
+            mean = self.s1 / self.n
+            var = max((self.s2 - self.n * mean * mean) / (self.n - 1), 0.0)
+            std = math.sqrt(var)
+            down = math.sqrt(self.down2 / self.n)
+            out.update({
+                "volatility": _clean(std * _ANN),
+                "sharpe": _clean((mean - _RF_DAILY) / std * _ANN) if std > 0 else None,
+                "sortino": _clean((mean - _RF_DAILY) / down * _ANN) if down > 0 else None,
+            })
+        out.update({
+            "max_drawdown": _clean(self.max_drawdown),
+            "max_drawdown_days": self.max_drawdown_days,
+            "current_drawdown": _clean(self.wealth / self.peak - 1.0),
+            "current_drawdown_days": self.under_days,
+        })
+        for name, b in self.bench.items():
+            k = b["n"]
+            if k > 1:
+                cov = (b["srb"] - b["sr"] * b["sb"] / k) / (k - 1)
+                var_b = (b["sbb"] - b["sb"] ** 2 / k) / (k - 1)
+                var_r = (b["srr"] - b["sr"] ** 2 / k) / (k - 1)
+                out[f"beta_{name.lower()}"] = _clean(cov / var_b) if var_b > 0 else None
+                out[f"corr_{name.lower()}"] = _clean(cov / math.sqrt(var_b * var_r)) if var_b > 0 and var_r > 0 else None
+        return out
+
+
+def _bench_closes(db: Session, day: date) -> Dict[str, float]:
+    px = price_matrix(db, list(BENCHMARKS), np.array([day], dtype="datetime64[D]"))[0]
+    return {name: float(p) for name, p in zip(BENCHMARKS, px) if math.isfinite(p)}
+
+
+def rebuild_accumulator(db: Session) -> RiskAccumulator:
+    """Full pass over daily_snapshots (first run, or when history was rewritten)."""
+    snaps = db.query(models.DailySnapshot.date, models.DailySnapshot.total_nav).order_by(models.DailySnapshot.date).all()
+    acc = RiskAccumulator()
+    if snaps:
+        days = np.array([s.date for s in snaps], dtype="datetime64[D]")
+        flows = _flows_on(db, days)
+        px = price_matrix(db, list(BENCHMARKS), days)
+        for i, s in enumerate(snaps):
+            closes = {name: float(px[i, j]) for j, name in enumerate(BENCHMARKS) if math.isfinite(px[i, j])}
+            acc.push(s.date, float(s.total_nav or 0), float(flows[i]), closes)
+        acc_dict = asdict(acc)
+        acc_dict["first_date"] = str(snaps[0].date)
+        cache_set(ACCUMULATOR_KEY, acc_dict, ttl=ACCUMULATOR_TTL_SEC)
+    return acc
+
+
+def _load_accumulator() -> Optional[tuple[RiskAccumulator, Optional[str]]]:
+    cached = cache_get(ACCUMULATOR_KEY)
+    if not cached:
+        return None
+    # L1 returns the stored object itself: popping or pushing into it would corrupt the cache entry
+    raw = copy.deepcopy(cached)
+    first = raw.pop("first_date", None)
+    try:
+        return RiskAccumulator(**raw), first
+    except TypeError:
+        return None
+
+
+def on_new_snapshot(db: Session, day: date, nav: float) -> None:
+    """
+    Advances the accumulator by one day when the previous state ends right before `day`;
+    otherwise (gap, same-day update, backfilled history) it is rebuilt from scratch.
+    """
+    try:
+        loaded = _load_accumulator()
+        prev = (
+            db.query(models.DailySnapshot.date)
+            .filter(models.DailySnapshot.date < day)
+            .order_by(models.DailySnapshot.date.desc())
+            .first()
+        )
+        if loaded is None or prev is None or loaded[0].last_date != str(prev[0]):
+            rebuild_accumulator(db)
+            return
+        acc, first = loaded
+        flow = float(cashflow_ledger.net_flow(db, prev[0] + timedelta(days=1), day, column=cashflow_ledger.EXTERNAL))
+        acc.push(day, nav, flow, _bench_closes(db, day))
+        cache_set(ACCUMULATOR_KEY, {**asdict(acc), "first_date": first}, ttl=ACCUMULATOR_TTL_SEC)
+    except Exception as e:
+        logger.warning(f"Risk accumulator update failed: {e}")
+
+
+def get_accumulator(db: Session) -> Dict[str, Any]:
+    loaded = _load_accumulator()
+    if loaded is None:
+        acc, first = rebuild_accumulator(db), None
+        first_snap = db.query(models.DailySnapshot.date).order_by(models.DailySnapshot.date).first()
+        first = str(first_snap[0]) if first_snap else None
+    else:
+        acc, first = loaded
+    return {**acc.summary(), "since": first}
@@ -10,6 +10,7 @@ import schemas
 from core.cache import invalidate_dashboard_cache
 from core.logger import logger
 from core.exceptions import ValidationError, EntityNotFoundException
+from services import ledger_service, lot_engine
 from services.market_service import sync_historical_task
 
 def process_buy_order(db: Session, req: schemas.BuyStockRequest, background_tasks) -> Dict[str, Any]:
@@ -55,12 +56,12 @@ def process_buy_order(db: Session, req: schemas.BuyStockRequest, background_task
 
     # 4. Record Transaction and Cashflow
     asset.cash_balance -= total_cost
-    db.add(models.CashFlow(
+    cash_log = models.CashFlow(
         type=models.CashFlowType.WITHDRAW, 
         amount=total_cost, 
         description=f"Buy {int(volume):,} {ticker}"
-    ))
-    db.add(models.StockTransaction(
+    )
+    tx = models.StockTransaction(
         ticker=ticker, 
         type=models.TransactionType.BUY, 
         volume=volume, 
@@ -69,7 +70,13 @@ def process_buy_order(db: Session, req: schemas.BuyStockRequest, background_task
         total_value=total_cost, 
         note=req.note,
         transaction_date=req.transaction_date
-    ))
+    )
+    db.add_all([cash_log, tx])
+    ledger_service.record(
+        db, models.LedgerEventType.BUY,
+        cash_delta=-total_cost, ticker=ticker, volume_delta=volume, cost_delta=total_cost,
+        stock_transaction=tx, cash_flow=cash_log, description=cash_log.description,
+    )
 
     db.commit()
     logger.info(f"Trade Executed [BUY]: {int(volume):,} {ticker} @ {price_vnd:,.0f}. Total: {total_cost:,.0f}")
@@ -104,8 +111,22 @@ def process_sell_order(db: Session, req: schemas.SellStockRequest) -> Dict[str,
     tax = gross_revenue * Decimal(str(req.tax_rate))
     net_proceeds = gross_revenue - fee - tax
 
-    # Profit Calculation (FIFO/Average Cost based on average_price)
-    cost_basis = volume_to_sell * holding.average_price
+    # Profit Calculation: FIFO / specific lot, or average cost (holding.average_price)
+    method = req.lot_method or lot_engine.default_method(db, ticker, float(holding.total_volume))
+    lot_id = None
+    remaining_unit_cost = None
+    if method == lot_engine.LOT_METHOD_AVG:
+        cost_basis = volume_to_sell * holding.average_price
+    else:
+        basis, lot_id = lot_engine.plan_sell(db, ticker, float(volume_to_sell), method, req.lot_id)
+        cost_basis = Decimal(str(round(basis, 4)))
+        remaining_volume = holding.total_volume - volume_to_sell
+        if lot_engine.covers_holding(db, ticker, float(holding.total_volume)):
+            remaining_unit_cost = lot_engine.unit_cost_after_sell(db, ticker, float(volume_to_sell), lot_id)
+        elif remaining_volume > 0:
+            # Part of the holding predates its BUY rows: take the lots' cost out of the blended book cost
+            book_cost = holding.total_volume * holding.average_price
+            remaining_unit_cost = float(max(book_cost - cost_basis, Decimal(0)) / remaining_volume)
     profit = net_proceeds - cost_basis
 
     # Update Holding
@@ -114,17 +135,20 @@ def process_sell_order(db: Session, req: schemas.SellStockRequest) -> Dict[str,
     if holding.total_volume <= 0:
         holding.liquidated_at = datetime.now()
         holding.average_price = 0
+    elif remaining_unit_cost is not None:
+        # Lot-based sell: the shares left carry the cost of the lots left, not the old blended average
+        holding.average_price = Decimal(str(round(remaining_unit_cost, 4)))
 
     # Record Transactions
     asset = db.query(models.AssetSummary).first()
     asset.cash_balance += net_proceeds
     
-    db.add(models.CashFlow(
+    cash_log = models.CashFlow(
         type=models.CashFlowType.DEPOSIT, 
         amount=net_proceeds, 
         description=f"Sell {int(volume_to_sell):,} {ticker}"
-    ))
-    db.add(models.StockTransaction(
+    )
+    tx = models.StockTransaction(
         ticker=ticker, 
         type=models.TransactionType.SELL, 
         volume=volume_to_sell, 
@@ -133,12 +157,19 @@ def process_sell_order(db: Session, req: schemas.SellStockRequest) -> Dict[str,
         tax=tax, 
         total_value=net_proceeds, 
         note=req.note,
-        transaction_date=req.transaction_date
-    ))
+        transaction_date=req.transaction_date,
+        lot_id=lot_id
+    )
+    db.add_all([cash_log, tx])
+    ledger_service.record(
+        db, models.LedgerEventType.SELL,
+        cash_delta=net_proceeds, ticker=ticker, volume_delta=-volume_to_sell, cost_delta=-cost_basis,
+        stock_transaction=tx, cash_flow=cash_log, description=cash_log.description,
+    )
     db.add(models.RealizedProfit(
         ticker=ticker, 
         volume=volume_to_sell, 
-        buy_avg_price=holding.average_price if holding.total_volume > 0 else (cost_basis/volume_to_sell), 
+        buy_avg_price=cost_basis / volume_to_sell, 
         sell_price=price_vnd, 
         net_profit=profit,
         sell_date=req.transaction_date
@@ -159,6 +190,8 @@ def process_sell_order(db: Session, req: schemas.SellStockRequest) -> Dict[str,
 def undo_last_buy_order(db: Session) -> Dict[str, Any]:
     """
     Reverts the most recent buy transaction.
+    Ledger-recorded buys are reversed by replay (see ledger_service.reverse_event); buys that
+    predate the ledger fall back to compensating writes.
     """
     last_tx = (
         db.query(models.StockTransaction)
@@ -169,37 +202,24 @@ def undo_last_buy_order(db: Session) -> Dict[str, Any]:
     if not last_tx:
         raise ValidationError("No buy transaction to revert.")
 
-    asset = db.query(models.AssetSummary).first()
-    holding = db.query(models.TickerHolding).filter_by(ticker=last_tx.ticker).first()
+    event = ledger_service.last_open_event(db, models.LedgerEventType.BUY)
+    if event is not None and event.stock_transaction_id != last_tx.id:
+        event = None
 
     try:
-        if asset:
-            asset.cash_balance += Decimal(str(last_tx.total_value))
-        if holding:
-            if holding.total_volume <= last_tx.volume:
-                db.delete(holding)
-            else:
-                curr_total_cost = holding.total_volume * holding.average_price
-                new_vol = holding.total_volume - last_tx.volume
-                new_cost = curr_total_cost - Decimal(str(last_tx.total_value))
-                holding.total_volume = new_vol
-                holding.available_volume = new_vol
-                holding.average_price = new_cost / new_vol
-
-        # Find linked cashflow and delete
-        cash_log = (
-            db.query(models.CashFlow)
-            .filter(models.CashFlow.description.contains(last_tx.ticker))
-            .order_by(desc(models.CashFlow.id))
-            .first()
-        )
+        ticker = last_tx.ticker
+        tx_id = last_tx.id
+        if event is not None:
+            ledger_service.reverse_event(db, event, description=f"Undo buy #{tx_id}")
+            cash_log = db.get(models.CashFlow, event.cash_flow_id) if event.cash_flow_id else None
+        else:
+            cash_log = _undo_buy_compensating(db, last_tx)
+
         if cash_log:
             db.delete(cash_log)
-
-        ticker = last_tx.ticker
         db.delete(last_tx)
         db.commit()
-        logger.info(f"Undo completed for {ticker} transaction ID: {last_tx.id}")
+        logger.info(f"Undo completed for {ticker} transaction ID: {tx_id}")
         
         invalidate_dashboard_cache()
         return {"ticker": ticker}
@@ -208,3 +228,45 @@ def undo_last_buy_order(db: Session) -> Dict[str, Any]:
         db.rollback()
         logger.error(f"Undo operation failed: {e}")
         raise ValidationError(f"Could not undo transaction: {str(e)}")
+
+
+def _undo_buy_compensating(db: Session, last_tx: models.StockTransaction) -> Optional[models.CashFlow]:
+    """
+    Legacy undo for buys without a ledger event; returns the matching cashflow to delete.
+    The buy is already folded into the bootstrap snapshot, so the compensation is appended as an
+    untargeted REVERSAL carrying the opposite deltas, keeping replays equal to the read models.
+    """
+    asset = db.query(models.AssetSummary).first()
+    holding = db.query(models.TickerHolding).filter_by(ticker=last_tx.ticker).first()
+    total_value = Decimal(str(last_tx.total_value))
+    volume = Decimal(str(last_tx.volume))
+
+    if asset:
+        asset.cash_balance += total_value
+    if holding:
+        if holding.total_volume <= last_tx.volume:
+            db.delete(holding)
+        else:
+            curr_total_cost = holding.total_volume * holding.average_price
+            new_vol = holding.total_volume - last_tx.volume
+            new_cost = curr_total_cost - total_value
+            holding.total_volume = new_vol
+            holding.available_volume = new_vol
+            holding.average_price = new_cost / new_vol
+
+    # After the writes: on a ledger with no snapshot yet, record() snapshots the materialized rows
+    ledger_service.record(
+        db, models.LedgerEventType.REVERSAL,
+        cash_delta=total_value, ticker=last_tx.ticker, volume_delta=-volume, cost_delta=-total_value,
+        description=f"Undo buy #{last_tx.id} (pre-ledger)",
+    )
+
+    return (
+        db.query(models.CashFlow)
+        .filter(
+            models.CashFlow.type == models.CashFlowType.WITHDRAW,
+            models.CashFlow.description == f"Buy {int(last_tx.volume):,} {last_tx.ticker}",
+        )
+        .order_by(desc(models.CashFlow.id))
+        .first()
+    )
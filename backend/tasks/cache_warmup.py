@@ -0,0 +1,108 @@
+"""
+tasks/cache_warmup.py
+Pre-open cache warm-up: fills per-ticker caches before 9:00 so the first users do not
+all miss at once inside the upstream rate-limit window.
+"""
+import os
+import time
+from datetime import date
+
+from core.db import SessionLocal
+from core.logger import logger
+from core.redis_client import acquire_lock, get_redis
+import models
+
+from adapters import vci_adapter, vnstock_adapter
+from services.market.cache import mem_get, mem_get_many, mem_set, watchlist_access_scores
+from services.market.data_processor import get_trending_indicators_batch
+from services.market.watchlist_service import load_security_metadata
+
+# Rate budget: tối đa số lần gọi upstream (vnstock/VCI) cho 1 lần warm-up, nghỉ giữa các lần gọi
+WARMUP_MAX_UPSTREAM_CALLS = int(os.getenv("WARMUP_MAX_UPSTREAM_CALLS", "120"))
+WARMUP_SLEEP_SEC = float(os.getenv("WARMUP_SLEEP_SEC", "1.0"))
+# Mọi worker uvicorn đều chạy scheduler: chỉ worker giành được lock của ngày mới warm-up
+WARMUP_LOCK_TTL_MS = int(os.getenv("WARMUP_LOCK_TTL_MS", str(30 * 60 * 1000)))
+
+
+def _prioritized_tickers(db) -> list[str]:
+    """Mã đang nắm giữ trước, sau đó mã trong watchlist theo thứ tự watchlist được mở nhiều nhất."""
+    ordered: dict[str, None] = {}
+
+    held = (
+        db.query(models.TickerHolding.ticker)
+        .filter(models.TickerHolding.total_volume > 0)
+        .all()
+    )
+    for (t,) in held:
+        ordered.setdefault(t.upper(), None)
+
+    scores = watchlist_access_scores()
+    rows = db.query(models.WatchlistTicker.watchlist_id, models.WatchlistTicker.ticker).all()
+    by_watchlist: dict[int, list[str]] = {}
+    for wl_id, t in rows:
+        by_watchlist.setdefault(wl_id, []).append(t.upper())
+    for wl_id in sorted(by_watchlist, key=lambda i: (-scores.get(i, 0.0), i)):
+        for t in by_watchlist[wl_id]:
+            ordered.setdefault(t, None)
+
+    return list(ordered)
+
+
+def _upstream_backoff_active() -> bool:
+    r = get_redis()
+    try:
+        return bool(mem_get("vci_backoff") or (r and r.get("vci_rate_limit_backoff")))
+    except Exception:
+        return False
+
+
+def warm_caches_task() -> dict:
+    """
+    Warms security metadata and trending (DB only, all tickers), then ratios and daily
+    sparklines (upstream, within WARMUP_MAX_UPSTREAM_CALLS) in priority order.
+    Returns counters for logging.
+    """
+    started = time.time()
+    stats = {"tickers": 0, "metadata": 0, "trending": 0, "ratios": 0, "sparklines": 0, "skipped_budget": 0}
+
+    if get_redis() and not acquire_lock(f"cache_warmup:{date.today()}", WARMUP_LOCK_TTL_MS):
+        logger.info("[WARMUP] Another worker is warming caches, skipping")
+        return stats
+
+    with SessionLocal() as db:
+        tickers = _prioritized_tickers(db)
+        stats["tickers"] = len(tickers)
+        if not tickers:
+            return stats
+
+        # 1. DB-backed caches: rẻ, làm cho toàn bộ danh sách
+        stats["metadata"] = len(load_security_metadata(tickers))
+        stats["trending"] = len(get_trending_indicators_batch(tickers, db))
+
+    # 2. Upstream-backed caches: chỉ những key còn thiếu, theo thứ tự ưu tiên, trong ngân sách gọi API
+    cached = mem_get_many([*(f"ratios:{t}" for t in tickers), *(f"sparkline_v2:{t}" for t in tickers)])
+    jobs = []
+    for t in tickers:
+        if f"ratios:{t}" not in cached:
+            jobs.append(("ratios", t))
+        if f"sparkline_v2:{t}" not in cached:
+            jobs.append(("sparklines", t))
+
+    budget = WARMUP_MAX_UPSTREAM_CALLS
+    for i, (kind, t) in enumerate(jobs):
+        if budget <= 0 or _upstream_backoff_active():
+            stats["skipped_budget"] = len(jobs) - i
+            break
+        try:
+            if kind == "ratios":
+                vnstock_adapter.get_financial_ratios(t, mem_get, mem_set)
+            else:
+                vci_adapter.get_sparkline_data(t, mem_get, mem_set)
+            stats[kind] += 1
+        except Exception as e:
+            logger.debug(f"[WARMUP] {kind} {t} failed: {e}")
+        budget -= 1
+        time.sleep(WARMUP_SLEEP_SEC)
+
+    logger.info(f"[WARMUP] Cache warm-up done in {time.time() - started:.1f}s: {stats}")
+    return stats
@@ -4,6 +4,7 @@ Background task to automatically save NAV snapshot after market close (15h)
 """
 from datetime import datetime, date, timedelta
 from decimal import Decimal
+from typing import Optional
 from sqlalchemy.orm import Session
 from core.db import SessionLocal
 from core.logger import logger
@@ -12,6 +13,7 @@ import requests
 import os
 
 
+from services import nav_reconstruction, risk_service
 from services.portfolio_service import calculate_portfolio
 
 
@@ -50,38 +52,30 @@ def save_daily_nav_snapshot():
                 logger.info(f"Created NAV snapshot for {today}: {current_nav:,.2f}")
             
             db.commit()
+
+            # Risk stats since inception: advance by one day instead of a full pass
+            risk_service.on_new_snapshot(db, today, float(current_nav))
             
     except Exception as e:
         logger.error(f"Failed to save daily NAV snapshot: {e}")
 
 
-def backfill_missing_nav_snapshots(days_back: int = 7):
+def backfill_missing_nav_snapshots(days_back: Optional[int] = None) -> int:
     """
-    Backfill missing NAV snapshots for the last N days.
-    This ensures we have continuous data for chart display.
+    Backfill missing NAV snapshots by replaying the transaction ledger against historical prices.
+    days_back=None covers the whole history (first transaction/cash flow up to yesterday).
     """
     try:
         with SessionLocal() as db:
-            today = date.today()
-            
-            for i in range(days_back, 0, -1):
-                target_date = today - timedelta(days=i)
-                
-                # Check if snapshot exists
-                existing = db.query(models.DailySnapshot).filter(
-                    models.DailySnapshot.date == target_date
-                ).first()
-                
-                if existing:
-                    continue  # Already have data for this date
-                
-                # Try to calculate NAV for this date
-                # This is a simplified version - you might need more complex logic
-                # to accurately reconstruct historical NAV
-                logger.info(f"Missing NAV snapshot for {target_date}, skipping backfill (requires historical transaction data)")
-                
+            start = date.today() - timedelta(days=days_back) if days_back else None
+            inserted = nav_reconstruction.backfill_missing_nav_snapshots(db, start=start)
+            if inserted:
+                # History changed underneath the running risk accumulator
+                risk_service.rebuild_accumulator(db)
+            return inserted
     except Exception as e:
         logger.error(f"Failed to backfill NAV snapshots: {e}")
+        return 0
 
 
 def should_run_daily_snapshot() -> bool:
@@ -0,0 +1,28 @@
+"""
+tasks/intraday_nav.py
+Per-minute intraday NAV poller (scheduled during trading sessions).
+"""
+from core.db import SessionLocal
+from core.logger import logger
+from core.redis_client import acquire_lock, get_redis
+from core.utils import get_vietnam_time
+from services import intraday_nav
+
+
+def record_intraday_nav():
+    """
+    Appends the current NAV to today's intraday series.
+    With several workers running the scheduler, the first one to take the minute's lock records it.
+    """
+    now = get_vietnam_time()
+    if not intraday_nav.in_session(now):
+        return
+    minute = now.strftime("%H:%M")
+    if get_redis() and not acquire_lock(f"intraday_nav:{now.date()}:{minute}", 55_000):
+        return
+    try:
+        with SessionLocal() as db:
+            nav = intraday_nav.live_nav(db)
+        intraday_nav.append_point(now.date(), minute, nav)
+    except Exception as e:
+        logger.error(f"Failed to record intraday NAV: {e}")
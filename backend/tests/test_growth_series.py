@@ -0,0 +1,34 @@
+import random
+from decimal import Decimal
+
+import numpy as np
+
+from services.performance_service import _growth_pct
+
+
+def _decimal_growth(curr: int, base: int) -> float:
+    """Pre-vectorization formula: Decimal math, then float, then round to 2 places."""
+    return round(float((Decimal(curr) - Decimal(base)) / Decimal(base) * 100), 2)
+
+
+def test_growth_pct_matches_decimal_formula():
+    rng = random.Random(7)
+    base = np.array([rng.randrange(1_000, 200_000, 50) for _ in range(300_000)], dtype=float)
+    curr = np.array([rng.randrange(1_000, 200_000, 50) for _ in range(300_000)], dtype=float)
+
+    # growth_series rounds each float with round(x, 2), as here
+    got = [round(x, 2) for x in _growth_pct(curr, base).tolist()]
+    expected = [_decimal_growth(int(c), int(b)) for c, b in zip(curr, base)]
+
+    mismatches = [(c, b) for c, b, g, e in zip(curr, base, got, expected) if g != e]
+    assert not mismatches, mismatches[:5]
+
+
+def test_growth_pct_known_tie():
+    # (73200 - 64000) / 64000 * 100 rounds to 14.37 in float64; the Decimal baseline gives 14.38
+    assert round(float(_growth_pct(np.array([73_200.0]), np.array([64_000.0]))[0]), 2) == 14.38
+
+
+def test_growth_pct_zero_without_base_or_price():
+    out = _growth_pct(np.array([0.0, 10.0, 10.0]), np.array([10.0, 0.0, 10.0]))
+    assert out.tolist() == [0.0, 0.0, 0.0]
@@ -0,0 +1,119 @@
+from decimal import Decimal
+
+import pytest
+
+import models
+from services import ledger_service
+
+EV = models.LedgerEventType
+
+
+def _seed(db, cash="10000"):
+    db.add(models.AssetSummary(cash_balance=Decimal(cash), total_deposited=Decimal(cash)))
+    db.commit()
+
+
+def _buy(db, ticker, volume, total_cost):
+    """Same writes as trading_service.process_buy_order, without pricing/validation."""
+    volume, total_cost = Decimal(volume), Decimal(total_cost)
+    asset = db.query(models.AssetSummary).first()
+    holding = db.query(models.TickerHolding).filter_by(ticker=ticker).first()
+    if holding:
+        new_vol = holding.total_volume + volume
+        holding.average_price = (holding.total_volume * holding.average_price + total_cost) / new_vol
+        holding.total_volume = holding.available_volume = new_vol
+    else:
+        db.add(models.TickerHolding(
+            ticker=ticker, total_volume=volume, available_volume=volume, average_price=total_cost / volume,
+        ))
+    asset.cash_balance -= total_cost
+    cash_log = models.CashFlow(type=models.CashFlowType.WITHDRAW, amount=total_cost, description=f"Buy {int(volume):,} {ticker}")
+    tx = models.StockTransaction(ticker=ticker, type=models.TransactionType.BUY, volume=volume, price=total_cost / volume, total_value=total_cost)
+    db.add_all([cash_log, tx])
+    ev = ledger_service.record(
+        db, EV.BUY, cash_delta=-total_cost, ticker=ticker, volume_delta=volume, cost_delta=total_cost,
+        stock_transaction=tx, cash_flow=cash_log,
+    )
+    db.commit()
+    return ev
+
+
+def _assert_replay_matches_read_models(db):
+    state = ledger_service.replay(db)
+    asset = db.query(models.AssetSummary).first()
+    assert state.cash_balance == pytest.approx(Decimal(asset.cash_balance))
+    held = {h.ticker: h for h in db.query(models.TickerHolding).filter(models.TickerHolding.total_volume > 0)}
+    assert set(state.holdings) == set(held)
+    for t, h in held.items():
+        assert state.holdings[t][0] == pytest.approx(Decimal(h.total_volume))
+        assert state.average_price(t) == pytest.approx(Decimal(h.average_price))
+
+
+def test_replay_folds_buys_from_bootstrap(db):
+    _seed(db)
+    assert ledger_service.ensure_bootstrap(db)
+    _buy(db, "FPT", "100", "1000")
+    _buy(db, "FPT", "100", "2000")
+
+    state = ledger_service.replay(db)
+    assert state.cash_balance == Decimal("7000")
+    assert state.average_price("FPT") == Decimal("15")
+    _assert_replay_matches_read_models(db)
+
+
+def test_sell_uses_recorded_cost_basis(db):
+    _seed(db)
+    ledger_service.ensure_bootstrap(db)
+    _buy(db, "FPT", "100", "1000")
+    _buy(db, "FPT", "100", "2000")
+    # FIFO sell of 100: basis is the first lot (1000), not the 1500 running average
+    ledger_service.record(db, EV.SELL, cash_delta=Decimal("2000"), ticker="FPT",
+                          volume_delta=Decimal("-100"), cost_delta=Decimal("-1000"))
+    db.commit()
+
+    state = ledger_service.replay(db)
+    assert state.holdings["FPT"][0] == Decimal("100")
+    assert state.average_price("FPT") == Decimal("20")
+
+
+def test_reverse_event_rebuilds_cash_and_holding(db):
+    _seed(db)
+    ledger_service.ensure_bootstrap(db)
+    _buy(db, "FPT", "100", "1000")
+    last = _buy(db, "HPG", "50", "1500")
+
+    state = ledger_service.reverse_event(db, last, description="undo")
+    db.commit()
+
+    assert state.cash_balance == Decimal("9000")
+    assert "HPG" not in state.holdings
+    assert db.query(models.TickerHolding).filter_by(ticker="HPG").first() is None
+    assert ledger_service.last_open_event(db, EV.BUY).id != last.id
+    _assert_replay_matches_read_models(db)
+
+    # State before the reversed event is still reachable for audit
+    assert ledger_service.replay(db, upto_event_id=last.id - 1).cash_balance == Decimal("9000")
+
+
+def test_legacy_undo_keeps_ledger_consistent(db):
+    from services import trading_service
+
+    # A buy made before the ledger existed: only read models + rows, folded into the bootstrap
+    _seed(db, "9000")
+    db.add(models.TickerHolding(ticker="FPT", total_volume=100, available_volume=100, average_price=10))
+    db.add(models.StockTransaction(ticker="FPT", type=models.TransactionType.BUY, volume=100, price=10, total_value=1000))
+    db.add(models.CashFlow(type=models.CashFlowType.WITHDRAW, amount=1000, description="Buy 100 FPT"))
+    db.commit()
+    ledger_service.ensure_bootstrap(db)
+
+    trading_service.undo_last_buy_order(db)
+    assert Decimal(db.query(models.AssetSummary).first().cash_balance) == Decimal("10000")
+    _assert_replay_matches_read_models(db)
+
+    # The next ledger undo replays from the bootstrap: the legacy buy must not come back
+    ev = _buy(db, "HPG", "10", "500")
+    ledger_service.reverse_event(db, ev)
+    db.commit()
+    assert Decimal(db.query(models.AssetSummary).first().cash_balance) == Decimal("10000")
+    assert db.query(models.TickerHolding).filter_by(ticker="FPT").first() is None
+    _assert_replay_matches_read_models(db)
@@ -0,0 +1,137 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import models
+from core.exceptions import ValidationError
+from services import lot_engine
+
+BUY, SELL = models.TransactionType.BUY, models.TransactionType.SELL
+
+
+@pytest.fixture(autouse=True)
+def _fresh_lot_cache():
+    lot_engine.invalidate()
+    yield
+    lot_engine.invalidate()
+
+
+def _row(id, type, volume, total_value, day, ticker="FPT", lot_id=None):
+    return SimpleNamespace(
+        id=id, ticker=ticker, type=type, volume=volume, total_value=total_value,
+        transaction_date=datetime(2025, 1, day), lot_id=lot_id,
+    )
+
+
+def _add(db, *rows):
+    for r in rows:
+        db.add(models.StockTransaction(**vars(r)))
+    db.commit()
+
+
+def test_replay_fifo_and_average_views():
+    # buy 100 @ 10, buy 100 @ 20, sell 100 @ 20 (proceeds 2000)
+    book = lot_engine.replay([
+        _row(1, BUY, 100, 1_000, 2),
+        _row(2, BUY, 100, 2_000, 3),
+        _row(3, SELL, 100, 2_000, 4),
+    ])
+    lots = book["FPT"]
+    assert lots.realized_fifo == pytest.approx(1_000)
+    assert lots.realized_avg == pytest.approx(500)
+    assert lots.open_volume == pytest.approx(100)
+
+    d = lots.to_dict(as_of=datetime(2025, 1, 10).date())
+    assert [lot["lot_id"] for lot in d["lots"]] == [2]
+    assert d["fifo"]["unit_cost"] == pytest.approx(20)
+    assert d["average_cost"]["unit_cost"] == pytest.approx(15)
+    assert d["lots"][0]["holding_days"] == 7
+
+
+def test_replay_specific_lot_then_fifo_remainder():
+    book = lot_engine.replay([
+        _row(1, BUY, 100, 1_000, 2),
+        _row(2, BUY, 100, 2_000, 3),
+        _row(3, SELL, 150, 3_000, 4, lot_id=2),  # lot 2 fully, then 50 from lot 1
+    ])
+    lots = book["FPT"]
+    assert lots.realized_fifo == pytest.approx(3_000 - (2_000 + 500))
+    s = lots.open_slice()
+    assert dict(zip(lots.lot_ids[s].tolist(), lots.remaining[s].tolist())) == {1: 50.0, 2: 0.0}
+
+
+def test_replay_counts_unmatched_sell_volume():
+    lots = lot_engine.replay([_row(1, BUY, 100, 1_000, 2), _row(2, SELL, 130, 1_300, 3)])["FPT"]
+    assert lots.unmatched_volume == pytest.approx(30)
+
+
+def test_plan_sell_fifo_does_not_mutate(db):
+    _add(db, _row(1, BUY, 100, 1_000, 2), _row(2, BUY, 100, 2_000, 3))
+
+    basis, lot_id = lot_engine.plan_sell(db, "FPT", 150, lot_engine.LOT_METHOD_FIFO)
+    assert basis == pytest.approx(1_000 + 1_000)
+    assert lot_id is None
+    # Planning twice gives the same answer: the cached lots were not consumed
+    assert lot_engine.plan_sell(db, "FPT", 150, lot_engine.LOT_METHOD_FIFO)[0] == pytest.approx(basis)
+    assert lot_engine.unit_cost_after_sell(db, "FPT", 150) == pytest.approx(20)
+
+
+def test_plan_sell_specific_and_average(db):
+    _add(db, _row(1, BUY, 100, 1_000, 2), _row(2, BUY, 100, 2_000, 3))
+
+    basis, lot_id = lot_engine.plan_sell(db, "FPT", 40, lot_engine.LOT_METHOD_SPECIFIC, lot_id=2)
+    assert (basis, lot_id) == (pytest.approx(800), 2)
+    assert lot_engine.unit_cost_after_sell(db, "FPT", 40, lot_id=2) == pytest.approx(2_200 / 160)
+
+    basis, lot_id = lot_engine.plan_sell(db, "FPT", 40, lot_engine.LOT_METHOD_AVG)
+    assert (basis, lot_id) == (pytest.approx(600), None)
+
+
+def test_plan_sell_rejects_bad_lots(db):
+    _add(db, _row(1, BUY, 100, 1_000, 2))
+
+    with pytest.raises(ValidationError):
+        lot_engine.plan_sell(db, "FPT", 10, lot_engine.LOT_METHOD_SPECIFIC)
+    with pytest.raises(ValidationError):
+        lot_engine.plan_sell(db, "FPT", 10, lot_engine.LOT_METHOD_SPECIFIC, lot_id=99)
+    with pytest.raises(ValidationError):
+        lot_engine.plan_sell(db, "FPT", 101, lot_engine.LOT_METHOD_SPECIFIC, lot_id=1)
+    with pytest.raises(ValidationError):
+        lot_engine.plan_sell(db, "FPT", 101, lot_engine.LOT_METHOD_FIFO)
+
+
+def test_default_method_falls_back_to_average_without_buy_rows(db):
+    _add(db, _row(1, BUY, 100, 1_000, 2))
+    assert lot_engine.default_method(db, "FPT", 100) == lot_engine.LOT_METHOD_FIFO
+    # 1000 shares predate their BUY rows: the lots cover a sale of 100 but not the holding
+    assert lot_engine.default_method(db, "FPT", 1_100) == lot_engine.LOT_METHOD_AVG
+
+
+def test_lot_sell_keeps_cost_of_shares_without_buy_rows(db):
+    from decimal import Decimal
+
+    import schemas
+    from services import trading_service
+
+    # 1000 legacy FPT @ 10 plus one BUY lot of 100 @ 20
+    db.add(models.AssetSummary(cash_balance=Decimal(0), total_deposited=Decimal(0)))
+    db.add(models.TickerHolding(ticker="FPT", total_volume=1_100, available_volume=1_100, average_price=Decimal(12_000) / 1_100))
+    _add(db, _row(1, BUY, 100, 2_000, 2))
+
+    trading_service.process_sell_order(db, schemas.SellStockRequest(ticker="FPT", volume=100, price=30))
+    holding = db.query(models.TickerHolding).filter_by(ticker="FPT").first()
+    assert float(holding.total_volume) == 1_000
+    assert float(holding.average_price) == pytest.approx(12_000 / 1_100, abs=1e-3)
+
+    # Explicit FIFO on a mixed holding takes the lot's cost out of the book cost
+    lot_engine.invalidate()
+    _add(db, _row(3, BUY, 100, 2_000, 5))
+    holding.total_volume += 100
+    holding.available_volume = holding.total_volume
+    holding.average_price = Decimal(13_000) / 1_100
+    db.commit()
+    trading_service.process_sell_order(db, schemas.SellStockRequest(ticker="FPT", volume=100, price=30, lot_method="FIFO"))
+    db.refresh(holding)
+    assert float(holding.total_volume) == 1_000
+    assert float(holding.average_price) == pytest.approx((13_000 - 2_000) / 1_000, abs=1e-3)
@@ -0,0 +1,90 @@
+import math
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+import models
+from services.performance_service import NAV_HISTORY_DEFAULT_LIMIT, NAV_HISTORY_RANGE_LIMIT, nav_history
+
+DAYS = NAV_HISTORY_RANGE_LIMIT + 130
+
+
+def _seed(db):
+    """One snapshot per day (NAV grows 0.1%/day) and a deposit every 50 days."""
+    start = date(2022, 1, 1)
+    navs, flows = {}, {}
+    nav = 1_000_000.0
+    for i in range(DAYS):
+        d = start + timedelta(days=i)
+        if i % 50 == 0:
+            flows[d] = 100_000.0
+            nav += flows[d]
+            db.add(models.CashFlow(type=models.CashFlowType.DEPOSIT, amount=Decimal("100000"),
+                                   description="Deposit", created_at=datetime.combine(d, datetime.min.time()) + timedelta(hours=10)))
+        nav = round(nav * 1.001, 4)
+        navs[d] = nav
+        db.add(models.DailySnapshot(date=d, total_nav=Decimal(str(nav))))
+    db.commit()
+    return start, navs, flows
+
+
+def _expected_summary(navs, flows, start_date):
+    days = sorted(d for d in navs if d >= start_date)
+    prev_day = start_date - timedelta(days=1)
+    start_nav = navs.get(prev_day, 0.0)
+    growth, prev = 1.0, start_nav
+    for d in days:
+        f = flows.get(d, 0.0)
+        denom = prev + max(f, 0.0)
+        growth *= 1 + ((navs[d] - prev - f) / denom if denom > 0 else 0.0)
+        prev = navs[d]
+    flow = sum(v for d, v in flows.items() if d >= start_date)
+    end_nav = navs[days[-1]]
+    return {
+        "start_nav": start_nav,
+        "end_nav": end_nav,
+        "net_flow": flow,
+        "total_profit": end_nav - start_nav - flow,
+        "total_performance_pct": (growth - 1) * 100,
+    }
+
+
+def test_range_longer_than_one_page_is_summarized_whole(pg_db):
+    start, navs, flows = _seed(pg_db)
+    range_start = start + timedelta(days=10)
+    expected = _expected_summary(navs, flows, range_start)
+
+    first = nav_history(pg_db, start_date=range_start)
+    assert len(first["history"]) == NAV_HISTORY_RANGE_LIMIT
+    assert first["next_cursor"]
+
+    second = nav_history(pg_db, start_date=range_start, cursor=first["next_cursor"])
+    assert len(first["history"]) + len(second["history"]) == DAYS - 10
+    assert second["next_cursor"] is None
+    assert second["history"][0]["date"] < first["history"][-1]["date"]
+
+    for page in (first, second):
+        for key, value in expected.items():
+            assert page["summary"][key] == pytest.approx(value, rel=1e-9, abs=1e-6), key
+
+
+def test_genesis_range_starts_from_zero(pg_db):
+    start, navs, flows = _seed(pg_db)
+    summary = nav_history(pg_db, start_date=start)["summary"]
+    assert summary["start_nav"] == 0
+    assert summary["net_flow"] == pytest.approx(sum(flows.values()))
+    assert math.isfinite(summary["total_performance_pct"])
+
+
+def test_page_boundary_rows_keep_their_return(pg_db):
+    start, navs, flows = _seed(pg_db)
+    first = nav_history(pg_db)
+    second = nav_history(pg_db, cursor=first["next_cursor"])
+    assert len(first["history"]) == NAV_HISTORY_DEFAULT_LIMIT
+
+    for row in (first["history"][-1], second["history"][-1]):
+        d = date.fromisoformat(row["date"])
+        prev, f = navs[d - timedelta(days=1)], flows.get(d, 0.0)
+        assert row["pct"] == pytest.approx((navs[d] - prev - f) / (prev + max(f, 0.0)) * 100, rel=1e-6)
+        assert row["pct"] != 0
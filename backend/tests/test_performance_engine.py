@@ -0,0 +1,97 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from services.performance_engine import chain_link, compute_performance, horizon_anchors, xirr_many
+
+
+def _npv(rate: float, flows) -> float:
+    return sum(a / (1.0 + rate) ** t for a, t in flows)
+
+
+def _xirr_reference(flows) -> float:
+    """Plain scalar bisection, independent of the vectorized solver."""
+    lo, hi = -0.99, 10.0
+    for _ in range(300):
+        mid = (lo + hi) / 2
+        if (_npv(mid, flows) > 0) == (_npv(lo, flows) > 0):
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2
+
+
+def _matrix(problems):
+    width = max(len(p) for p in problems)
+    amounts = np.zeros((len(problems), width))
+    years = np.zeros((len(problems), width))
+    for i, p in enumerate(problems):
+        for j, (a, t) in enumerate(p):
+            amounts[i, j], years[i, j] = a, t
+    return amounts, years
+
+
+def test_chain_link_uses_ssi_sub_period_returns():
+    navs = np.array([100.0, 110.0, 220.0])
+    flows = np.array([0.0, 0.0, 100.0])
+    g = chain_link(navs, flows)
+    # r1 = 10 / 100, r2 = (220 - 110 - 100) / (110 + 100)
+    assert g == pytest.approx([1.0, 1.1, 1.1 * (1 + 10 / 210)])
+
+
+def test_chain_link_virtual_zero_start():
+    # First sub-period from NAV 0: the deposit is the denominator
+    g = chain_link(np.array([0.0, 105.0]), np.array([0.0, 100.0]))
+    assert g[-1] == pytest.approx(1.05)
+
+
+def test_xirr_single_period():
+    amounts, years = _matrix([[(-100.0, 0.0), (110.0, 1.0)]])
+    assert xirr_many(amounts, years)[0] == pytest.approx(0.10, abs=1e-9)
+
+
+def test_xirr_many_matches_scalar_reference_on_padded_rows():
+    problems = [
+        [(-1000.0, 0.0), (-500.0, 0.5), (1700.0, 1.0)],
+        [(-100.0, 0.0), (130.0, 2.0)],
+        [(-5000.0, 0.0), (1000.0, 0.25), (-2000.0, 0.6), (6500.0, 1.5)],
+        [(-100.0, 0.0), (60.0, 1.0)],  # loss
+    ]
+    amounts, years = _matrix(problems)
+    got = xirr_many(amounts, years)
+    for i, p in enumerate(problems):
+        assert got[i] == pytest.approx(_xirr_reference(p), abs=1e-7)
+        assert _npv(got[i], p) == pytest.approx(0.0, abs=1e-6 * sum(abs(a) for a, _ in p))
+
+
+def test_xirr_without_sign_change_is_nan():
+    amounts, years = _matrix([[(100.0, 0.0), (50.0, 1.0)], [(-100.0, 0.0), (110.0, 1.0)]])
+    got = xirr_many(amounts, years)
+    assert np.isnan(got[0])
+    assert got[1] == pytest.approx(0.10)
+
+
+def test_horizon_anchors_ytd_and_inception():
+    anchors = dict(horizon_anchors(date(2025, 3, 15)))
+    assert anchors["ytd"] == date(2025, 1, 1)
+    assert anchors["inception"] is None
+    assert anchors["1w"] == date(2025, 3, 8)
+
+
+def test_compute_performance_on_new_year_day(db):
+    from datetime import datetime
+
+    import models
+    from services import cashflow_ledger
+
+    cashflow_ledger.invalidate()
+    db.add(models.CashFlow(type=models.CashFlowType.DEPOSIT, amount=100, description="Deposit", created_at=datetime(2025, 12, 1)))
+    db.add(models.DailySnapshot(date=date(2025, 12, 31), total_nav=100))
+    db.commit()
+
+    # ytd anchor == today: a zero-length span, not a division by zero
+    perf = compute_performance(db, 102.0, today=date(2026, 1, 1))
+    assert perf["ytd"] == {"val": 0.0, "pct": 0.0, "mwr": None, "start_date": "2026-01-01"}
+    assert perf["1d"]["pct"] == pytest.approx(2.0)
+    cashflow_ledger.invalidate()
@@ -0,0 +1,73 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from services import risk_service
+from services.risk_service import RiskAccumulator, _column_stats, _drawdown, _nav_returns, _price_returns
+
+
+def test_drawdown_depth_and_duration():
+    # wealth: 1, 1.1, 0.99, 0.891, 1.1583, 1.04247
+    r = np.array([[0.10], [-0.10], [-0.10], [0.30], [-0.10]])
+    dd = _drawdown(r)
+    assert dd["max_drawdown"][0] == pytest.approx(0.891 / 1.1 - 1.0)
+    assert dd["max_drawdown_days"][0] == 2
+    assert dd["current_drawdown"][0] == pytest.approx(-0.10)
+    assert dd["current_drawdown_days"][0] == 1
+
+
+def test_drawdown_treats_gaps_as_flat():
+    dd = _drawdown(np.array([[0.05, np.nan], [np.nan, 0.02]]))
+    assert dd["max_drawdown"].tolist() == [0.0, 0.0]
+
+
+def _fixture(n=120, seed=3):
+    rng = np.random.default_rng(seed)
+    navs = 1_000_000 * np.cumprod(1.0 + rng.normal(0.0005, 0.012, n))
+    bench = 1_200 * np.cumprod(1.0 + rng.normal(0.0003, 0.009, n))
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(n)]
+    return days, navs, bench
+
+
+def test_accumulator_matches_window_computation():
+    days, navs, bench = _fixture()
+
+    acc = RiskAccumulator()
+    for d, nav, px in zip(days, navs, bench):
+        acc.push(d, float(nav), 0.0, {"VNINDEX": float(px)})
+    inc = acc.summary()
+
+    r = _nav_returns(navs, np.zeros(len(navs)))
+    win = _column_stats(r[:, None], {"VNINDEX": _price_returns(bench[:, None])[:, 0]})
+
+    assert inc["observations"] == int(win["observations"][0])
+    for key in ("volatility", "sharpe", "sortino", "max_drawdown", "current_drawdown", "beta_vnindex", "corr_vnindex"):
+        assert inc[key] == pytest.approx(float(win[key][0]), rel=1e-4, abs=1e-6), key
+    assert inc["max_drawdown_days"] == int(win["max_drawdown_days"][0])
+    assert inc["current_drawdown_days"] == int(win["current_drawdown_days"][0])
+
+
+def test_accumulator_flow_adjusted_return():
+    acc = RiskAccumulator()
+    acc.push(date(2024, 1, 1), 100.0, 0.0, {})
+    acc.push(date(2024, 1, 2), 215.0, 100.0, {})  # deposit 100, gain 15 on 200
+    assert acc.s1 == pytest.approx(15 / 200)
+
+
+def test_load_accumulator_does_not_mutate_cached_entry(monkeypatch):
+    stored = {
+        **vars(RiskAccumulator(last_date="2024-01-01", last_nav=100.0,
+                               bench={"VNINDEX": {"last": 1000.0, "n": 0, "sb": 0.0, "sbb": 0.0, "srb": 0.0, "sr": 0.0, "srr": 0.0}})),
+        "first_date": "2023-06-01",
+    }
+    # L1 hands back the very object it stores
+    monkeypatch.setattr(risk_service, "cache_get", lambda key: stored)
+
+    acc, first = risk_service._load_accumulator()
+    acc.push(date(2024, 1, 2), 110.0, 0.0, {"VNINDEX": 1010.0})
+
+    assert first == "2023-06-01"
+    assert risk_service._load_accumulator()[1] == "2023-06-01"
+    assert stored["bench"]["VNINDEX"]["last"] == 1000.0
+    assert stored["last_nav"] == 100.0
@@ -5,6 +5,23 @@ import { toast } from 'sonner';
 // 1. Cấu hình địa chỉ Backend
 const API_URL = 'http://localhost:8000';
 
+// Read-your-writes: trong vài giây sau lệnh ghi (mua/bán/nạp/rút...), các lệnh đọc gửi
+// X-Read-Primary để backend đọc thẳng primary thay vì replica có thể còn trễ
+const READ_PRIMARY_WINDOW_MS = 5000;
+let lastWriteAt = 0;
+
+axios.interceptors.request.use((config) => {
+    const method = (config.method || 'get').toLowerCase();
+    if (method === 'get') {
+        if (Date.now() - lastWriteAt < READ_PRIMARY_WINDOW_MS) {
+            config.headers = { ...(config.headers || {}), 'X-Read-Primary': '1' };
+        }
+    } else {
+        lastWriteAt = Date.now();
+    }
+    return config;
+});
+
 // 2. Cấu hình Interceptor (Người gác cổng)
 axios.interceptors.response.use(
     (response) => {
@@ -120,12 +137,14 @@ export const getHistoricalData = async (ticker, period = '1m') => {
     }
 };
 
-export const getNavHistory = async (startDate = null, endDate = null, limit = 30) => {
+export const getNavHistory = async (startDate = null, endDate = null, limit = null, cursor = null) => {
+    // limit/cursor null = mặc định của backend; trang tiếp theo: truyền next_cursor của response trước
     return axios.get(`${API_URL}/nav-history`, {
         params: {
             start_date: startDate,
             end_date: endDate,
-            limit
+            limit,
+            cursor
         }
     });
 };